@@ -4,21 +4,30 @@ require("nonebot_plugin_apscheduler")
 require("nonebot_plugin_localstore")
 require("nonebot_plugin_saa")
 
+from nonebot.drivers import URL, ASGIMixin, HTTPServerSetup
 from nonebot.plugin import PluginMetadata, inherit_supported_adapters
 
-from nonebot_plugin_bh3_elysian_realm.utils import on_startup
+from nonebot_plugin_bh3_elysian_realm.utils import on_startup, on_shutdown
+from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import metrics_endpoint
 
 from .config import plugin_config
 from . import plugins  # noqa: F401
 
 driver = get_driver()
 
+if plugin_config.metrics_path and isinstance(driver, ASGIMixin):
+    # 以 Prometheus 文本格式暴露运行指标
+    driver.setup_http_server(
+        HTTPServerSetup(URL(plugin_config.metrics_path), "GET", "elysian_realm_metrics", metrics_endpoint)
+    )
+
 __plugin_meta__ = PluginMetadata(
     name="乐土攻略",
     description="崩坏3乐土攻略",
     type="application",
     usage="""
-    [乐土XX] 指定角色乐土攻略
+    [乐土XX] 指定角色乐土攻略，多个角色以空格分隔
+    [乐土列表] 全部角色与昵称总览图
     [乐土更新] 更新乐土攻略图片资源
     [添加乐土昵称] 添加乐土角色昵称
     """.strip(),
@@ -35,3 +44,9 @@ async def _():
     if plugin_config.log_level == "DEBUG":
         return
     await on_startup()
+
+
+@driver.on_shutdown
+async def _():
+    """关闭前保存数据"""
+    await on_shutdown()
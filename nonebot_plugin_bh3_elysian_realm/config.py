@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import List, Literal, Optional
 
 from nonebot import get_plugin_config
 from pydantic import Extra, BaseSettings
@@ -9,9 +9,59 @@ class Config(BaseSettings, extra=Extra.ignore):
     nickname_path: Path = Path(__file__).parent / "resources" / "nickname.json"
     image_path: Path = Path(__file__).parent / "resources" / "images"
     image_repository: str = "https://github.com/MskTmi/ElysianRealm-Data"
+    # 叠加在 image_repository 之上的图片仓库，靠前的优先，同名角色使用优先级最高的来源
+    extra_image_repositories: List[str] = []
+    update_concurrency: int = 2
+    resource_fetch_mode: Literal["git", "archive"] = "git"
+    archive_url: Optional[str] = None
     resource_validation_time: int = 60 * 60 * 24
+    resource_retry_time: int = 60
+    # 监视 nickname.json 与图片目录，连续变化在 debounce 秒内合并处理；没有 watchfiles 时按 poll_interval 秒轮询
+    resource_watch: bool = True
+    resource_watch_debounce: float = 1
+    resource_watch_poll_interval: float = 5
     proxies: Optional[str] = None
+    git_timeout: int = 600
+    # 多个进程共享图片目录时，更新租约的有效期，持有者每 1/3 有效期续期一次
+    update_lease_ttl: float = 30
     log_level: str = "INFO"
+    fuzzy_match_limit: int = 3
+    # 一条指令最多查询的角色数，多个角色以空格分隔
+    batch_query_limit: int = 5
+    nickname_save_delay: float = 1
+    # sqlite 时昵称保存在 localstore 数据目录的 SQLite 库中，首次启动从 nickname_path 导入，修改后导出回 nickname_path
+    nickname_store: Literal["json", "sqlite"] = "json"
+    image_cache_size: int = 32 * 1024 * 1024
+    image_variant: Literal["original", "jpeg", "webp"] = "original"
+    image_variant_max_width: int = 1080
+    image_variant_quality: int = 80
+    # 角色总览图每行的缩略图数量、缩略图宽度与标题字体，字体为空时尝试常见中文字体
+    overview_columns: int = 8
+    overview_tile_width: int = 160
+    overview_font: Optional[str] = None
+    # packed 时将图片打包为单个文件并通过 mmap 读取
+    image_store: Literal["files", "packed"] = "files"
+    # 角色总览图的结果在该秒数内直接复用，角色图片只合并并发读取，内容由 image_cache_size 限制的缓存保留
+    reply_cache_ttl: float = 10
+    # 令牌桶限流：每秒补充的次数与最多积累的次数，补充速度为 0 时不限流
+    rate_limit_user: float = 0.5
+    rate_limit_user_burst: int = 5
+    rate_limit_group: float = 2
+    rate_limit_group_burst: int = 10
+    # 被限流时的回复，为空时直接丢弃
+    rate_limit_message: str = ""
+    query_dedup_window: float = 3
+    image_send_concurrency: int = 8
+    # 向超级用户发送通知的最大并发数
+    notify_concurrency: int = 4
+    # 支持上传文件的适配器（如 OneBot V12）复用已上传图片的引用，引用在该秒数后重新上传，为 0 时每次发送完整图片
+    upload_cache_ttl: float = 60 * 60 * 24
+    metrics_path: Optional[str] = "/elysian_realm/metrics"
+    # 按该比例追踪事件处理的各阶段耗时；被追踪的请求超过 slow_query_threshold 秒时输出慢查询日志，为 0 时不输出
+    trace_sample_rate: float = 1
+    slow_query_threshold: float = 3
+    # 将追踪以 OTLP JSON 格式逐行追加到该文件
+    trace_export_path: Optional[Path] = None
 
 
 plugin_config = get_plugin_config(Config)
@@ -1,48 +1,212 @@
-from pathlib import Path
+import asyncio
+from typing import List, NoReturn, Optional
 
 import nonebot_plugin_saa as saa
-from nonebot.typing import T_State
 from nonebot.matcher import Matcher
-from nonebot.adapters import Message
 from nonebot.params import CommandArg
 from nonebot import logger, on_command
 from nonebot.permission import SUPERUSER
+from nonebot.message import run_postprocessor
+from nonebot.adapters import Bot, Event, Message
 from nonebot.internal.params import ArgPlainText
 
 from nonebot_plugin_bh3_elysian_realm.config import plugin_config
-from nonebot_plugin_bh3_elysian_realm.utils.file_utils import string_to_list, find_key_by_value
-from nonebot_plugin_bh3_elysian_realm.utils import git_pull, load_json, save_json, identify_empty_value_keys
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import string_to_list
+from nonebot_plugin_bh3_elysian_realm.utils.upload_utils import upload_cache
+from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import admit_query, image_send_limit
+from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import MatchResult, NicknameIndex
+from nonebot_plugin_bh3_elysian_realm.utils.image_utils import role_image_digest, prepare_role_image
+from nonebot_plugin_bh3_elysian_realm.utils.trace_utils import span, annotate, finish_trace, trace_handler
+from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import (
+    send_seconds,
+    queries_total,
+    lookup_seconds,
+    image_load_seconds,
+    instrument_handler,
+)
+from nonebot_plugin_bh3_elysian_realm.utils import (
+    source_index,
+    nickname_index,
+    resources_state,
+    prepare_overview,
+    update_resources,
+    identify_empty_value_keys,
+)
 
 elysian_realm = on_command("乐土攻略", aliases={"乐土", "乐土攻略"}, priority=7)
 update_elysian_realm = on_command("乐土更新", aliases={"乐土更新"}, priority=7, permission=SUPERUSER)
 add_nickname = on_command("添加乐土昵称", aliases={"添加乐土昵称"}, priority=7, permission=SUPERUSER)
+role_overview = on_command("乐土列表", aliases={"乐土角色列表"}, priority=7)
+
+
+@run_postprocessor
+async def _finish_trace(matcher: Matcher, exception: Optional[Exception]):
+    await finish_trace(matcher.state, exception)
 
 
 @elysian_realm.handle()
-async def handle_first_receive(matcher: Matcher, args: Message = CommandArg()):
-    if args.extract_plain_text():
+@trace_handler("elysian_realm", "parse")
+async def handle_first_receive(bot: Bot, event: Event, matcher: Matcher, args: Message = CommandArg()):
+    query = args.extract_plain_text().strip()
+    annotate(adapter=bot.adapter.get_name(), query=query)
+    group_id = getattr(event, "group_id", None) or getattr(event, "channel_id", None)
+    reason = admit_query(
+        bot.adapter.get_name(), event.get_user_id(), None if group_id is None else str(group_id), query
+    )
+    if reason is not None:
+        queries_total.inc(result=reason)
+        annotate(result=reason)
+        logger.debug(f"查询未处理（{reason}）: {query}")
+        # 被限流时按配置回复，重复的查询直接丢弃
+        await matcher.finish((reason == "rate_limited" and plugin_config.rate_limit_message) or None)
+    if query:
         matcher.set_arg("role", args)
 
 
 @elysian_realm.got("role", prompt="请指定角色")
-async def got_introduction(role: str = ArgPlainText()):
-    nickname = await find_key_by_value(await load_json(plugin_config.nickname_path), role)
+@instrument_handler("elysian_realm")
+@trace_handler("elysian_realm", "got_introduction")
+async def got_introduction(bot: Bot, role: str = ArgPlainText()):
+    annotate(query=role)
+    with lookup_seconds.time():
+        with span("load_index"):
+            index = await nickname_index.get(plugin_config.nickname_path)
+        with span("resolve"):
+            result = index.match(role, plugin_config.fuzzy_match_limit)
+            roles = batch_roles(index, role, result)
+    if roles is not None:
+        await answer_batch(bot, roles, len(role.split()))
+    nickname = result.role
+    annotate(role=nickname or "")
     if nickname is None:
+        if result.suggestions:
+            queries_total.inc(result="suggest")
+            await elysian_realm.finish(f"未找到指定角色: {role}\n你是不是要找: {'、'.join(result.suggestions)}")
+        queries_total.inc(result="miss")
         await elysian_realm.finish(f"未找到指定角色: {role}")
     else:
-        msg_builder = saa.Image(Path(plugin_config.image_path / f"{nickname}.jpg"))
-        await msg_builder.finish()
+        try:
+            with image_load_seconds.time(), span("read_image"):
+                image_path = source_index.resolve(nickname) or plugin_config.image_path
+                image = await prepare_role_image(image_path, nickname)
+        except FileNotFoundError:
+            if resources_state.loading:
+                queries_total.inc(result="loading")
+                await elysian_realm.finish("乐土攻略资源加载中，请稍后再试")
+            queries_total.inc(result="missing_image")
+            logger.error(f"角色 {nickname} 的攻略图片不存在")
+            await elysian_realm.finish(f"未找到角色攻略图片: {nickname}")
+        queries_total.inc(result="hit")
+        async with image_send_limit:
+            with send_seconds.time(matcher="elysian_realm"), span("send"):
+                if plugin_config.upload_cache_ttl > 0 and upload_cache.supports(bot):
+                    digest = await role_image_digest(image_path, nickname)
+                    await upload_cache.send(bot, elysian_realm, image, f"{nickname}.jpg", digest)
+                    await elysian_realm.finish()
+                await saa.Image(image).finish()
+
+
+def batch_roles(index: NicknameIndex, role: str, result: MatchResult) -> Optional[List[str]]:
+    """
+    判断以空格分隔的查询是否为多个角色。
+
+    整句是已有昵称（昵称本身可以包含空格）时按单个角色查询；每段都是已有昵称时按多个角色查询；
+    否则整句能匹配到角色时按单个角色查询，如 "雷律 平a"；只有整句无法匹配且每段都能单独匹配时才按多个角色查询。
+
+    参数:
+        index (NicknameIndex): 昵称索引。
+        role (str): 用户输入。
+        result (MatchResult): 整句的匹配结果。
+
+    返回:
+        Optional[List[str]]: 去重后的角色列表，按单个角色查询时返回 None。
+    """
+    queries = role.split()
+    if len(queries) < 2 or index.find(role) is not None:
+        return None
+    roles: List[Optional[str]] = [index.find(query) for query in queries]
+    if not all(roles):
+        if result.role is not None:
+            return None
+        matched = index.match_many(queries, plugin_config.fuzzy_match_limit)
+        roles = [matched[query].role for query in queries]
+        if not all(roles):
+            return None
+    return list(dict.fromkeys(role for role in roles if role is not None))
+
+
+async def answer_batch(bot: Bot, roles: List[str], count: int) -> NoReturn:
+    """
+    一次回复多个角色的攻略。
+
+    并发读取图片，支持合并转发的适配器发送一条合并转发消息，其它适配器将全部图片放在同一条消息中发送。
+
+    参数:
+        bot (Bot): 当前 Bot。
+        roles (List[str]): 去重后的角色。
+        count (int): 查询的角色数，超过 batch_query_limit 时拒绝。
+    """
+    if count > plugin_config.batch_query_limit:
+        await elysian_realm.finish(f"一次最多查询 {plugin_config.batch_query_limit} 个角色")
+    notes: List[str] = []
+
+    with image_load_seconds.time(), span("read_image", count=len(roles)):
+        images = await asyncio.gather(
+            *(prepare_role_image(source_index.resolve(role) or plugin_config.image_path, role) for role in roles),
+            return_exceptions=True,
+        )
+    found: List[saa.MessageFactory] = []
+    for role, image in zip(roles, images):
+        if isinstance(image, BaseException):
+            if not isinstance(image, FileNotFoundError):
+                raise image
+            queries_total.inc(result="missing_image")
+            logger.error(f"角色 {role} 的攻略图片不存在")
+            notes.append(f"未找到角色攻略图片: {role}")
+        else:
+            queries_total.inc(result="hit")
+            found.append(saa.MessageFactory(saa.Image(image)))
+
+    if not found:
+        if resources_state.loading:
+            await elysian_realm.finish("乐土攻略资源加载中，请稍后再试")
+        await elysian_realm.finish("\n".join(notes))
+    messages = [saa.MessageFactory(saa.Text("\n".join(notes))), *found] if notes else found
+    async with image_send_limit:
+        with send_seconds.time(matcher="elysian_realm"), span("send"):
+            if len(messages) > 1 and bot.adapter.get_name() in saa.AggregatedMessageFactory.sender:
+                await saa.AggregatedMessageFactory(messages).finish()
+            await saa.MessageFactory([segment for message in messages for segment in message]).finish()
+
+
+@role_overview.handle()
+@instrument_handler("role_overview")
+@trace_handler("role_overview")
+async def handle_role_overview():
+    try:
+        with span("prepare_overview"):
+            image = await prepare_overview()
+    except (OSError, ValueError) as e:
+        logger.error(f"生成角色总览图失败: {e!r}")
+        await role_overview.finish("角色总览图生成失败，请稍后再试")
+    async with image_send_limit:
+        with send_seconds.time(matcher="role_overview"), span("send"):
+            await saa.Image(image).finish()
 
 
 @update_elysian_realm.handle()
+@instrument_handler("update_elysian_realm")
+@trace_handler("update_elysian_realm")
 async def _(matcher: Matcher, args: Message = CommandArg()):
-    await update_elysian_realm.finish("更新成功" if await git_pull(plugin_config.image_path) else "更新失败")
+    await update_elysian_realm.finish("更新成功" if await update_resources() else "更新失败")
 
 
 @add_nickname.handle()
-async def _handle_first_receive(state: T_State):
-    state["nickname_cache"] = await load_json(plugin_config.nickname_path)
-    empty_value_list = await identify_empty_value_keys(state["nickname_cache"])
+@instrument_handler("add_nickname")
+@trace_handler("add_nickname")
+async def _handle_first_receive():
+    index = await nickname_index.get(plugin_config.nickname_path)
+    empty_value_list = await identify_empty_value_keys(index.roles)
     if empty_value_list:
         logger.debug("nickname.json存在没有昵称的图片")
         msg_builder = saa.Text(f"nickname.json空值列表: {empty_value_list}\n以上为没有昵称的图片文件名")
@@ -54,21 +218,20 @@ async def _handle_first_receive(state: T_State):
 
 @add_nickname.got("filename", prompt="图片文件名")
 @add_nickname.got("nickname", prompt="昵称")
-async def _(state: T_State, filename: str = ArgPlainText("filename"), nickname: str = ArgPlainText("nickname")):
+@instrument_handler("add_nickname")
+@trace_handler("add_nickname", "edit")
+async def _(filename: str = ArgPlainText("filename"), nickname: str = ArgPlainText("nickname")):
     logger.debug(f"filename: {filename}\nnickname: {nickname}")
-    state["filename"] = filename
-    state["nicknames"] = string_to_list(nickname)
-    if filename not in state["nickname_cache"]:
+    # 每次修改都基于最新数据，多人同时编辑不会相互覆盖
+    try:
+        edit = await nickname_index.add_aliases(plugin_config.nickname_path, filename, string_to_list(nickname))
+    except KeyError:
         msg_builder = saa.Text(f"未找到图片文件: {filename}")
         await msg_builder.reject_arg("filename")
-    elif not state["nickname_cache"][filename]:
-        state["nickname_cache"][filename] = state["nicknames"]
-        save_json(plugin_config.nickname_path, state["nickname_cache"])
-        msg_builder = saa.Text(f"已更新\n{filename}: {nickname}")
-        await msg_builder.finish()
-    else:
-        for nickname in state["nicknames"]:
-            state["nickname_cache"][filename].append(nickname)
-        save_json(plugin_config.nickname_path, state["nickname_cache"])
-        msg_builder = saa.Text(f"添加成功\n{filename}: {state['nickname_cache'][filename]}")
-        await msg_builder.finish()
+    index = await nickname_index.get(plugin_config.nickname_path)
+    # 全部昵称已存在或属于其它角色时如实告知
+    message = f"{'添加成功' if edit.added else '未添加新昵称'}\n{filename}: {list(index.roles[filename])}"
+    if edit.conflicts:
+        conflicts = "、".join(f"{alias}({role})" for alias, role in edit.conflicts.items())
+        message += f"\n以下昵称已属于其它角色，未添加: {conflicts}"
+    await saa.Text(message).finish()
@@ -1,22 +1,360 @@
-from typing import List
+import asyncio
+import hashlib
 from pathlib import Path
+from typing import Set, Dict, List, Callable, Optional, Awaitable
 
 import nonebot_plugin_saa as saa
-from nonebot_plugin_saa import TargetQQPrivate
-from nonebot import logger, get_bot, get_driver
+from nonebot import logger, get_bots, get_driver
 from nonebot_plugin_apscheduler import scheduler
+from nonebot_plugin_localstore import get_data_dir, get_cache_dir, get_data_file
 
 from nonebot_plugin_bh3_elysian_realm.config import plugin_config
-from nonebot_plugin_bh3_elysian_realm.utils.git_utils import git_pull, git_clone, contrast_repository_url
-from nonebot_plugin_bh3_elysian_realm.utils.file_utils import (
-    check_url,
-    load_json,
-    save_json,
-    merge_dicts,
-    list_all_keys,
-    list_jpg_files,
-    identify_empty_value_keys,
+from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+from nonebot_plugin_bh3_elysian_realm.utils.manifest_utils import ImageManifest
+from nonebot_plugin_bh3_elysian_realm.utils.lease_utils import UpdateCoordinator
+from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import nickname_index
+from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import registry, instrument_job
+from nonebot_plugin_bh3_elysian_realm.utils.notify_utils import NotifyState, notify_superusers
+from nonebot_plugin_bh3_elysian_realm.utils.overview_utils import overview_cache, build_tile_specs
+from nonebot_plugin_bh3_elysian_realm.utils.watch_utils import Snapshot, ResourceWatcher, snapshot
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import check_url, list_all_keys, identify_empty_value_keys
+from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import archive_fetch, archive_validator, forget_validators
+from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource, SourceIndex, source_slug, for_each_source
+from nonebot_plugin_bh3_elysian_realm.utils.image_utils import (
+    image_cache,
+    image_flight,
+    build_variants,
+    build_image_pack,
+    ensure_image_pack,
+    shutdown_render_pool,
 )
+from nonebot_plugin_bh3_elysian_realm.utils.git_utils import (
+    git_head,
+    git_pull,
+    git_clone,
+    git_restore,
+    git_remote_head,
+    git_changed_files,
+    contrast_repository_url,
+)
+
+
+async def pull_resources(image_path: Path) -> bool:
+    """
+    拉取图片资源，并使发生变化的图片缓存失效。
+
+    参数:
+        image_path (Path): 图片资源目录。
+
+    返回:
+        bool: 拉取是否成功。
+    """
+    old_head = await git_head(image_path)
+    if not await git_pull(image_path):
+        return False
+    new_head = await git_head(image_path)
+    changed: Optional[List[str]] = []
+    if old_head != new_head:
+        changed = await git_changed_files(image_path, old_head, new_head) if old_head and new_head else None
+    await after_update(image_path, changed)
+    return True
+
+
+update_poller = UpdatePoller(
+    get_data_file("nonebot_plugin_bh3_elysian_realm", "update_state.json"),
+    plugin_config.resource_validation_time,
+    plugin_config.resource_retry_time,
+)
+
+
+def create_sources() -> List[ImageSource]:
+    """按优先级从高到低排列的图片来源，额外仓库在前，image_repository 在最后"""
+    sources = []
+    for repository in plugin_config.extra_image_repositories:
+        slug = source_slug(repository)
+        poller = UpdatePoller(
+            get_data_file("nonebot_plugin_bh3_elysian_realm", f"update_state_{slug}.json"),
+            plugin_config.resource_validation_time,
+            plugin_config.resource_retry_time,
+        )
+        sources.append(
+            ImageSource(repository, get_data_dir("nonebot_plugin_bh3_elysian_realm") / "repositories" / slug, poller)
+        )
+    sources.append(ImageSource(plugin_config.image_repository, plugin_config.image_path, update_poller, upstream=True))
+    return sources
+
+
+source_index = SourceIndex(create_sources())
+
+
+async def poll_resources(image_path: Path, force: bool = False, poller: Optional[UpdatePoller] = None) -> bool:
+    """
+    比较远程与本地 HEAD，仅在远程有变化时拉取图片资源。
+
+    参数:
+        image_path (Path): 图片资源目录。
+        force (bool): 是否忽略上次检查时间。
+        poller (Optional[UpdatePoller]): 该目录的检查状态，默认为 image_path 的检查状态。
+
+    返回:
+        bool: 检查（及拉取）是否成功。
+    """
+    poller = poller or update_poller
+    local_head = await git_head(image_path)
+    if not force and poller.recently_checked(local_head):
+        logger.info("距上次检查未超过检查间隔，跳过图片资源更新")
+        return True
+    remote_head = await git_remote_head(image_path)
+    if remote_head is None:
+        await poller.failed()
+        return False
+    if remote_head == local_head:
+        logger.info("图片资源已是最新版本")
+        await poller.succeeded(remote_head)
+        return True
+    if not await pull_resources(image_path):
+        await poller.failed()
+        return False
+    await poller.succeeded(remote_head)
+    return True
+
+
+def archive_state_dir() -> Path:
+    return get_cache_dir("nonebot_plugin_bh3_elysian_realm") / "archive"
+
+
+async def fetch_archive_resources(image_path: Path) -> bool:
+    """
+    以归档方式下载图片资源，归档有变化时执行更新后的处理。
+
+    参数:
+        image_path (Path): 图片资源目录。
+
+    返回:
+        bool: 下载是否成功。
+    """
+    archive_url = plugin_config.archive_url or f"{plugin_config.image_repository}/archive/HEAD.tar.gz"
+    state_dir = archive_state_dir()
+    changed = await archive_fetch(archive_url, image_path, plugin_config.proxies, state_dir)
+    if changed is None:
+        await update_poller.failed()
+        return False
+    await update_poller.succeeded(await asyncio.get_running_loop().run_in_executor(None, archive_validator, state_dir))
+    if changed:
+        await after_update(image_path)
+    return True
+
+
+coordinators: Dict[Path, UpdateCoordinator] = {}
+
+
+def source_coordinator(source: ImageSource) -> UpdateCoordinator:
+    coordinator = coordinators.get(source.path)
+    if coordinator is None:
+        coordinator = coordinators[source.path] = UpdateCoordinator(source.path, plugin_config.update_lease_ttl)
+    return coordinator
+
+
+async def refresh_source(source: ImageSource, old_head: Optional[str], new_head: Optional[str]) -> None:
+    """
+    其它进程更新了共享的图片目录后刷新本进程的状态，能确定变化的文件时只处理变化的文件。
+
+    参数:
+        source (ImageSource): 图片来源。
+        old_head (Optional[str]): 本进程上次看到的版本。
+        new_head (Optional[str]): 其它进程发布的版本。
+    """
+    changed = None
+    if old_head and new_head:
+        changed = await git_changed_files(source.path, old_head, new_head)
+    await after_update(source.path, changed)
+
+
+async def coordinated_update(source: ImageSource, update: Callable[[], Awaitable[bool]]) -> bool:
+    """
+    在多个进程之间协调图片来源的更新，同一时间只有一个进程执行 update，其余进程等待并采用其结果。
+
+    参数:
+        source (ImageSource): 图片来源。
+        update (Callable[[], Awaitable[bool]]): 实际的更新操作。
+
+    返回:
+        bool: 更新是否成功。
+    """
+    return await source_coordinator(source).run(
+        update,
+        lambda: git_head(source.path),
+        lambda old_head, new_head: refresh_source(source, old_head, new_head),
+        plugin_config.git_timeout + plugin_config.update_lease_ttl,
+    )
+
+
+async def update_source(source: ImageSource) -> bool:
+    """按配置的获取方式立即更新单个图片来源"""
+
+    async def update() -> bool:
+        if source.upstream and plugin_config.resource_fetch_mode == "archive":
+            return await fetch_archive_resources(source.path)
+        return await pull_resources(source.path)
+
+    return await coordinated_update(source, update)
+
+
+@instrument_job("update_resources")
+async def update_resources() -> bool:
+    """
+    并发更新所有图片来源，并发数不超过 update_concurrency。
+
+    返回:
+        bool: 是否全部更新成功。
+    """
+    results = await for_each_source(source_index.sources, update_source, plugin_config.update_concurrency)
+    return all(results)
+
+
+# 各图片目录最近一次处理时的文件状态，文件监视随后报告的同一变化不再重复处理
+handled_images: Dict[Path, Snapshot] = {}
+
+
+def mark_handled(image_path: Path) -> None:
+    """记录图片目录当前的文件状态"""
+    directory = image_path.resolve()
+    handled_images[directory] = snapshot([directory])
+
+
+def unhandled_images(directory: Path, changed: Set[Path]) -> List[str]:
+    """
+    文件监视报告的变化中尚未处理的图片，状态与最近一次处理时相同的图片视为已处理。
+
+    参数:
+        directory (Path): 图片目录，绝对路径。
+        changed (Set[Path]): 发生变化的文件。
+
+    返回:
+        List[str]: 需要处理的图片文件名。
+    """
+    paths = [path for path in changed if path.parent == directory and path.suffix == ".jpg"]
+    handled = handled_images.get(directory)
+    if handled is not None and paths:
+        current = snapshot([directory])
+        paths = [path for path in paths if current.get(path) != handled.get(path)]
+    return sorted(path.name for path in paths)
+
+
+@instrument_job("after_update")
+async def after_update(image_path: Path, changed: Optional[List[str]] = None) -> None:
+    """
+    图片资源更新后的处理：使缓存失效，增量生成压缩图片，有图片变化时重新打包并更新对应角色的来源。
+
+    参数:
+        image_path (Path): 图片资源目录。
+        changed (Optional[List[str]]): 发生变化的文件，None 表示全部。
+    """
+    mark_handled(image_path)
+    image_flight.forget()
+    overview_flight.forget()
+    if changed is None:
+        image_cache.invalidate_directory(image_path)
+    else:
+        logger.debug(f"图片资源变更: {changed}")
+        image_cache.invalidate(image_path / file for file in changed)
+    await build_variants(
+        image_path,
+        plugin_config.image_variant,
+        plugin_config.image_variant_max_width,
+        plugin_config.image_variant_quality,
+    )
+    if changed is None:
+        await build_image_pack(image_path)
+        source_index.rebuild()
+        return
+    # 只有目录顶层的图片参与打包与合并索引，其它文件变化时无需处理
+    roles = sorted({name[: -len(".jpg")] for name in changed if "/" not in name and name.endswith(".jpg")})
+    if roles:
+        await build_image_pack(image_path)
+        source_index.update(roles)
+
+
+overview_flight: "SingleFlight[str, bytes]" = SingleFlight(plugin_config.reply_cache_ttl)
+
+
+async def prepare_overview() -> bytes:
+    """
+    获取全部角色的总览图，并发请求只生成一次。
+
+    缩略图按源图片与昵称缓存，图片更新或昵称修改后只重新绘制对应角色。
+
+    返回:
+        bytes: 总览图内容。
+    """
+
+    async def render() -> bytes:
+        index = await nickname_index.get(plugin_config.nickname_path)
+        specs = build_tile_specs(
+            index.roles,
+            lambda role: source_index.resolve(role) or plugin_config.image_path,
+            plugin_config.overview_tile_width,
+        )
+        return await overview_cache.get(
+            specs, plugin_config.overview_columns, plugin_config.overview_tile_width, plugin_config.overview_font
+        )
+
+    return await overview_flight.do("overview", render)
+
+
+corrupt_images_total = registry.counter(
+    "elysian_realm_corrupt_images_total", "发现的无法解码的图片数，result 为 repaired/unrepaired", ["result"]
+)
+manifests: Dict[Path, ImageManifest] = {}
+
+
+def image_manifest(image_path: Path) -> ImageManifest:
+    """图片目录的内容清单，保存在 localstore 数据目录"""
+    manifest = manifests.get(image_path)
+    if manifest is None:
+        digest = hashlib.sha1(str(image_path.resolve()).encode("utf-8")).hexdigest()[:8]
+        manifest_file = (
+            get_data_dir("nonebot_plugin_bh3_elysian_realm") / "manifests" / f"{image_path.name}-{digest}.json"
+        )
+        manifest = manifests[image_path] = ImageManifest(manifest_file)
+    return manifest
+
+
+async def check_integrity(source: ImageSource) -> List[str]:
+    """
+    增量检查图片来源的完整性，无法解码的图片从当前提交重新检出（归档模式下重新下载归档）。
+
+    参数:
+        source (ImageSource): 图片来源。
+
+    返回:
+        List[str]: 修复后仍无法解码的文件。
+    """
+    if not source.path.is_dir():
+        return []
+    manifest = image_manifest(source.path)
+    result = await manifest.scan_async(source.path)
+    if result.checked:
+        logger.debug(f"已重新校验 {len(result.checked)} 张图片")
+    if not result.corrupt:
+        return []
+    corrupt = result.corrupt
+    logger.warning(f"以下图片无法解码，尝试修复: {corrupt}")
+    if source.upstream and plugin_config.resource_fetch_mode == "archive":
+        await asyncio.get_running_loop().run_in_executor(None, forget_validators, archive_state_dir())
+        await fetch_archive_resources(source.path)
+    elif await git_restore(source.path, corrupt):
+        await after_update(source.path, corrupt)
+    remaining = (await manifest.scan_async(source.path)).corrupt
+    repaired = len(set(corrupt) - set(remaining))
+    if repaired:
+        corrupt_images_total.inc(repaired, result="repaired")
+        logger.info(f"已修复 {repaired} 张图片")
+    if remaining:
+        corrupt_images_total.inc(len(remaining), result="unrepaired")
+        logger.error(f"以下图片仍无法解码，请检查图片资源: {remaining}")
+    return remaining
 
 
 class ResourcesVerify:
@@ -31,8 +369,8 @@ class ResourcesVerify:
 
     @classmethod
     async def create(cls):
-        jpg_list = list_jpg_files(plugin_config.image_path)
-        nickname_cache = await load_json(plugin_config.nickname_path)
+        jpg_list = list(source_index.rebuild())
+        nickname_cache = (await nickname_index.get(plugin_config.nickname_path)).to_dict()
         return cls(jpg_list, nickname_cache)
 
     async def verify_nickname(self):
@@ -44,50 +382,184 @@ class ResourcesVerify:
                 return True
             else:
                 logger.warning(f"nickname.json缺少以下角色:{cache}")
-                save_json(self.nickname_path, await merge_dicts(self.nickname_cache, {key: [] for key in cache}))
+                await nickname_index.add_roles(self.nickname_path, cache)
                 return False
         else:
             logger.error("nickname.json不存在")
             raise FileNotFoundError
 
-    async def verify_images(self):
+    async def verify_images(self, force: bool = False):
+        """并发检查所有图片来源，并发数不超过 update_concurrency"""
         logger.debug("开始检查图片资源")
-        logger.debug(f"图片仓库地址: {self.image_repository}")
-        logger.debug(f"图片仓库路径: {self.image_path}")
-        if await contrast_repository_url(self.image_repository, self.image_path):
-            await git_pull(self.image_path)
-        else:
-            if await git_clone(self.image_repository, self.image_path) is False:
-                logger.error("图片资源克隆失败")
+
+        async def update(source: ImageSource) -> bool:
+            if source.upstream and plugin_config.resource_fetch_mode == "archive":
+                updated = await fetch_archive_resources(source.path)
+            elif await contrast_repository_url(source.repository, source.path):
+                updated = await poll_resources(source.path, force, source.poller)
+            else:
+                updated = await git_clone(source.repository, source.path)
+                if updated is False:
+                    logger.error(f"图片资源克隆失败: {source.repository}")
+                await after_update(source.path)
+            # 修复损坏的图片同样会修改共享目录，由持有租约的进程执行
+            await check_integrity(source)
+            return updated
+
+        async def verify(source: ImageSource) -> bool:
+            logger.debug(f"图片仓库地址: {source.repository}")
+            logger.debug(f"图片仓库路径: {source.path}")
+            updated = await coordinated_update(source, lambda: update(source))
+            await ensure_image_pack(source.path)
+            return updated
+
+        return all(await for_each_source(source_index.sources, verify, plugin_config.update_concurrency))
 
 
 @scheduler.scheduled_job("interval", seconds=plugin_config.resource_validation_time, id="resource_validation")
+@instrument_job("resource_validation")
 async def resource_scheduled_job():
     logger.debug("开始检查图片资源计划任务")
-    await git_pull(plugin_config.image_path)
     resources_verify = await ResourcesVerify.create()
-    await resources_verify.verify_images()
+    await resources_verify.verify_images(force=True)
+    # 任一来源检查失败时按其退避间隔提前重试
+    interval = min(source.poller.next_interval() for source in source_index.sources)
+    logger.debug(f"下次检查图片资源间隔: {interval:.0f}s")
+    scheduler.reschedule_job("resource_validation", trigger="interval", seconds=interval)
+
+
+notify_state = NotifyState(get_data_file("nonebot_plugin_bh3_elysian_realm", "notify_state.json"))
 
 
 @scheduler.scheduled_job("interval", seconds=plugin_config.resource_validation_time, id="null_nickname_warning")
+@instrument_job("null_nickname_warning")
 async def null_nickname_warning():
+    """缺失昵称的图片与上次通知时不同时通知所有超级用户，至少送达一个目标后记录本次通知的内容"""
     logger.debug("开始检查nickname.json空值计划任务")
-    empty_value_list = await identify_empty_value_keys(await load_json(plugin_config.nickname_path))
-    if empty_value_list:
-        bot = get_bot()
-        msg_builder = saa.Text(f"{empty_value_list}缺失昵称，请及时更新")
-        logger.debug(f"superusers: {get_driver().config.superusers}")
-        for superuser in get_driver().config.superusers:
-            msg_target = TargetQQPrivate(user_id=int(superuser))
-            await msg_builder.send_to(msg_target, bot)
+    index = await nickname_index.get(plugin_config.nickname_path)
+    empty_value_list = sorted(await identify_empty_value_keys(index.roles))
+    notified = notify_state.missing
+    if empty_value_list == notified:
+        logger.debug("缺失昵称的图片与上次通知时相同")
+        return
+    if not empty_value_list:
+        logger.info("缺失昵称的图片已全部补全")
+        notify_state.save([])
+        return
+    message = f"{empty_value_list}缺失昵称，请及时更新"
+    added = sorted(set(empty_value_list) - set(notified))
+    if notified and added:
+        message += f"\n新增: {added}"
+    delivered, failed = await notify_superusers(
+        saa.MessageFactory(saa.Text(message)),
+        get_bots().values(),
+        get_driver().config.superusers,
+        plugin_config.notify_concurrency,
+    )
+    logger.debug(f"缺失昵称通知送达 {delivered} 个目标，失败 {failed} 个")
+    if delivered:
+        notify_state.save(empty_value_list)
 
 
-async def on_startup():
-    """启动前检查"""
-    await check_url(plugin_config.image_repository, plugin_config.proxies)
+class ResourcesState:
+    """启动检查状态，检查进行中时缺失资源的查询会直接收到提示"""
+
+    def __init__(self):
+        self.loading = False
+        self.task: Optional["asyncio.Task[None]"] = None
+
+
+resources_state = ResourcesState()
+
+
+async def verify_resources():
+    """检查图片与昵称资源，图片更新后再以最新的图片列表检查昵称"""
     resources_verify = await ResourcesVerify.create()
     await resources_verify.verify_images()
+    resources_verify = await ResourcesVerify.create()
     await resources_verify.verify_nickname()
-    _list = await identify_empty_value_keys(await load_json(plugin_config.nickname_path))
+    index = await nickname_index.get(plugin_config.nickname_path)
+    _list = await identify_empty_value_keys(index.roles)
     if _list:
         logger.warning(f"{_list}缺失昵称，请及时更新")
+
+
+@instrument_job("startup_verify")
+async def startup_verify():
+    """并发执行相互独立的启动检查"""
+    resources_state.loading = True
+    try:
+        results = await asyncio.gather(
+            check_url(plugin_config.image_repository, plugin_config.proxies),
+            verify_resources(),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.opt(exception=result).error("启动检查异常")
+    finally:
+        resources_state.loading = False
+        logger.info("乐土攻略资源检查完成")
+
+
+async def handle_resource_changes(changed: Set[Path]) -> None:
+    """
+    处理文件监视发现的变化：nickname.json 被外部修改时重建昵称索引，图片变化时只处理变化的图片，
+    本进程自己写入的 nickname.json 与拉取时已处理的图片被忽略。
+
+    参数:
+        changed (Set[Path]): 发生变化的文件，已转换为绝对路径。
+    """
+    if nickname_index.store is None and plugin_config.nickname_path.resolve() in changed:
+        # 本进程写入的 nickname.json 不再重新加载，否则会丢弃尚未写入的修改
+        if await nickname_index.reload(plugin_config.nickname_path):
+            logger.info("nickname.json 已变化，重新加载昵称")
+            overview_flight.forget()
+    for source in source_index.sources:
+        files = unhandled_images(source.path.resolve(), changed)
+        if files:
+            logger.info(f"图片资源已变化: {files}")
+            await after_update(source.path, files)
+
+
+class ResourceWatch:
+    """资源文件监视的启停，启动检查完成后开始监视，避免重复处理首次克隆的图片"""
+
+    def __init__(self):
+        self.watcher: Optional[ResourceWatcher] = None
+
+    def start(self) -> None:
+        if self.watcher is not None:
+            return
+        directories = [source.path for source in source_index.sources]
+        if nickname_index.store is None:
+            # 监视所在目录，原子替换写入的 nickname.json 也能被发现
+            directories.append(plugin_config.nickname_path.parent)
+        self.watcher = ResourceWatcher(
+            directories, plugin_config.resource_watch_debounce, plugin_config.resource_watch_poll_interval
+        )
+        self.watcher.start(handle_resource_changes)
+        nickname_index.watched = nickname_index.store is None
+
+    async def stop(self) -> None:
+        nickname_index.watched = False
+        if self.watcher is not None:
+            await self.watcher.stop()
+            self.watcher = None
+
+
+resource_watch = ResourceWatch()
+
+
+async def on_startup():
+    """启动时在后台执行资源检查，不阻塞驱动启动"""
+    resources_state.task = asyncio.get_running_loop().create_task(startup_verify())
+    if plugin_config.resource_watch:
+        resources_state.task.add_done_callback(lambda _: resource_watch.start())
+
+
+async def on_shutdown():
+    """关闭前停止监视、写入待保存的数据并关闭进程池"""
+    await resource_watch.stop()
+    await nickname_index.flush()
+    shutdown_render_pool()
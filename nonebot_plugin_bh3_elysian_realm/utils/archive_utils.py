@@ -0,0 +1,177 @@
+import os
+import json
+import shutil
+import asyncio
+import tarfile
+from pathlib import Path, PurePosixPath
+from typing import Any, Set, Dict, Iterable, Optional
+
+import httpx
+import aiofiles
+from nonebot import logger
+
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json
+
+CHUNK_SIZE = 64 * 1024
+
+
+def load_state(state_file: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(state_file.read_text("utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_file: Path, state: Dict[str, Any]) -> None:
+    save_json(state_file, state, create=True)
+
+
+def archive_validator(state_dir: Path) -> Optional[str]:
+    """上次完整下载的归档的 ETag，没有时为 Last-Modified，都没有时返回 None"""
+    state = load_state(state_dir / "archive.json")
+    return state.get("etag") or state.get("last_modified") or None
+
+
+def forget_validators(state_dir: Path) -> None:
+    """丢弃归档的 ETag/Last-Modified，下次下载时获取完整归档"""
+    state_file = state_dir / "archive.json"
+    state = load_state(state_file)
+    if state.get("etag") or state.get("last_modified"):
+        state.pop("etag", None)
+        state.pop("last_modified", None)
+        save_state(state_file, state)
+
+
+def extract_archive(archive: Path, image_path: Path, previous: Iterable[str] = ()) -> Set[str]:
+    """
+    以流式方式读取已下载的仓库归档并解压到图片目录，去掉归档的顶层目录。
+
+    每个文件先写入临时文件再替换。只删除上次解压出、但本次归档中已不存在的文件，用户自行放入的文件不受影响。
+
+    参数:
+        archive (Path): tar.gz 归档路径。
+        image_path (Path): 图片资源目录。
+        previous (Iterable[str]): 上次解压出的文件（相对图片目录）。
+
+    返回:
+        Set[str]: 解压出的文件（相对图片目录）。
+    """
+    image_path.mkdir(parents=True, exist_ok=True)
+    extracted: Set[str] = set()
+    with tarfile.open(archive, mode="r|gz") as tar:
+        for member in tar:
+            parts = PurePosixPath(member.name).parts[1:]
+            # 跳过目录、链接与可能越出目标目录的路径
+            if not member.isfile() or not parts or ".." in parts or parts[0].startswith("."):
+                continue
+            name = "/".join(parts)
+            target = image_path.joinpath(*parts)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            source = tar.extractfile(member)
+            if source is None:
+                continue
+            temp = target.with_name(f".{target.name}.tmp")
+            with source, temp.open("wb") as file:
+                shutil.copyfileobj(source, file, CHUNK_SIZE)
+            os.replace(temp, target)
+            extracted.add(name)
+    for name in set(previous) - extracted:
+        parts = PurePosixPath(name).parts
+        if parts and ".." not in parts:
+            image_path.joinpath(*parts).unlink(missing_ok=True)
+    return extracted
+
+
+async def archive_fetch(
+    archive_url: str, image_path: Path, proxy_url: Optional[str], state_dir: Path, timeout: float = 60
+) -> Optional[bool]:
+    """
+    下载仓库归档并解压到图片目录，无需 git。
+
+    使用 ETag/Last-Modified 重新验证，归档未变化时服务器只需返回 304；
+    下载中断后再次调用会通过 Range 请求续传。归档完整下载后才解压，续传的归档无法从中途开始解压，
+    下载失败时也不会留下新旧混杂的图片目录。
+
+    参数:
+        archive_url (str): tar.gz 归档地址。
+        image_path (Path): 图片资源目录。
+        proxy_url (Optional[str]): 代理地址。
+        state_dir (Path): 保存下载状态与未完成归档的目录。
+        timeout (float): 网络超时时间（秒）。
+
+    返回:
+        Optional[bool]: True 为已更新，False 为未变化，None 为失败。
+    """
+    state_dir.mkdir(parents=True, exist_ok=True)
+    state_file = state_dir / "archive.json"
+    part_file = state_dir / "archive.tar.gz.part"
+    state = load_state(state_file)
+    if state.get("url") != archive_url:
+        state = {"url": archive_url, "files": state.get("files", [])}
+        part_file.unlink(missing_ok=True)
+    loop = asyncio.get_running_loop()
+
+    async def persist() -> None:
+        await loop.run_in_executor(None, save_state, state_file, dict(state))
+
+    headers: Dict[str, str] = {}
+    offset = part_file.stat().st_size if part_file.exists() else 0
+    if offset and state.get("partial_etag"):
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = state["partial_etag"]
+    elif any(not path.name.startswith(".") for path in image_path.glob("*")):
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    proxies = httpx.Proxy(url=proxy_url) if proxy_url else None
+    try:
+        async with httpx.AsyncClient(proxies=proxies, timeout=timeout, follow_redirects=True) as client:
+            async with client.stream("GET", archive_url, headers=headers) as response:
+                if response.status_code == 304:
+                    logger.info("图片资源归档未变化")
+                    return False
+                restart = response.status_code == 416 and bool(offset)
+                if not restart:
+                    if response.status_code not in (200, 206):
+                        logger.error(f"下载图片资源归档失败: HTTP {response.status_code}")
+                        return None
+                    mode = "ab" if response.status_code == 206 else "wb"
+                    if mode == "ab":
+                        logger.info(f"从 {offset} 字节处续传图片资源归档")
+                    state["partial_etag"] = response.headers.get("ETag", "")
+                    state["partial_last_modified"] = response.headers.get("Last-Modified", "")
+                    await persist()
+                    async with aiofiles.open(part_file, mode=mode) as file:
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            await file.write(chunk)
+    except httpx.HTTPError as e:
+        logger.error(f"下载图片资源归档出错: {e!r}")
+        return None
+
+    if restart:
+        # 未完成的归档已下载完整（或比服务器上的更长），服务器拒绝续传，丢弃后重新下载
+        logger.warning(f"图片资源归档无法从 {offset} 字节处续传，重新下载")
+        part_file.unlink(missing_ok=True)
+        state.pop("partial_etag", None)
+        state.pop("partial_last_modified", None)
+        await persist()
+        return await archive_fetch(archive_url, image_path, proxy_url, state_dir, timeout)
+
+    try:
+        extracted = await loop.run_in_executor(None, extract_archive, part_file, image_path, state.get("files", []))
+    except (tarfile.TarError, OSError, EOFError) as e:
+        logger.error(f"解压图片资源归档失败: {e!r}")
+        part_file.unlink(missing_ok=True)
+        state.pop("partial_etag", None)
+        await persist()
+        return None
+
+    logger.info(f"图片资源归档已解压 {len(extracted)} 个文件")
+    state["etag"] = state.pop("partial_etag", "")
+    state["last_modified"] = state.pop("partial_last_modified", "")
+    state["files"] = sorted(extracted)
+    await persist()
+    part_file.unlink(missing_ok=True)
+    return True
@@ -0,0 +1,74 @@
+import time
+import asyncio
+from typing import Dict, Tuple, Generic, TypeVar, Callable, Hashable, Optional, Awaitable
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """合并相同键的并发调用，结果在 ttl 秒内复用，ttl 不大于 0 时只合并进行中的调用，不保留结果"""
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._calls: Dict[K, "asyncio.Future[V]"] = {}
+        self._results: Dict[K, Tuple[float, V]] = {}
+
+    async def do(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        """
+        执行 func 并返回结果。
+
+        同一键已有进行中的调用时等待其结果，ttl 内已有结果时直接返回。
+        调用异常不会被缓存，所有等待者都会收到同一异常。
+
+        参数:
+            key (K): 调用键。
+            func (Callable[[], Awaitable[V]]): 实际执行的协程函数。
+
+        返回:
+            V: 调用结果。
+        """
+        self._prune(time.monotonic())
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached[1]
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(key, func))
+            self._calls[key] = future
+        # 单个等待者被取消时不影响其它等待者
+        return await asyncio.shield(future)
+
+    async def _run(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        try:
+            result = await func()
+            self._store(key, result)
+            return result
+        finally:
+            self._calls.pop(key, None)
+
+    def _prune(self, now: float) -> None:
+        """淘汰过期的结果，结果按写入时间排列，只需从头检查"""
+        while self._results:
+            oldest = next(iter(self._results))
+            if now - self._results[oldest][0] < self.ttl:
+                break
+            del self._results[oldest]
+
+    def _store(self, key: K, result: V) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        self._results.pop(key, None)
+        self._prune(now)
+        if len(self._results) >= self.max_size:
+            self._results.pop(next(iter(self._results)))
+        self._results[key] = (now, result)
+
+    def forget(self, key: Optional[K] = None) -> None:
+        """丢弃指定键或全部已缓存的结果"""
+        if key is None:
+            self._results.clear()
+        else:
+            self._results.pop(key, None)
@@ -1,13 +1,21 @@
 import os
+import copy
 import json
+import shutil
+import asyncio
+import tempfile
+import contextlib
 from pathlib import Path
-from typing import Dict, List, Union, Optional
+from typing import Dict, List, Tuple, Union, Mapping, Callable, Optional
 
 import httpx
 import aiofiles
 from nonebot import logger
 
+from nonebot_plugin_bh3_elysian_realm.utils.trace_utils import traced
 
+
+@traced("load_json")
 async def load_json(json_file: Path) -> Dict:
     """
     从指定的 JSON 文件中加载数据。
@@ -29,22 +37,108 @@ async def load_json(json_file: Path) -> Dict:
         raise ValueError(f"文件 {json_file} 解码错误。") from e
 
 
-def save_json(json_file, data: Dict) -> None:
+@traced("save_json")
+def save_json(json_file, data: Dict, create: bool = False) -> None:
     """
     保存字典到指定的 JSON 文件。
+    先写入同目录下的临时文件并落盘，再原子替换原文件，写入中断不会留下损坏的文件。
     :param json_file: JSON 文件路径
     :param data: 要保存的数据
+    :param create: 文件不存在时是否创建（包括所在目录），用于插件自己的状态文件
     :return: None
     """
-    if not json_file.exists() or json_file.suffix != ".json":
+    if json_file.suffix != ".json" or not (create or json_file.exists()):
         raise FileNotFoundError(f"文件 {json_file} 不存在或不是一个JSON文件。")
+    if create:
+        json_file.parent.mkdir(parents=True, exist_ok=True)
     try:
-        with json_file.open("w", encoding="utf-8") as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
+        content = json.dumps(data, ensure_ascii=False, indent=4)
     except TypeError as e:
         raise TypeError("Serialization error") from e
-
-
+    fd, temp = tempfile.mkstemp(prefix=f".{json_file.name}.", suffix=".tmp", dir=json_file.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp 创建的文件权限为 0600，替换前沿用原文件的权限
+        if json_file.exists():
+            shutil.copymode(json_file, temp)
+        os.replace(temp, json_file)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp)
+        raise
+
+
+class JsonWriter:
+    """延迟合并写入：窗口期内的多次保存只在窗口结束时写入最后一次的数据，写入在线程池中执行"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._pending: Dict[Path, Tuple[Dict, Optional[Callable[[], None]]]] = {}
+        self._timers: Dict[Path, "asyncio.Task[None]"] = {}
+        self._writes: Dict[Path, "asyncio.Future[None]"] = {}
+
+    def is_pending(self, json_file: Path) -> bool:
+        """是否有尚未写入或正在写入的数据"""
+        return json_file in self._pending or json_file in self._writes
+
+    def schedule(self, json_file: Path, data: Dict, on_written: Optional[Callable[[], None]] = None) -> None:
+        """
+        计划保存数据，窗口期内重复调用只保留最后一次的数据。
+        :param json_file: JSON 文件路径
+        :param data: 要保存的数据，会立即复制一份快照
+        :param on_written: 写入完成后的回调
+        :return: None
+        """
+        self._pending[json_file] = (copy.deepcopy(data), on_written)
+        if json_file not in self._timers:
+            self._timers[json_file] = asyncio.get_running_loop().create_task(self._delayed_write(json_file))
+
+    async def _delayed_write(self, json_file: Path) -> None:
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._timers.pop(json_file, None)
+        await self._write(json_file)
+
+    async def _write(self, json_file: Path) -> None:
+        # 同一文件的写入依次进行，先开始的写入不会覆盖后开始的写入
+        previous = self._writes.get(json_file)
+        if previous is not None:
+            with contextlib.suppress(Exception):
+                await previous
+        pending = self._pending.pop(json_file, None)
+        if pending is None:
+            return
+        data, on_written = pending
+        write = asyncio.get_running_loop().run_in_executor(None, save_json, json_file, data)
+        self._writes[json_file] = write
+        try:
+            await write
+        except Exception as e:
+            logger.error(f"保存文件 {json_file} 失败：{e}")
+            return
+        finally:
+            if self._writes.get(json_file) is write:
+                del self._writes[json_file]
+        logger.debug(f"已保存文件 {json_file}")
+        if on_written is not None:
+            on_written()
+
+    async def flush(self) -> None:
+        """立即写入所有待保存的数据，并等待正在进行的写入完成"""
+        for timer in list(self._timers.values()):
+            timer.cancel()
+        self._timers.clear()
+        for json_file in list(self._pending):
+            await self._write(json_file)
+        if self._writes:
+            await asyncio.wait(list(self._writes.values()))
+
+
+@traced("list_jpg_files")
 def list_jpg_files(directory: Union[str, Path]) -> List[str]:
     """
     列出指定目录下的所有jpg文件的文件名（不包括子目录）。
@@ -81,12 +175,12 @@ async def find_key_by_value(data: Dict, value: str) -> Optional[str]:
     return next((key for key, values in data.items() if value in values), None)
 
 
-async def identify_empty_value_keys(data: Dict) -> List[str]:
+async def identify_empty_value_keys(data: Mapping) -> List[str]:
     """
     从 Dict 中查找值为空的键。
 
     参数:
-        data (Dict): 要查找的 Dict。
+        data (Mapping): 要查找的 Dict。
 
     返回:
         List[str]: 找到的键列表。
@@ -122,8 +216,8 @@ async def merge_dicts(raw_data: Dict, update_data: Dict) -> Dict:
 async def check_url(url: str, proxy_url: Optional[str]) -> bool:
     try:
         proxies = httpx.Proxy(url=proxy_url) if proxy_url else None
-        with httpx.Client(proxies=proxies, timeout=5) as client:
-            response = client.head(url)
+        async with httpx.AsyncClient(proxies=proxies, timeout=5) as client:
+            response = await client.head(url)
             return response.status_code == 200
     except (httpx.RequestError, httpx.TimeoutException):
         logger.error(f"检查URL {url} 时出错。")
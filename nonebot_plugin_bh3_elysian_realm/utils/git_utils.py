@@ -2,75 +2,180 @@ import os
 import re
 import asyncio
 from pathlib import Path
-from typing import Union
+from collections import deque
+from typing import List, Callable, Optional, NamedTuple
 
 from tqdm import tqdm
 from nonebot import logger
 
+from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import instrument_git
 
-def update_progress(stderr_lines):
-    """更新克隆或拉取资源的进度条"""
-    with tqdm(desc="更新中") as pbar:
-        for line in stderr_lines:
-            logger.debug(line)
-            speed_match = re.search(r"\|\s*([\d.]+\s*[\w/]+/s)", line)
-            if speed_match:
-                speed = speed_match.group(1)
-                pbar.set_postfix_str(f"下载速度: {speed}")
-            pbar.update()
+# 短命令（读取配置、HEAD 等）的超时时间
+GIT_COMMAND_TIMEOUT = 30
+# 流式读取时每个输出流最多保留的行数与单行长度
+MAX_OUTPUT_LINES = 200
+MAX_LINE_LENGTH = 4096
+# 禁止 git 在无终端环境下等待输入凭据
+GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
 
 
-async def git_pull(image_path: Path) -> bool:
-    clone_command = ["git", "pull"]
-    process = None
+class GitResult(NamedTuple):
+    returncode: Optional[int]
+    """进程返回值，超时时为 None"""
+    stdout: str
+    stderr: str
+
+
+class GitProgress:
+    """根据 git 的进度输出逐行更新进度条"""
+
+    def __init__(self, desc: str = "更新中"):
+        self.pbar = tqdm(desc=desc)
+
+    def update(self, line: str) -> None:
+        logger.debug(line)
+        speed_match = re.search(r"\|\s*([\d.]+\s*[\w/]+/s)", line)
+        if speed_match:
+            self.pbar.set_postfix_str(f"下载速度: {speed_match.group(1)}")
+        self.pbar.update()
+
+    def close(self) -> None:
+        self.pbar.close()
+
+
+def git_command(*args: str, repository: Optional[Path] = None) -> List[str]:
+    """构造 git 命令，通过 -C 指定仓库目录而不修改进程工作目录"""
+    return ["git", *(("-C", str(repository)) if repository is not None else ()), *args]
+
+
+async def terminate(process: asyncio.subprocess.Process) -> None:
+    """终止未结束的子进程"""
+    if process.returncode is None:
+        logger.info("终止未结束的子进程")
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+async def git_run(*args: str, repository: Optional[Path] = None, timeout: float = GIT_COMMAND_TIMEOUT) -> GitResult:
+    """
+    执行输出较少的 git 命令并返回全部输出。
+
+    参数:
+        args (str): git 子命令及参数。
+        repository (Optional[Path]): 仓库目录。
+        timeout (float): 超时时间（秒）。
+
+    返回:
+        GitResult: 执行结果，超时时 returncode 为 None。
+    """
+    process = await asyncio.create_subprocess_exec(
+        *git_command(*args, repository=repository),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=GIT_ENV,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"git {' '.join(args)} 执行超时")
+        return GitResult(None, "", "")
+    finally:
+        await terminate(process)
+    return GitResult(process.returncode, stdout.decode("utf-8").strip(), stderr.decode("utf-8").strip())
 
-    if not os.path.exists(image_path):
-        logger.error(f"目录 {image_path} 不存在")
-        return False
 
-    os.chdir(image_path)
-
-    # try:
-    #     with subprocess.Popen(clone_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as process:
-    #         stdout, stderr = process.communicate()
-    #
-    #         if "Already up to date." in stdout:
-    #             logger.info("图片资源已是最新版本")
-    #         else:
-    #             logger.info("图片资源开始更新")
-    #             with tqdm(desc="更新中") as pbar:
-    #                 for line in stderr.splitlines():
-    #                     logger.debug(line)
-    #                     if speed_match := re.search(r"\|\s*([\d.]+\s*[\w/]+/s)", line):
-    #                         speed = speed_match[1]
-    #                         pbar.set_postfix_str(f"下载速度: {speed}")
-    #                     pbar.update()
-    #             logger.info("图片资源更新完成")
-    #
-    #         return True
-    # except subprocess.CalledProcessError:
-    #     logger.error("图片资源更新异常")
-    #     return False
+async def read_lines(
+    stream: Optional[asyncio.StreamReader], lines: "deque[str]", on_line: Optional[Callable[[str], None]] = None
+) -> None:
+    """
+    逐行读取输出流，git 的进度以 \\r 刷新，同样视为换行。
+
+    只保留最近的 lines.maxlen 行，超长的行会被截断，内存占用有上限。
+    """
+    if stream is None:
+        return
+    buffer = b""
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        *parts, buffer = re.split(rb"[\r\n]", buffer + chunk)
+        buffer = buffer[-MAX_LINE_LENGTH:]
+        for part in parts:
+            if part:
+                line = part[:MAX_LINE_LENGTH].decode("utf-8", errors="replace")
+                lines.append(line)
+                if on_line is not None:
+                    on_line(line)
+    if buffer:
+        line = buffer.decode("utf-8", errors="replace")
+        lines.append(line)
+        if on_line is not None:
+            on_line(line)
+
+
+async def git_stream(
+    *args: str,
+    repository: Optional[Path] = None,
+    timeout: float = GIT_COMMAND_TIMEOUT,
+    on_line: Optional[Callable[[str], None]] = None,
+) -> GitResult:
+    """
+    执行耗时较长的 git 命令，stderr 到达时逐行回调。
+
+    参数:
+        args (str): git 子命令及参数。
+        repository (Optional[Path]): 仓库目录。
+        timeout (float): 超时时间（秒）。
+        on_line (Optional[Callable[[str], None]]): stderr 行回调。
+
+    返回:
+        GitResult: 执行结果，输出仅保留最近的 MAX_OUTPUT_LINES 行，超时时 returncode 为 None。
+    """
+    process = await asyncio.create_subprocess_exec(
+        *git_command(*args, repository=repository),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=GIT_ENV,
+    )
+    stdout_lines: "deque[str]" = deque(maxlen=MAX_OUTPUT_LINES)
+    stderr_lines: "deque[str]" = deque(maxlen=MAX_OUTPUT_LINES)
     try:
-        process = await asyncio.create_subprocess_exec(
-            *clone_command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        await asyncio.wait_for(
+            asyncio.gather(
+                read_lines(process.stdout, stdout_lines),
+                read_lines(process.stderr, stderr_lines, on_line),
+                process.wait(),
+            ),
+            timeout,
         )
+    except asyncio.TimeoutError:
+        logger.error(f"git {' '.join(args)} 执行超时")
+        return GitResult(None, "\n".join(stdout_lines), "\n".join(stderr_lines))
+    finally:
+        await terminate(process)
+    return GitResult(process.returncode, "\n".join(stdout_lines), "\n".join(stderr_lines))
 
-        stdout, stderr = await process.communicate()
-        stdout_lines = stdout.decode("utf-8").splitlines()
-        stderr_lines = stderr.decode("utf-8").splitlines()
 
-        if "Already up to date." in stdout_lines:
-            logger.info("图片资源已是最新版本")
-        else:
-            logger.info("图片资源开始更新")
-            update_progress(stderr_lines)
-            logger.info("图片资源更新完成")
+@instrument_git("pull")
+async def git_pull(image_path: Path) -> bool:
+    if not os.path.exists(image_path):
+        logger.error(f"目录 {image_path} 不存在")
+        return False
 
-        await process.wait()
-        return True
+    progress = GitProgress()
+    try:
+        result = await git_stream(
+            "pull",
+            "--progress",
+            repository=image_path,
+            timeout=plugin_config.git_timeout,
+            on_line=progress.update,
+        )
     except asyncio.CancelledError:
         logger.error("图片资源更新被取消")
         return False
@@ -78,36 +183,39 @@ async def git_pull(image_path: Path) -> bool:
         logger.error(f"图片资源更新异常: {e!s}")
         return False
     finally:
-        if process and process.returncode is None:
-            logger.info("终止未结束的子进程")
-            process.terminate()
-            await process.wait()
+        progress.close()
 
+    if result.returncode != 0:
+        logger.error(f"图片资源更新失败: {result.stderr}")
+        return False
+    if "Already up to date." in result.stdout:
+        logger.info("图片资源已是最新版本")
+    else:
+        logger.info("图片资源更新完成")
+    return True
 
-async def git_clone(repository_url: str, image_path: Path) -> Union[bool, str]:
-    clone_command = ["git", "clone", "--progress", "--depth=1", repository_url, str(image_path)]
-    process = None
 
-    if os.path.exists(image_path) and os.listdir(image_path):
+@instrument_git("clone")
+async def git_clone(repository_url: str, image_path: Path) -> bool:
+    # 仅包含占位文件时视为空目录
+    if os.path.exists(image_path) and set(os.listdir(image_path)) - {".gitkeep"}:
         logger.error(f"目录 {image_path} 不为空")
         return False
 
     if (image_path / ".gitkeep").exists():
         os.remove(image_path / ".gitkeep")
 
+    progress = GitProgress(desc="克隆中")
     try:
-        process = await asyncio.create_subprocess_exec(
-            *clone_command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        result = await git_stream(
+            "clone",
+            "--progress",
+            "--depth=1",
+            repository_url,
+            str(image_path),
+            timeout=plugin_config.git_timeout,
+            on_line=progress.update,
         )
-
-        stdout, stderr = await process.communicate()
-        # stdout_lines = stdout.decode("utf-8").splitlines()
-        stderr_lines = stderr.decode("utf-8").splitlines()
-
-        update_progress(stderr_lines)
-
     except asyncio.CancelledError:
         logger.error("克隆被取消")
         return False
@@ -115,12 +223,12 @@ async def git_clone(repository_url: str, image_path: Path) -> Union[bool, str]:
         logger.error(f"克隆异常: {e!s}")
         return False
     finally:
-        if process and process.returncode is None:
-            logger.info("终止未结束的子进程")
-            process.terminate()
-            await process.wait()
+        progress.close()
 
-    return False
+    if result.returncode != 0:
+        logger.error(f"克隆失败: {result.stderr}")
+        return False
+    return True
 
 
 async def contrast_repository_url(repository_url: str, path: Path) -> bool:
@@ -137,49 +245,107 @@ async def contrast_repository_url(repository_url: str, path: Path) -> bool:
     返回:
         bool: 如果指定目录是指定的 Git 仓库，则返回 True；否则返回 False。
 
-    异常:
-        subprocess.CalledProcessError: 如果在执行 Git 命令时出错，将捕获此异常并返回 False。
-
     注意:
         这个函数假设 'git' 命令在系统路径上可用。
         如果指定目录不是 Git 仓库，或者 'git' 命令无法执行，函数将返回 False。
     """
-    original_cwd = Path.cwd()
-    process = None
     try:
-        os.chdir(path)
-
-        # 异步执行 "git config --get remote.origin.url" 命令
-        process = await asyncio.create_subprocess_exec(
-            "git",
-            "config",
-            "--get",
-            "remote.origin.url",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
+        result = await git_run("config", "--get", "remote.origin.url", repository=path)
+    except Exception as e:
+        logger.error(f"检查仓库地址时发生异常：{e}")
+        return False
 
-        stdout, stderr = await process.communicate()
-        remote_url = stdout.decode("utf-8").strip()
-
-        if process.returncode == 0:
-            if remote_url == repository_url:
-                logger.debug("指定仓库地址与目录下仓库地址匹配")
-                return True
-            else:
-                logger.debug(f"目录下仓库地址: {remote_url}")
-                logger.debug(f"指定仓库地址: {repository_url}")
-                return False
+    if result.returncode == 0:
+        if result.stdout == repository_url:
+            logger.debug("指定仓库地址与目录下仓库地址匹配")
+            return True
         else:
-            logger.error(f"获取远程仓库地址时出错：{stderr.decode('utf-8').strip()}")
+            logger.debug(f"目录下仓库地址: {result.stdout}")
+            logger.debug(f"指定仓库地址: {repository_url}")
             return False
+    else:
+        logger.error(f"获取远程仓库地址时出错：{result.stderr}")
+        return False
+
+
+async def git_head(path: Path) -> Optional[str]:
+    """
+    获取指定仓库当前的 HEAD 提交。
+
+    参数:
+        path (Path): 仓库路径。
 
+    返回:
+        Optional[str]: 提交哈希，不是 Git 仓库或执行失败时返回 None。
+    """
+    try:
+        result = await git_run("rev-parse", "HEAD", repository=path)
     except Exception as e:
-        logger.error(f"检查仓库地址时发生异常：{e}")
+        logger.error(f"获取仓库 HEAD 时发生异常：{e}")
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+async def git_changed_files(path: Path, old: str, new: str) -> Optional[List[str]]:
+    """
+    列出两次提交之间发生变化的文件。
+
+    参数:
+        path (Path): 仓库路径。
+        old (str): 旧提交。
+        new (str): 新提交。
+
+    返回:
+        Optional[List[str]]: 相对仓库根目录的文件路径列表，执行失败时返回 None。
+    """
+    try:
+        result = await git_run("diff", "--name-only", old, new, repository=path)
+    except Exception as e:
+        logger.error(f"获取变更文件时发生异常：{e}")
+        return None
+    return result.stdout.splitlines() if result.returncode == 0 else None
+
+
+@instrument_git("ls-remote")
+async def git_remote_head(path: Path) -> Optional[str]:
+    """
+    通过 ls-remote 获取远程仓库 HEAD 提交，无需拉取任何对象。
+
+    参数:
+        path (Path): 仓库路径。
+
+    返回:
+        Optional[str]: 远程 HEAD 提交哈希，执行失败时返回 None。
+    """
+    try:
+        result = await git_run("ls-remote", "origin", "HEAD", repository=path, timeout=plugin_config.git_timeout)
+    except Exception as e:
+        logger.error(f"获取远程仓库 HEAD 时发生异常：{e}")
+        return None
+    if result.returncode != 0 or not result.stdout:
+        logger.error(f"获取远程仓库 HEAD 失败：{result.stderr}")
+        return None
+    return result.stdout.split()[0]
+
+
+@instrument_git("checkout")
+async def git_restore(path: Path, files: List[str]) -> bool:
+    """
+    从当前提交重新检出指定文件，用于修复损坏的工作区文件。
+
+    参数:
+        path (Path): 仓库路径。
+        files (List[str]): 相对仓库根目录的文件路径。
+
+    返回:
+        bool: 是否成功。
+    """
+    try:
+        result = await git_run("checkout", "HEAD", "--", *files, repository=path)
+    except Exception as e:
+        logger.error(f"重新检出文件时发生异常：{e}")
         return False
-    finally:
-        os.chdir(original_cwd)
-        if process and process.returncode is None:
-            logger.info("终止未结束的子进程")
-            process.terminate()
-            await process.wait()
+    if result.returncode != 0:
+        logger.error(f"重新检出文件失败：{result.stderr}")
+        return False
+    return True
@@ -0,0 +1,443 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import tempfile
+import functools
+import contextlib
+import multiprocessing
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple, TypeVar, Callable, Iterable, Optional, Awaitable
+
+import aiofiles
+from PIL import Image
+from nonebot import logger
+from nonebot_plugin_localstore import get_cache_dir
+
+from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackStore
+from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import registry
+from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json, list_jpg_files
+
+VARIANT_FORMATS = {"jpeg": ("JPEG", ".jpg"), "webp": ("WEBP", ".webp")}
+VARIANT_WORKERS = min(4, os.cpu_count() or 1)
+
+T = TypeVar("T")
+
+
+async def read_file(path: Path) -> bytes:
+    async with aiofiles.open(path, mode="rb") as file:
+        return await file.read()
+
+
+class ImageCache:
+    """按字节数限制容量的 LRU 图片缓存"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[Path, bytes]" = OrderedDict()
+
+    def __contains__(self, path: Path) -> bool:
+        return path in self._cache
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def get(self, path: Path, load: Optional[Callable[[], Awaitable[bytes]]] = None) -> bytes:
+        """
+        获取图片内容，未命中时读取并加入缓存。
+
+        参数:
+            path (Path): 图片路径，作为缓存键。
+            load (Optional[Callable[[], Awaitable[bytes]]]): 未命中时的读取方式，如从打包文件读取，默认读取 path。
+
+        返回:
+            bytes: 图片内容。
+        """
+        data = self._cache.get(path)
+        if data is not None:
+            self.hits += 1
+            self._cache.move_to_end(path)
+            return data
+        self.misses += 1
+        data = await (load or functools.partial(read_file, path))()
+        self.put(path, data)
+        return data
+
+    def put(self, path: Path, data: bytes) -> None:
+        """加入缓存，超出容量时淘汰最久未使用的图片，单张超出容量的图片不缓存"""
+        self.discard(path)
+        if len(data) > self.max_size:
+            return
+        self._cache[path] = data
+        self.size += len(data)
+        while self.size > self.max_size:
+            _, evicted = self._cache.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, path: Path) -> None:
+        data = self._cache.pop(path, None)
+        if data is not None:
+            self.size -= len(data)
+
+    def invalidate(self, paths: Iterable[Path]) -> None:
+        """使指定图片的缓存失效"""
+        for path in paths:
+            self.discard(path)
+
+    def invalidate_directory(self, directory: Path) -> None:
+        """使指定目录下所有图片的缓存失效"""
+        self.invalidate([path for path in self._cache if directory in path.parents])
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {"hits": self.hits, "misses": self.misses, "size": self.size, "count": len(self._cache)}
+
+
+image_cache = ImageCache(plugin_config.image_cache_size)
+# 只合并同一图片的并发读取，图片内容由 image_cache 在容量限制内保留
+image_flight: "SingleFlight[Tuple[Path, str], bytes]" = SingleFlight(0)
+image_packs = PackStore(get_cache_dir("nonebot_plugin_bh3_elysian_realm") / "packs")
+
+registry.counter("elysian_realm_image_cache_hits_total", "图片缓存命中次数", function=lambda: image_cache.hits)
+registry.counter("elysian_realm_image_cache_misses_total", "图片缓存未命中次数", function=lambda: image_cache.misses)
+registry.gauge("elysian_realm_image_cache_bytes", "图片缓存占用字节数", function=lambda: image_cache.size)
+registry.gauge("elysian_realm_image_cache_entries", "图片缓存条目数", function=lambda: len(image_cache))
+
+
+def variant_dir(variant: str, image_path: Optional[Path] = None) -> Path:
+    """压缩图片的缓存目录，image_path 之外的图片来源各自使用子目录"""
+    directory = get_cache_dir("nonebot_plugin_bh3_elysian_realm") / "variants" / variant
+    if image_path is None or image_path == plugin_config.image_path:
+        return directory
+    return directory / image_path.name
+
+
+def role_image_path(image_path: Path, role: str, variant: str = "original") -> Path:
+    """
+    角色攻略图片路径，指定的压缩图片尚未生成时回退到原图。
+
+    参数:
+        image_path (Path): 图片资源目录。
+        role (str): 角色文件名（不含扩展名）。
+        variant (str): 图片版本，original 为原图。
+
+    返回:
+        Path: 图片路径。
+    """
+    source = image_path / f"{role}.jpg"
+    if variant not in VARIANT_FORMATS:
+        return source
+    target = variant_dir(variant, image_path) / f"{role}{VARIANT_FORMATS[variant][1]}"
+    return target if target in image_cache or target.exists() else source
+
+
+_render_pool: Optional[Executor] = None
+_process_broken = False
+
+
+def render_pool() -> Executor:
+    """
+    绘制图片的进程池，首次使用时创建，之后的更新与总览图共用。
+
+    spawn 与 forkserver 启动的子进程会重新导入插件包，而插件包只能在 NoneBot 初始化后导入，
+    因此只以 fork 方式创建子进程；不支持 fork 的平台或进程池损坏后改用线程池。
+
+    返回:
+        Executor: 进程池或线程池。
+    """
+    global _render_pool
+    if _render_pool is None:
+        if not _process_broken and sys.platform != "darwin" and "fork" in multiprocessing.get_all_start_methods():
+            _render_pool = ProcessPoolExecutor(VARIANT_WORKERS, mp_context=multiprocessing.get_context("fork"))
+        else:
+            _render_pool = ThreadPoolExecutor(VARIANT_WORKERS, thread_name_prefix="elysian_realm_render")
+    return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    """关闭进程池，不等待子进程退出以免阻塞事件循环"""
+    global _render_pool
+    pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+async def run_in_render_pool(func: Callable[..., T], *args: Any) -> T:
+    """
+    在绘制进程池中执行函数，子进程异常退出导致进程池损坏时改用线程池重试一次。
+
+    参数:
+        func (Callable[..., T]): 可在子进程中执行的模块级函数。
+        args (Any): 参数。
+
+    返回:
+        T: 函数的返回值。
+    """
+    global _process_broken
+    loop = asyncio.get_running_loop()
+    pool = render_pool()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        if not _process_broken:
+            logger.warning("绘制进程池已损坏，改用线程池")
+            _process_broken = True
+        if _render_pool is pool:
+            shutdown_render_pool()
+        return await loop.run_in_executor(render_pool(), func, *args)
+
+
+def file_hash(path: Path) -> str:
+    """计算文件的 sha256"""
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_variant(
+    source: str, target: str, variant: str, max_width: int, quality: int, known_hash: Optional[str]
+) -> Tuple[str, bool]:
+    """
+    生成单张压缩图片，在子进程中执行。
+
+    源文件哈希与 known_hash 一致且目标文件存在时跳过。
+
+    返回:
+        Tuple[str, bool]: 源文件哈希与是否重新生成。
+    """
+    source_hash = file_hash(Path(source))
+    if source_hash == known_hash and os.path.exists(target):
+        return source_hash, False
+    image_format = VARIANT_FORMATS[variant][0]
+    with Image.open(source) as image:
+        # 转换模式并重新保存，不保留 EXIF 等元数据
+        rendition = image.convert("RGB")
+    if rendition.width > max_width:
+        height = round(rendition.height * max_width / rendition.width)
+        rendition = rendition.resize((max_width, height), Image.Resampling.LANCZOS)
+    # 临时文件名唯一，多个进程共用缓存目录时互不覆盖
+    fd, temp = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix=".tmp", dir=os.path.dirname(target))
+    os.close(fd)
+    try:
+        if image_format == "JPEG":
+            rendition.save(temp, image_format, quality=quality, optimize=True, progressive=True)
+        else:
+            rendition.save(temp, image_format, quality=quality, method=4)
+        os.replace(temp, target)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp)
+        raise
+    return source_hash, True
+
+
+async def build_variants(
+    image_path: Path,
+    variant: str,
+    max_width: int,
+    quality: int,
+    target_dir: Optional[Path] = None,
+) -> List[str]:
+    """
+    使用进程池增量生成压缩图片，仅处理内容或参数发生变化的图片。
+
+    参数:
+        image_path (Path): 图片资源目录。
+        variant (str): 图片版本，jpeg 或 webp，其它值不生成。
+        max_width (int): 最大宽度，超出时等比缩放。
+        quality (int): 压缩质量。
+        target_dir (Optional[Path]): 输出目录，默认为 localstore 缓存目录。
+
+    返回:
+        List[str]: 重新生成的角色列表。
+    """
+    if variant not in VARIANT_FORMATS:
+        return []
+    target_dir = target_dir or variant_dir(variant, image_path)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = target_dir / "manifest.json"
+    manifest: Dict[str, Dict] = json.loads(manifest_path.read_text("utf-8")) if manifest_path.exists() else {}
+    spec = {"max_width": max_width, "quality": quality}
+    suffix = VARIANT_FORMATS[variant][1]
+
+    new_manifest: Dict[str, Dict] = {}
+    pending: List[Tuple[str, Dict]] = []
+    for source in sorted(image_path.glob("*.jpg")):
+        role = source.stem
+        stat = source.stat()
+        entry = {"spec": spec, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        known = manifest.get(role, {})
+        # 源文件状态与参数均未变化时不再计算哈希
+        if all(known.get(key) == value for key, value in entry.items()) and (target_dir / f"{role}{suffix}").exists():
+            new_manifest[role] = known
+        else:
+            pending.append((role, entry))
+
+    results = await asyncio.gather(
+        *(
+            run_in_render_pool(
+                render_variant,
+                str(image_path / f"{role}.jpg"),
+                str(target_dir / f"{role}{suffix}"),
+                variant,
+                max_width,
+                quality,
+                manifest.get(role, {}).get("hash") if manifest.get(role, {}).get("spec") == spec else None,
+            )
+            for role, _ in pending
+        ),
+        return_exceptions=True,
+    )
+
+    rebuilt: List[str] = []
+    for (role, entry), result in zip(pending, results):
+        if isinstance(result, BaseException):
+            logger.error(f"生成压缩图片 {role} 失败: {result!r}")
+            continue
+        source_hash, rendered = result
+        new_manifest[role] = {"hash": source_hash, **entry}
+        if rendered:
+            rebuilt.append(role)
+    for role in set(manifest) - set(new_manifest):
+        (target_dir / f"{role}{suffix}").unlink(missing_ok=True)
+        rebuilt.append(role)
+    if new_manifest != manifest:
+        save_json(manifest_path, new_manifest, create=True)
+
+    image_cache.invalidate(target_dir / f"{role}{suffix}" for role in rebuilt)
+    if rebuilt:
+        logger.info(f"已生成 {len(rebuilt)} 张压缩图片")
+    return rebuilt
+
+
+def list_role_files(image_path: Path) -> List[str]:
+    """
+    列出图片目录中的角色，使用打包存储且打包文件可用时读取其索引而不遍历目录。
+
+    参数:
+        image_path (Path): 图片资源目录。
+
+    返回:
+        List[str]: 角色文件名（不含扩展名）。
+    """
+    if plugin_config.image_store == "packed":
+        roles = image_packs.roles(image_path, plugin_config.image_variant)
+        if roles is not None:
+            return roles
+    return list_jpg_files(image_path)
+
+
+async def build_image_pack(image_path: Path) -> Optional[Path]:
+    """
+    使用打包存储时，将图片目录中的全部图片（压缩图片优先）重新打包。
+
+    参数:
+        image_path (Path): 图片资源目录。
+
+    返回:
+        Optional[Path]: 打包文件路径，未使用打包存储或目录不存在时返回 None。
+    """
+    if plugin_config.image_store != "packed" or not image_path.is_dir():
+        return None
+    variant = plugin_config.image_variant
+    entries = [(role, role_image_path(image_path, role, variant)) for role in sorted(list_jpg_files(image_path))]
+    pack_file = await image_packs.build(image_path, variant, entries)
+    # 生成期间可能已从旧打包文件读取并缓存
+    image_cache.invalidate(path for _, path in entries)
+    return pack_file
+
+
+async def ensure_image_pack(image_path: Path) -> None:
+    """使用打包存储但打包文件不存在或已损坏时生成打包文件"""
+    if plugin_config.image_store == "packed" and image_packs.open(image_path, plugin_config.image_variant) is None:
+        await build_image_pack(image_path)
+
+
+async def load_role_image(image_path: Path, role: str) -> bytes:
+    """
+    读取角色攻略图片，优先使用缓存，使用打包存储时未命中则从打包文件读取。
+
+    参数:
+        image_path (Path): 图片资源目录。
+        role (str): 角色文件名（不含扩展名）。
+
+    返回:
+        bytes: 图片内容。
+    """
+    variant = plugin_config.image_variant
+    path = role_image_path(image_path, role, variant)
+    if plugin_config.image_store == "packed":
+
+        async def load() -> bytes:
+            packed = await image_packs.load(image_path, variant, role)
+            return packed if packed is not None else await read_file(path)
+
+        # 打包数据同样以图片路径为键缓存，图片或压缩图片更新时随之失效
+        data = await image_cache.get(path, load)
+    else:
+        data = await image_cache.get(path)
+    logger.debug(f"图片缓存统计: {image_cache.stats()}")
+    return data
+
+
+# 图片路径到 (修改时间, 大小, sha256)，文件未变化时不再计算摘要
+_digests: Dict[Path, Tuple[int, int, str]] = {}
+
+
+async def role_image_digest(image_path: Path, role: str) -> Optional[str]:
+    """
+    角色攻略图片内容的 sha256，与 load_role_image 读取的图片一致。
+
+    使用打包存储时取自打包索引，否则按文件的修改时间与大小缓存，文件变化时在线程池中重新计算。
+
+    参数:
+        image_path (Path): 图片资源目录。
+        role (str): 角色文件名（不含扩展名）。
+
+    返回:
+        Optional[str]: 摘要，图片不存在时返回 None。
+    """
+    if plugin_config.image_store == "packed":
+        pack = image_packs.open(image_path, plugin_config.image_variant)
+        if pack is not None and role in pack:
+            return pack.digest(role)
+    path = role_image_path(image_path, role, plugin_config.image_variant)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    cached = _digests.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    digest = await asyncio.get_running_loop().run_in_executor(None, file_hash, path)
+    _digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+async def prepare_role_image(image_path: Path, role: str) -> bytes:
+    """
+    准备角色攻略图片，同一角色的并发请求共享一次读取。
+
+    参数:
+        image_path (Path): 图片资源目录。
+        role (str): 角色文件名（不含扩展名）。
+
+    返回:
+        bytes: 图片内容。
+    """
+    return await image_flight.do((image_path, role), lambda: load_role_image(image_path, role))
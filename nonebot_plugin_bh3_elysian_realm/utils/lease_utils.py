@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import contextlib
+from pathlib import Path
+from typing import Any, Dict, Callable, Optional, Awaitable, NamedTuple
+
+from nonebot import logger
+
+# 抢占过期租约后等待该时间再确认，同时抢占的进程中只有最后写入的一方保留租约
+SETTLE_TIME = 0.1
+
+
+def write_atomic(path: Path, data: Dict[str, Any]) -> None:
+    """写入同目录临时文件后原子替换"""
+    temp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    temp.write_text(json.dumps(data), "utf-8")
+    os.replace(temp, path)
+
+
+def read_json(path: Path) -> Optional[Dict[str, Any]]:
+    """读取 JSON 文件，不存在或不完整时返回 None"""
+    try:
+        return json.loads(path.read_text("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class FileLease:
+    """
+    基于文件的跨进程租约。
+
+    租约文件记录持有者与过期时间，持有期间每 ttl / 3 秒续期一次；持有者异常退出后租约在 ttl 秒后过期，
+    其它进程可以抢占。获取时先写入临时文件再以 os.link 创建租约文件，文件已存在时失败，读者不会看到不完整的内容。
+    """
+
+    def __init__(self, lock_file: Path, ttl: float):
+        self.lock_file = lock_file
+        self.ttl = ttl
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self.lost = False
+        """续期时发现租约已被其它进程抢占"""
+        self._heartbeat: Optional["asyncio.Task[None]"] = None
+
+    def _content(self) -> Dict[str, Any]:
+        return {"owner": self.token, "pid": os.getpid(), "expires": time.time() + self.ttl}
+
+    def holder(self) -> Optional[Dict[str, Any]]:
+        return read_json(self.lock_file)
+
+    def is_held(self) -> bool:
+        """是否有未过期的租约，包括自己持有的"""
+        holder = self.holder()
+        if holder is None:
+            # 文件存在但无法读取时视为正在写入
+            return self.lock_file.exists()
+        return holder.get("expires", 0) > time.time()
+
+    def _create(self) -> bool:
+        content = json.dumps(self._content()).encode("utf-8")
+        temp = self.lock_file.with_name(f".{self.lock_file.name}.{uuid.uuid4().hex}.tmp")
+        temp.write_bytes(content)
+        try:
+            os.link(temp, self.lock_file)
+            return True
+        except FileExistsError:
+            return False
+        except OSError:
+            # 不支持硬链接的文件系统，改为独占创建后写入
+            try:
+                fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+            return True
+        finally:
+            temp.unlink(missing_ok=True)
+
+    async def try_acquire(self) -> bool:
+        """
+        尝试获取租约，租约被其它进程持有且未过期时返回 False。
+
+        返回:
+            bool: 是否获得租约。
+        """
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        if not self._create():
+            holder = self.holder()
+            if holder is None or holder.get("expires", 0) > time.time():
+                return False
+            logger.warning(f"租约 {self.lock_file} 已过期，持有者 {holder.get('owner')}，尝试抢占")
+            # 确认仍是刚才读到的过期租约后再替换
+            if self.holder() != holder:
+                return False
+            write_atomic(self.lock_file, self._content())
+            await asyncio.sleep(SETTLE_TIME)
+            if (self.holder() or {}).get("owner") != self.token:
+                return False
+        self.lost = False
+        self._heartbeat = asyncio.get_running_loop().create_task(self._renew())
+        return True
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            if (self.holder() or {}).get("owner") != self.token:
+                self.lost = True
+                logger.error(f"租约 {self.lock_file} 已被其它进程抢占")
+                return
+            write_atomic(self.lock_file, self._content())
+
+    async def release(self) -> None:
+        """释放租约，仅删除自己持有的租约文件"""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._heartbeat
+            self._heartbeat = None
+        if (self.holder() or {}).get("owner") == self.token:
+            self.lock_file.unlink(missing_ok=True)
+
+    async def wait_released(self, timeout: float, interval: float = 0.5) -> bool:
+        """
+        等待其它进程释放租约或租约过期。
+
+        返回:
+            bool: 超时前租约是否已释放。
+        """
+        deadline = time.monotonic() + timeout
+        while self.is_held():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(interval)
+        return True
+
+
+class Revision(NamedTuple):
+    serial: int
+    """每次更新递增"""
+    head: Optional[str]
+    """更新后的版本，如 git HEAD，无法确定时为 None"""
+    ok: bool
+    """更新是否成功"""
+
+
+class UpdateCoordinator:
+    """
+    多个进程共享同一资源目录时协调更新。
+
+    获得租约的进程执行更新并发布修订标记，其余进程等待租约释放后读取修订标记，
+    按发布的版本刷新自己的内存状态，而不再重复执行更新。
+    """
+
+    def __init__(self, directory: Path, ttl: float):
+        self.directory = directory
+        # 租约与修订标记放在目录旁，克隆前目录不存在时也可以使用，且不会出现在工作区中
+        self.lock_file = directory.parent / f".{directory.name}.lock"
+        self.revision_file = directory.parent / f".{directory.name}.revision.json"
+        self.ttl = ttl
+        self.seen: Optional[Revision] = self.published()
+
+    def published(self) -> Optional[Revision]:
+        """读取已发布的修订标记"""
+        data = read_json(self.revision_file)
+        if data is None:
+            return None
+        return Revision(data.get("serial", 0), data.get("head"), data.get("ok", False))
+
+    def publish(self, head: Optional[str], ok: bool) -> Revision:
+        published = self.published()
+        revision = Revision((published.serial if published else 0) + 1, head, ok)
+        write_atomic(self.revision_file, {**revision._asdict(), "time": time.time()})
+        self.seen = revision
+        return revision
+
+    async def sync(self, refresh: Callable[[Optional[str], Optional[str]], Awaitable[None]]) -> Optional[Revision]:
+        """
+        其它进程发布了新的修订时刷新内存状态。
+
+        参数:
+            refresh (Callable[[Optional[str], Optional[str]], Awaitable[None]]): 以旧版本与新版本调用的刷新函数。
+
+        返回:
+            Optional[Revision]: 最新的修订标记。
+        """
+        published = self.published()
+        if published is not None and published != self.seen:
+            seen, self.seen = self.seen, published
+            if published.ok and (seen is None or seen.head != published.head or published.head is None):
+                logger.info(f"资源目录 {self.directory} 已由其它进程更新，刷新本地状态")
+                await refresh(seen.head if seen else None, published.head)
+        return published
+
+    async def run(
+        self,
+        update: Callable[[], Awaitable[bool]],
+        head: Callable[[], Awaitable[Optional[str]]],
+        refresh: Callable[[Optional[str], Optional[str]], Awaitable[None]],
+        timeout: float,
+    ) -> bool:
+        """
+        获得租约时执行更新并发布修订，否则等待持有租约的进程完成并采用其结果。
+
+        参数:
+            update (Callable[[], Awaitable[bool]]): 更新函数。
+            head (Callable[[], Awaitable[Optional[str]]]): 获取更新后版本的函数。
+            refresh (Callable[[Optional[str], Optional[str]], Awaitable[None]]): 采用其它进程的结果时调用的刷新函数。
+            timeout (float): 等待其它进程的最长时间。
+
+        返回:
+            bool: 更新是否成功。
+        """
+        await self.sync(refresh)
+        lease = FileLease(self.lock_file, self.ttl)
+        if await lease.try_acquire():
+            ok = False
+            try:
+                ok = await update()
+            finally:
+                if not lease.lost:
+                    self.publish(await head(), ok)
+                await lease.release()
+            return ok
+        logger.info(f"资源目录 {self.directory} 正由其它进程更新，等待其完成")
+        if not await lease.wait_released(timeout):
+            logger.error(f"等待其它进程更新 {self.directory} 超时")
+            return False
+        published = await self.sync(refresh)
+        return published is not None and published.ok
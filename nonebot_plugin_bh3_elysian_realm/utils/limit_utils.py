@@ -0,0 +1,175 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Tuple, Hashable, Optional
+
+from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+
+# 每个限流器最多记录的键数，超出时淘汰最久未使用的键
+MAX_KEYS = 10000
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多积累 capacity 个"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        """取出一个令牌，没有可用令牌时返回 False"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """按键分别限流的令牌桶集合，rate 不大于 0 时不限流"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = MAX_KEYS):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def allow(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """
+        判断 key 的请求是否放行，放行时消耗一个令牌。
+
+        参数:
+            key (Hashable): 限流键，如用户或群。
+            now (Optional[float]): 当前时间，默认为 time.monotonic()。
+
+        返回:
+            bool: 是否放行。
+        """
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+class QueryDeduplicator:
+    """记录近期的查询，window 秒内重复的查询只处理第一次，window 不大于 0 时不去重"""
+
+    def __init__(self, window: float, max_keys: int = MAX_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        self._seen: Dict[Tuple[Any, ...], float] = {}
+
+    def is_duplicate(self, key: Tuple[Any, ...], now: Optional[float] = None) -> bool:
+        """
+        判断查询是否与 window 秒内的查询重复，不重复时记录本次查询。
+
+        参数:
+            key (Tuple[Any, ...]): 查询键，如 (群, 查询内容)。
+            now (Optional[float]): 当前时间，默认为 time.monotonic()。
+
+        返回:
+            bool: 是否重复。
+        """
+        now = time.monotonic() if now is None else now
+        if self.seen(key, now):
+            return True
+        self.record(key, now)
+        return False
+
+    def seen(self, key: Tuple[Any, ...], now: Optional[float] = None) -> bool:
+        """判断查询是否与 window 秒内的查询重复，不记录本次查询"""
+        if self.window <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+        seen = self._seen.get(key)
+        return seen is not None and now - seen < self.window
+
+    def record(self, key: Tuple[Any, ...], now: Optional[float] = None) -> None:
+        """记录本次查询，window 秒内的相同查询视为重复"""
+        if self.window <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        if len(self._seen) >= self.max_keys:
+            self._seen = {k: v for k, v in self._seen.items() if now - v < self.window}
+            if len(self._seen) >= self.max_keys:
+                self._seen.pop(next(iter(self._seen)))
+        self._seen[key] = now
+
+    def clear(self) -> None:
+        self._seen.clear()
+
+
+class ConcurrencyLimit:
+    """限制同时进行的操作数，limit 不大于 0 时不限制，信号量在首次使用时创建"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> None:
+        if self.limit <= 0:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        await self._semaphore.acquire()
+
+    async def __aexit__(self, *_: object) -> None:
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+user_limiter = RateLimiter(plugin_config.rate_limit_user, plugin_config.rate_limit_user_burst)
+group_limiter = RateLimiter(plugin_config.rate_limit_group, plugin_config.rate_limit_group_burst)
+query_deduplicator = QueryDeduplicator(plugin_config.query_dedup_window)
+image_send_limit = ConcurrencyLimit(plugin_config.image_send_concurrency)
+
+
+def admit_query(adapter: str, user_id: str, group_id: Optional[str], query: str) -> Optional[str]:
+    """
+    在读取昵称与图片之前判断查询是否处理。
+
+    同一群 query_dedup_window 秒内的相同查询只回复一次，其余查询依次经过群与用户的令牌桶，
+    只有放行的查询才记录为已回复，被限流的查询不影响其他成员的相同查询。
+
+    参数:
+        adapter (str): 适配器名称，不同适配器的 ID 互不冲突。
+        user_id (str): 用户 ID。
+        group_id (Optional[str]): 群或频道 ID，私聊为 None。
+        query (str): 查询内容。
+
+    返回:
+        Optional[str]: 不处理的原因 duplicate 或 rate_limited，处理时返回 None。
+    """
+    dedup_key = (adapter, group_id, query) if group_id is not None and query else None
+    if group_id is not None:
+        if dedup_key is not None and query_deduplicator.seen(dedup_key):
+            return "duplicate"
+        if not group_limiter.allow((adapter, group_id)):
+            return "rate_limited"
+    if not user_limiter.allow((adapter, user_id)):
+        return "rate_limited"
+    if dedup_key is not None:
+        query_deduplicator.record(dedup_key)
+    return None
+
+
+def reset_limits() -> None:
+    """清空全部限流与去重状态"""
+    user_limiter.clear()
+    group_limiter.clear()
+    query_deduplicator.clear()
@@ -0,0 +1,111 @@
+import json
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, NamedTuple
+
+from PIL import Image
+from nonebot import logger
+
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    hash: str
+    valid: bool
+    """能否被完整解码"""
+
+
+class ScanResult(NamedTuple):
+    checked: List[str]
+    """重新计算哈希的文件"""
+    corrupt: List[str]
+    """无法解码的文件"""
+    removed: List[str]
+    """已不存在的文件"""
+
+
+def inspect_image(path: Path) -> ManifestEntry:
+    """
+    计算图片的哈希并尝试完整解码，截断或损坏的图片标记为无效。
+
+    参数:
+        path (Path): 图片路径。
+
+    返回:
+        ManifestEntry: 清单条目。
+    """
+    stat = path.stat()
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    try:
+        with Image.open(path) as image:
+            image.load()
+        valid = True
+    except (OSError, SyntaxError, ValueError) as e:
+        logger.debug(f"图片 {path} 解码失败: {e!r}")
+        valid = False
+    return ManifestEntry(stat.st_size, stat.st_mtime_ns, digest.hexdigest(), valid)
+
+
+class ImageManifest:
+    """
+    图片目录的内容清单，记录每张图片的大小、修改时间、哈希与能否解码。
+
+    扫描时只重新检查大小或修改时间发生变化的文件，未变化的文件沿用上次的结果。
+    """
+
+    def __init__(self, manifest_file: Path):
+        self.manifest_file = manifest_file
+        self.entries: Dict[str, ManifestEntry] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            data = json.loads(self.manifest_file.read_text("utf-8"))
+            self.entries = {name: ManifestEntry(*entry) for name, entry in data.items()}
+        except (OSError, ValueError, TypeError):
+            self.entries = {}
+
+    def save(self) -> None:
+        save_json(self.manifest_file, {name: list(entry) for name, entry in self.entries.items()}, create=True)
+
+    def scan(self, image_path: Path) -> ScanResult:
+        """
+        扫描图片目录并更新清单。
+
+        参数:
+            image_path (Path): 图片资源目录。
+
+        返回:
+            ScanResult: 本次重新检查、无法解码与已删除的文件。
+        """
+        checked: List[str] = []
+        entries: Dict[str, ManifestEntry] = {}
+        for path in sorted(image_path.glob("*.jpg")):
+            stat = path.stat()
+            entry = self.entries.get(path.name)
+            if entry is None or entry.size != stat.st_size or entry.mtime_ns != stat.st_mtime_ns:
+                entry = inspect_image(path)
+                checked.append(path.name)
+            entries[path.name] = entry
+        removed = sorted(set(self.entries) - set(entries))
+        self.entries = entries
+        if checked or removed:
+            self.save()
+        corrupt = [name for name, entry in entries.items() if not entry.valid]
+        return ScanResult(checked, corrupt, removed)
+
+    async def scan_async(self, image_path: Path) -> ScanResult:
+        """在线程池中扫描，不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.scan, image_path)
+
+    def digest(self, name: str) -> Optional[str]:
+        entry = self.entries.get(name)
+        return entry.hash if entry is not None else None
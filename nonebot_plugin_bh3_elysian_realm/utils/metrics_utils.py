@@ -0,0 +1,271 @@
+import time
+import bisect
+import functools
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple, Callable, Iterator, Optional, Sequence
+
+from nonebot.drivers import Request, Response
+from nonebot.exception import MatcherException
+
+# 默认的延迟分桶（秒），覆盖从内存查询到长时间的 git 操作
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    """按 Prometheus 文本格式输出标签，转义反斜杠、换行与双引号"""
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 的标签应为 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Value(Metric):
+    """单个数值的指标，function 不为 None 时在输出时读取其返回值"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values: Dict[LabelValues, float] = {}
+
+    def value(self, **labels: str) -> float:
+        if self.function is not None:
+            return self.function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        if self.function is not None:
+            yield f"{self.name} {format_value(self.function())}"
+            return
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+
+
+class Counter(Value):
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Value):
+    """可增可减的数值"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """按分桶累计观测值的直方图"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各分桶计数..., 总和]，分桶计数不累计，输出时再累加
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def count(self, **labels: str) -> int:
+        counts = self._values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """记录 with 语句块的耗时，异常退出时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in sorted(self._values.items()):
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, ("le", format_value(bound)))
+                yield f"{self.name}_bucket{labels} {format_value(cumulative)}"
+            labels = format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {format_value(counts[-1])}"
+            yield f"{self.name}_count{labels} {format_value(cumulative)}"
+
+
+class MetricsRegistry:
+    """插件的全部指标，以 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已存在")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs: Any) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, **kwargs))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs: Any) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, **kwargs))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs: Any) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+queries_total = registry.counter(
+    "elysian_realm_queries_total",
+    "乐土攻略查询次数，result 为 hit/suggest/miss/missing_image/loading/duplicate/rate_limited",
+    ["result"],
+)
+lookup_seconds = registry.histogram("elysian_realm_lookup_seconds", "角色昵称查找耗时")
+image_load_seconds = registry.histogram("elysian_realm_image_load_seconds", "攻略图片读取耗时")
+send_seconds = registry.histogram("elysian_realm_send_seconds", "回复消息发送耗时", ["matcher"])
+handler_seconds = registry.histogram("elysian_realm_handler_seconds", "事件处理函数耗时", ["handler"])
+handler_errors_total = registry.counter("elysian_realm_handler_errors_total", "事件处理函数异常次数", ["handler"])
+job_seconds = registry.histogram("elysian_realm_job_seconds", "资源任务耗时", ["job"])
+job_failures_total = registry.counter("elysian_realm_job_failures_total", "资源任务失败次数", ["job"])
+git_seconds = registry.histogram("elysian_realm_git_seconds", "git 操作耗时", ["command"])
+git_failures_total = registry.counter("elysian_realm_git_failures_total", "git 操作失败次数", ["command"])
+
+
+def instrument_handler(name: str) -> Callable:
+    """
+    记录事件处理函数的耗时与异常次数。
+
+    matcher 的 finish/reject 等流程控制异常不计为异常。保留原函数签名，依赖注入不受影响。
+
+    参数:
+        name (str): 指标中的 handler 标签。
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with handler_seconds.time(handler=name):
+                try:
+                    return await func(*args, **kwargs)
+                except MatcherException:
+                    raise
+                except Exception:
+                    handler_errors_total.inc(handler=name)
+                    raise
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(histogram: Histogram, failures: Counter, failed: Callable[[Any], bool], **labels: str) -> Callable:
+    """
+    记录协程函数的耗时，抛出异常或 failed(返回值) 为真时计为失败。
+
+    参数:
+        histogram (Histogram): 耗时直方图。
+        failures (Counter): 失败计数器。
+        failed (Callable[[Any], bool]): 根据返回值判断是否失败。
+        labels (str): 指标标签。
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with histogram.time(**labels):
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception:
+                    failures.inc(**labels)
+                    raise
+            if failed(result):
+                failures.inc(**labels)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_job(name: str) -> Callable:
+    """记录资源任务的耗时，返回 False 或抛出异常时计为失败"""
+    return instrument(job_seconds, job_failures_total, lambda result: result is False, job=name)
+
+
+def instrument_git(command: str) -> Callable:
+    """记录 git 操作的耗时，返回 False、None 或抛出异常时计为失败"""
+    return instrument(
+        git_seconds, git_failures_total, lambda result: result is None or result is False, command=command
+    )
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """以 Prometheus 文本格式返回全部指标"""
+    return Response(200, headers={"Content-Type": CONTENT_TYPE}, content=registry.render())
@@ -0,0 +1,387 @@
+import asyncio
+import unicodedata
+from pathlib import Path
+from bisect import bisect_left
+from types import MappingProxyType
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Set, Dict, List, Tuple, Mapping, Iterable, Optional, NamedTuple
+
+from nonebot import logger
+from nonebot_plugin_localstore import get_data_file
+
+from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter, load_json
+from nonebot_plugin_bh3_elysian_realm.utils.sqlite_utils import AliasEdit, NicknameStore
+
+FileSignature = Tuple[str, int, int]
+
+# 模糊匹配参数，限制单次查询的开销
+MAX_QUERY_LENGTH = 32
+MAX_POSTINGS = 256
+MAX_CANDIDATES = 32
+MISS_CACHE_SIZE = 256
+AUTO_RESOLVE_SCORE = 0.75
+AUTO_RESOLVE_MARGIN = 0.1
+SUGGEST_SCORE = 0.5
+
+
+class MatchResult(NamedTuple):
+    role: Optional[str]
+    """唯一确定的角色，无法确定时为 None"""
+    suggestions: Tuple[str, ...] = ()
+    """候选昵称，按相似度降序"""
+
+
+def normalize_alias(alias: str) -> str:
+    """
+    规范化昵称：统一全角/半角字符、转为小写并去除所有空白。
+
+    参数:
+        alias (str): 原始昵称。
+
+    返回:
+        str: 规范化后的昵称。
+    """
+    return "".join(unicodedata.normalize("NFKC", alias).lower().split())
+
+
+def alias_grams(alias: str) -> Set[str]:
+    """生成昵称的单字与双字 n-gram"""
+    return set(alias) | {alias[i : i + 2] for i in range(len(alias) - 1)}
+
+
+def file_signature(path: Path) -> Optional[FileSignature]:
+    """
+    获取文件的签名（路径、修改时间、大小），用于判断文件是否被外部修改。
+
+    参数:
+        path (Path): 文件路径。
+
+    返回:
+        Optional[FileSignature]: 文件签名，文件不存在时返回 None。
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+class NicknameIndex:
+    """昵称反向索引，构建完成后不可修改"""
+
+    def __init__(self, data: Mapping[str, List[str]], signature: Optional[FileSignature] = None):
+        self.roles: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {key: tuple(values) for key, values in data.items()}
+        )
+        aliases: Dict[str, str] = {}
+        normalized: Dict[str, str] = {}
+        for key, values in self.roles.items():
+            for value in values:
+                # 与 find_key_by_value 保持一致，重复昵称以先出现的角色为准
+                aliases.setdefault(value, key)
+                normalized.setdefault(normalize_alias(value), value)
+        self.aliases: Mapping[str, str] = MappingProxyType(aliases)
+        self.signature = signature
+
+        # 模糊匹配索引：规范化昵称 -> 原始昵称、有序昵称表（前缀匹配）、n-gram 倒排表
+        self._normalized: Mapping[str, str] = MappingProxyType(normalized)
+        self._sorted: List[str] = sorted(normalized)
+        grams: Dict[str, List[str]] = {}
+        for alias in self._sorted:
+            for gram in alias_grams(alias):
+                grams.setdefault(gram, []).append(alias)
+        self._grams: Mapping[str, List[str]] = MappingProxyType(grams)
+        self._misses: "OrderedDict[Tuple[str, int], MatchResult]" = OrderedDict()
+
+    def find(self, alias: str) -> Optional[str]:
+        """O(1) 查找昵称对应的角色"""
+        role = self.aliases.get(alias)
+        if role is None:
+            original = self._normalized.get(normalize_alias(alias))
+            role = self.aliases[original] if original is not None else None
+        return role
+
+    def match(self, query: str, limit: int = 3) -> MatchResult:
+        """
+        查找角色，精确匹配失败时依次尝试前缀匹配与 n-gram 模糊匹配。
+
+        仅有一个角色足够相似时直接返回该角色，否则返回至多 limit 个候选昵称。
+        未命中的结果会被缓存，重复的无效查询无需再次计算。
+
+        参数:
+            query (str): 用户输入的昵称。
+            limit (int): 候选昵称数量上限。
+
+        返回:
+            MatchResult: 匹配结果。
+        """
+        role = self.find(query)
+        if role is not None:
+            return MatchResult(role)
+
+        normalized = normalize_alias(query)[:MAX_QUERY_LENGTH]
+        if not normalized:
+            return MatchResult(None)
+        key = (normalized, limit)
+        cached = self._misses.get(key)
+        if cached is not None:
+            self._misses.move_to_end(key)
+            return cached
+
+        result = self._fuzzy_match(normalized, limit)
+        if result.role is None:
+            self._misses[key] = result
+            if len(self._misses) > MISS_CACHE_SIZE:
+                self._misses.popitem(last=False)
+        return result
+
+    def match_many(self, queries: Iterable[str], limit: int = 3) -> Dict[str, MatchResult]:
+        """
+        在同一份索引上依次查找多个角色，重复的查询只匹配一次。
+
+        参数:
+            queries (Iterable[str]): 用户输入的昵称。
+            limit (int): 每个查询的候选昵称数量上限。
+
+        返回:
+            Dict[str, MatchResult]: 按查询顺序排列的匹配结果。
+        """
+        return {query: self.match(query, limit) for query in dict.fromkeys(queries)}
+
+    def _fuzzy_match(self, query: str, limit: int) -> MatchResult:
+        prefixed: List[str] = []
+        start = bisect_left(self._sorted, query)
+        for alias in self._sorted[start : start + MAX_CANDIDATES]:
+            if not alias.startswith(query):
+                break
+            prefixed.append(alias)
+        prefixed_roles = {self.aliases[self._normalized[alias]] for alias in prefixed}
+        if len(prefixed_roles) == 1:
+            return MatchResult(prefixed_roles.pop())
+
+        shared: Dict[str, int] = {}
+        for gram in alias_grams(query):
+            for alias in self._grams.get(gram, ())[:MAX_POSTINGS]:
+                shared[alias] = shared.get(alias, 0) + 1
+        candidates = set(prefixed) | set(sorted(shared, key=shared.__getitem__, reverse=True)[:MAX_CANDIDATES])
+
+        # 每个角色只保留得分最高的昵称
+        best: Dict[str, Tuple[float, str]] = {}
+        for alias in candidates:
+            score = SequenceMatcher(None, query, alias).ratio()
+            original = self._normalized[alias]
+            role = self.aliases[original]
+            if role not in best or score > best[role][0]:
+                best[role] = (score, original)
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], item[1][1]))
+
+        if ranked and ranked[0][1][0] >= AUTO_RESOLVE_SCORE:
+            if len(ranked) == 1 or ranked[0][1][0] - ranked[1][1][0] >= AUTO_RESOLVE_MARGIN:
+                return MatchResult(ranked[0][0])
+        return MatchResult(None, tuple(alias for _, (score, alias) in ranked[:limit] if score >= SUGGEST_SCORE))
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        """导出可修改的 nickname 字典副本"""
+        return {key: list(values) for key, values in self.roles.items()}
+
+
+class NicknameIndexManager:
+    """
+    常驻昵称索引，仅在数据变化时重建并整体替换。
+
+    未指定 store 时以 nickname.json 为数据源；指定 store 时以 SQLite 昵称库为数据源，
+    首次使用时从 nickname.json 导入，之后的修改导出回 nickname.json 以保持上游格式。
+    """
+
+    def __init__(self, writer: JsonWriter, store: Optional[NicknameStore] = None):
+        self.writer = writer
+        self.store = store
+        self._index: Optional[NicknameIndex] = None
+        self._migrated = False
+        self.watched = False
+        """nickname.json 由文件监视负责重新加载，查询时不再检查文件签名"""
+
+    async def get(self, nickname_path: Path) -> NicknameIndex:
+        """
+        获取当前索引，文件签名变化（包括外部修改）时重新加载。
+
+        参数:
+            nickname_path (Path): nickname.json 路径。
+
+        返回:
+            NicknameIndex: 当前索引。
+        """
+        if self.store is not None:
+            return await self._get_stored(nickname_path)
+        index = self._index
+        if self.watched and index is not None:
+            return index
+        signature = file_signature(nickname_path)
+        if index is None or index.signature != signature:
+            logger.debug(f"重建昵称索引: {nickname_path}")
+            index = NicknameIndex(await load_json(nickname_path), signature)
+            self._index = index
+        return index
+
+    async def _get_stored(self, nickname_path: Path) -> NicknameIndex:
+        assert self.store is not None
+        loop = asyncio.get_running_loop()
+        if not self._migrated:
+            await loop.run_in_executor(None, self.store.migrate, nickname_path)
+            self._migrated = True
+        # 先取签名再读取，读取期间的提交会在下次查询时重新加载
+        signature = self.store.signature()
+        index = self._index
+        if index is None or index.signature != signature:
+            logger.debug(f"重建昵称索引: {self.store.db_file}")
+            index = NicknameIndex(await loop.run_in_executor(None, self.store.load), signature)
+            self._index = index
+        return index
+
+    async def add_aliases(self, nickname_path: Path, role: str, aliases: List[str]) -> AliasEdit:
+        """
+        为角色添加昵称，基于最新数据修改，并发的编辑不会相互覆盖。
+
+        已属于其它角色的昵称不会写入，在返回值中列出。
+
+        参数:
+            nickname_path (Path): nickname.json 路径。
+            role (str): 角色，即图片文件名，不存在时抛出 KeyError。
+            aliases (List[str]): 要添加的昵称。
+
+        返回:
+            AliasEdit: 新增与冲突的昵称。
+        """
+        if self.store is not None:
+            await self.get(nickname_path)
+            edit = await asyncio.get_running_loop().run_in_executor(None, self.store.add_aliases, role, aliases)
+            if edit.added:
+                await self._stored_changed(nickname_path)
+            return edit
+        index = await self.get(nickname_path)
+        if role not in index.roles:
+            raise KeyError(role)
+        data = index.to_dict()
+        added: List[str] = []
+        conflicts: Dict[str, str] = {}
+        for alias in dict.fromkeys(aliases):
+            owner = index.aliases.get(alias)
+            if owner is None:
+                data[role].append(alias)
+                added.append(alias)
+            elif owner != role:
+                conflicts[alias] = owner
+        if added:
+            self.save(nickname_path, data)
+        return AliasEdit(added, conflicts)
+
+    async def add_roles(self, nickname_path: Path, roles: List[str]) -> List[str]:
+        """
+        添加没有昵称的角色。
+
+        参数:
+            nickname_path (Path): nickname.json 路径。
+            roles (List[str]): 角色列表，已存在的角色被忽略。
+
+        返回:
+            List[str]: 新增的角色。
+        """
+        if self.store is not None:
+            await self.get(nickname_path)
+            added = await asyncio.get_running_loop().run_in_executor(None, self.store.add_roles, roles)
+            if added:
+                await self._stored_changed(nickname_path)
+            return added
+        index = await self.get(nickname_path)
+        added = [role for role in dict.fromkeys(roles) if role not in index.roles]
+        if added:
+            self.save(nickname_path, {**index.to_dict(), **{role: [] for role in added}})
+        return added
+
+    async def _stored_changed(self, nickname_path: Path) -> None:
+        # 昵称库提交后重建索引，并在合并窗口结束后导出 nickname.json
+        self._index = None
+        index = await self.get(nickname_path)
+        self.writer.schedule(nickname_path, index.to_dict())
+
+    def update(self, nickname_path: Path, data: Mapping[str, List[str]]) -> NicknameIndex:
+        """
+        nickname.json 写入后使用新数据直接替换索引，避免再次读取文件。
+
+        参数:
+            nickname_path (Path): nickname.json 路径。
+            data (Mapping[str, List[str]]): 已写入的数据。
+
+        返回:
+            NicknameIndex: 新索引。
+        """
+        index = NicknameIndex(data, file_signature(nickname_path))
+        self._index = index
+        return index
+
+    def save(self, nickname_path: Path, data: Mapping[str, List[str]]) -> NicknameIndex:
+        """
+        立即替换索引，并在合并窗口结束后于事件循环外原子写入 nickname.json。
+
+        参数:
+            nickname_path (Path): nickname.json 路径。
+            data (Mapping[str, List[str]]): 要保存的数据。
+
+        返回:
+            NicknameIndex: 新索引。
+        """
+        index = self.update(nickname_path, data)
+        self.writer.schedule(nickname_path, dict(data), on_written=lambda: self._written(nickname_path, index))
+        return index
+
+    def _written(self, nickname_path: Path, index: NicknameIndex) -> None:
+        # 写入完成后刷新签名，避免被当作外部修改重新加载
+        if self._index is index:
+            index.signature = file_signature(nickname_path)
+
+    async def flush(self) -> None:
+        """立即写入所有待保存的数据"""
+        await self.writer.flush()
+
+    async def reload(self, nickname_path: Path) -> bool:
+        """
+        nickname.json 被外部修改时重新加载。
+
+        文件签名与当前索引一致（本进程写入后已刷新签名）或仍有待写入的修改时不重新加载，
+        以免用磁盘上的旧数据覆盖尚未写入的修改。
+
+        参数:
+            nickname_path (Path): nickname.json 路径。
+
+        返回:
+            bool: 是否重新加载。
+        """
+        if self.writer.is_pending(nickname_path):
+            return False
+        index = self._index
+        signature = file_signature(nickname_path)
+        if index is not None and index.signature == signature:
+            return False
+        logger.debug(f"重建昵称索引: {nickname_path}")
+        data = await load_json(nickname_path)
+        # 读取期间保存的修改优先
+        if self._index is not index or self.writer.is_pending(nickname_path):
+            return False
+        self._index = NicknameIndex(data, signature)
+        return True
+
+    def invalidate(self) -> None:
+        """丢弃当前索引，下次查询时重新加载"""
+        self._index = None
+
+
+nickname_index = NicknameIndexManager(
+    JsonWriter(plugin_config.nickname_save_delay),
+    (
+        NicknameStore(get_data_file("nonebot_plugin_bh3_elysian_realm", "nickname.db"))
+        if plugin_config.nickname_store == "sqlite"
+        else None
+    ),
+)
@@ -0,0 +1,126 @@
+import json
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Tuple, Callable, Iterable, Optional
+
+from nonebot import logger
+import nonebot_plugin_saa as saa
+from nonebot.adapters import Bot
+from nonebot_plugin_saa import (
+    PlatformTarget,
+    TargetQQPrivate,
+    TargetOB12Unknow,
+    TargetFeishuPrivate,
+    TargetTelegramCommon,
+    TargetKaiheilaPrivate,
+)
+
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json
+from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import ConcurrencyLimit
+
+
+class NotifyState:
+    """上次已通知的缺失昵称列表，持久化以便重启后不重复通知"""
+
+    def __init__(self, state_file: Path):
+        self.state_file = state_file
+        self._missing: Optional[List[str]] = None
+
+    @property
+    def missing(self) -> List[str]:
+        if self._missing is None:
+            try:
+                self._missing = list(json.loads(self.state_file.read_text("utf-8")).get("missing", []))
+            except (OSError, ValueError):
+                self._missing = []
+        return self._missing
+
+    def save(self, missing: Iterable[str]) -> None:
+        self._missing = sorted(missing)
+        try:
+            save_json(self.state_file, {"missing": self._missing}, create=True)
+        except OSError as e:
+            logger.warning(f"保存通知状态失败：{e}")
+
+
+def _onebot_v12_private(bot: Bot, user_id: str) -> PlatformTarget:
+    platform = getattr(bot, "platform", "")
+    if platform == "qq":
+        return TargetQQPrivate(user_id=int(user_id))
+    return TargetOB12Unknow(platform=platform, detail_type="private", user_id=user_id)
+
+
+# 各适配器私聊目标的构造方式，未登记的适配器不发送通知
+private_targets: Dict[str, Callable[[Bot, str], PlatformTarget]] = {
+    "OneBot V11": lambda _, user_id: TargetQQPrivate(user_id=int(user_id)),
+    "OneBot V12": _onebot_v12_private,
+    "RedProtocol": lambda _, user_id: TargetQQPrivate(user_id=int(user_id)),
+    "Telegram": lambda _, user_id: TargetTelegramCommon(chat_id=user_id),
+    "Kaiheila": lambda _, user_id: TargetKaiheilaPrivate(user_id=user_id),
+    "Feishu": lambda _, user_id: TargetFeishuPrivate(open_id=user_id),
+}
+
+
+def superuser_targets(bots: Iterable[Bot], superusers: Iterable[str]) -> List[Tuple[Bot, PlatformTarget]]:
+    """
+    为每个 Bot 生成超级用户的私聊目标，同一目标只使用第一个可用的 Bot。
+
+    超级用户可以写作 "onebot:123" 只匹配对应适配器，不带前缀时匹配所有适配器，与 SUPERUSER 权限的规则一致。
+
+    参数:
+        bots (Iterable[Bot]): 已连接的 Bot。
+        superusers (Iterable[str]): 超级用户。
+
+    返回:
+        List[Tuple[Bot, PlatformTarget]]: Bot 与发送目标。
+    """
+    targets: Dict[str, Tuple[Bot, PlatformTarget]] = {}
+    for bot in bots:
+        adapter = bot.adapter.get_name()
+        build = private_targets.get(adapter)
+        if build is None:
+            logger.debug(f"适配器 {adapter} 不支持发送私聊通知")
+            continue
+        prefix = adapter.split(maxsplit=1)[0].lower()
+        for superuser in superusers:
+            scope, _, user_id = superuser.rpartition(":")
+            if scope and scope != prefix:
+                continue
+            try:
+                target = build(bot, user_id)
+            except ValueError:
+                logger.debug(f"超级用户 {superuser} 不是适配器 {adapter} 的用户")
+                continue
+            targets.setdefault(target.json(), (bot, target))
+    return list(targets.values())
+
+
+async def notify_superusers(
+    message: saa.MessageFactory, bots: Iterable[Bot], superusers: Iterable[str], concurrency: int
+) -> Tuple[int, int]:
+    """
+    向所有 Bot 上的超级用户并发发送消息，同时发送的数量不超过 concurrency，单个目标发送失败不影响其它目标。
+
+    参数:
+        message (saa.MessageFactory): 要发送的消息。
+        bots (Iterable[Bot]): 已连接的 Bot。
+        superusers (Iterable[str]): 超级用户。
+        concurrency (int): 最大并发数，不大于 0 时不限制。
+
+    返回:
+        Tuple[int, int]: 发送成功与失败的目标数。
+    """
+    limit = ConcurrencyLimit(concurrency)
+
+    async def send(bot: Bot, target: PlatformTarget) -> bool:
+        async with limit:
+            try:
+                await message.send_to(target, bot)
+                return True
+            except Exception as e:
+                logger.warning(f"通过 {bot.adapter.get_name()} {bot.self_id} 向 {target} 发送通知失败: {e!r}")
+                return False
+
+    results = await asyncio.gather(*(send(bot, target) for bot, target in superuser_targets(bots, superusers)))
+    delivered = sum(results)
+    return delivered, len(results) - delivered
@@ -0,0 +1,239 @@
+import os
+import json
+import math
+import asyncio
+import hashlib
+import tempfile
+import functools
+import contextlib
+from pathlib import Path
+from typing import List, Tuple, Mapping, Callable, Optional, Sequence, NamedTuple
+
+import aiofiles
+from nonebot import logger
+from nonebot_plugin_localstore import get_cache_dir
+from PIL import Image, ImageOps, ImageDraw, ImageFont
+
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json
+from nonebot_plugin_bh3_elysian_realm.utils.image_utils import run_in_render_pool
+
+# 修改绘制方式时递增，使已缓存的缩略图失效
+TILE_VERSION = 1
+CAPTION_HEIGHT = 36
+PADDING = 8
+BACKGROUND = (245, 245, 245)
+# 超过该数量的缩略图需要重新绘制时在进程池中绘制
+PROCESS_THRESHOLD = 32
+# 未指定字体时依次尝试的常见中文字体
+DEFAULT_FONTS = (
+    "msyh.ttc",
+    "simhei.ttf",
+    "PingFang.ttc",
+    "NotoSansCJK-Regular.ttc",
+    "NotoSansCJKsc-Regular.otf",
+    "wqy-microhei.ttc",
+    "wqy-zenhei.ttc",
+)
+
+
+class TileSpec(NamedTuple):
+    key: str
+    """缩略图缓存键，由源图片状态、标题与尺寸决定"""
+    source: Optional[str]
+    """源图片路径，不存在时绘制占位图"""
+    caption: str
+
+
+def tile_key(source: Optional[Path], caption: str, width: int) -> str:
+    """
+    计算缩略图缓存键，源图片的大小、修改时间或标题变化时缓存键随之变化。
+
+    参数:
+        source (Optional[Path]): 源图片路径。
+        caption (str): 标题。
+        width (int): 缩略图宽度。
+
+    返回:
+        str: 缓存键。
+    """
+    state: Tuple = ()
+    if source is not None:
+        try:
+            stat = source.stat()
+            state = (str(source), stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+    raw = json.dumps([TILE_VERSION, state, caption, width], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def load_font(font: Optional[str], size: int) -> ImageFont.ImageFont:
+    """加载字体，找不到指定字体与常见中文字体时使用 Pillow 默认字体"""
+    for candidate in (font,) if font else DEFAULT_FONTS:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    if font:
+        logger.warning(f"无法加载字体 {font}，使用默认字体")
+    return ImageFont.load_default()
+
+
+def render_tile(spec: TileSpec, width: int, font: ImageFont.ImageFont) -> Image.Image:
+    """绘制单个缩略图：源图片顶部裁剪为正方形，下方为标题"""
+    tile = Image.new("RGB", (width, width + CAPTION_HEIGHT), BACKGROUND)
+    if spec.source is not None and os.path.exists(spec.source):
+        with Image.open(spec.source) as image:
+            thumbnail = ImageOps.fit(image.convert("RGB"), (width, width), Image.Resampling.LANCZOS, centering=(0.5, 0))
+        tile.paste(thumbnail, (0, 0))
+    draw = ImageDraw.Draw(tile)
+    if spec.source is None:
+        draw.rectangle((0, 0, width - 1, width - 1), outline=(200, 200, 200))
+    caption = spec.caption
+    while caption and draw.textlength(caption, font=font) > width:
+        caption = caption[:-1]
+    text_width = draw.textlength(caption, font=font)
+    draw.text(((width - text_width) / 2, width + 6), caption, fill=(30, 30, 30), font=font)
+    return tile
+
+
+def save_image(image: Image.Image, target: str, image_format: str, **params) -> None:
+    """先保存到同目录下名称唯一的临时文件再替换，多个进程共用缓存目录时互不覆盖"""
+    fd, temp = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix=".tmp", dir=os.path.dirname(target))
+    os.close(fd)
+    try:
+        image.save(temp, image_format, **params)
+        os.replace(temp, target)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp)
+        raise
+
+
+def render_overview(
+    specs: List[TileSpec], tile_dir: str, output: str, columns: int, width: int, font: Optional[str]
+) -> int:
+    """
+    拼合全部缩略图为一张总览图，缩略图已缓存时直接读取。可在子进程中执行。
+
+    参数:
+        specs (List[TileSpec]): 缩略图列表。
+        tile_dir (str): 缩略图缓存目录。
+        output (str): 输出图片路径。
+        columns (int): 每行缩略图数量。
+        width (int): 缩略图宽度。
+        font (Optional[str]): 字体名称或路径。
+
+    返回:
+        int: 重新绘制的缩略图数量。
+    """
+    loaded_font = load_font(font, 18)
+    rows = max(math.ceil(len(specs) / columns), 1)
+    tile_height = width + CAPTION_HEIGHT
+    sheet = Image.new(
+        "RGB",
+        (PADDING + columns * (width + PADDING), PADDING + rows * (tile_height + PADDING)),
+        (255, 255, 255),
+    )
+    rendered = 0
+    for index, spec in enumerate(specs):
+        tile_file = os.path.join(tile_dir, f"{spec.key}.png")
+        tile: Optional[Image.Image] = None
+        if os.path.exists(tile_file):
+            try:
+                with Image.open(tile_file) as cached:
+                    tile = cached.convert("RGB")
+            except OSError:
+                tile = None
+        if tile is None:
+            tile = render_tile(spec, width, loaded_font)
+            save_image(tile, tile_file, "PNG")
+            rendered += 1
+        row, column = divmod(index, columns)
+        sheet.paste(tile, (PADDING + column * (width + PADDING), PADDING + row * (tile_height + PADDING)))
+    save_image(sheet, output, "JPEG", quality=85, optimize=True)
+    return rendered
+
+
+class OverviewCache:
+    """总览图的磁盘缓存，只在缩略图列表变化时重新拼合，且只重新绘制变化的缩略图"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.tile_dir = directory / "tiles"
+        self.output = directory / "overview.jpg"
+        self.state_file = directory / "overview.json"
+
+    def sheet_key(self, specs: List[TileSpec], columns: int) -> str:
+        raw = json.dumps([columns, [spec.key for spec in specs]])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def cached_key(self) -> Optional[str]:
+        try:
+            return json.loads(self.state_file.read_text("utf-8")).get("key")
+        except (OSError, ValueError):
+            return None
+
+    async def get(self, specs: List[TileSpec], columns: int, width: int, font: Optional[str]) -> bytes:
+        """
+        获取总览图，缓存有效时直接读取，否则在线程池或与压缩图片共用的进程池中绘制。
+
+        参数:
+            specs (List[TileSpec]): 缩略图列表。
+            columns (int): 每行缩略图数量。
+            width (int): 缩略图宽度。
+            font (Optional[str]): 字体名称或路径。
+
+        返回:
+            bytes: 总览图内容。
+        """
+        key = self.sheet_key(specs, columns)
+        if key != self.cached_key() or not self.output.exists():
+            self.tile_dir.mkdir(parents=True, exist_ok=True)
+            missing = sum(not (self.tile_dir / f"{spec.key}.png").exists() for spec in specs)
+            args = (specs, str(self.tile_dir), str(self.output), columns, width, font)
+            loop = asyncio.get_running_loop()
+            if missing > PROCESS_THRESHOLD:
+                rendered = await run_in_render_pool(render_overview, *args)
+            else:
+                rendered = await loop.run_in_executor(None, render_overview, *args)
+            await loop.run_in_executor(None, functools.partial(save_json, self.state_file, {"key": key}, create=True))
+            self.prune(specs)
+            logger.info(f"已生成角色总览图，重新绘制 {rendered} 个缩略图")
+        async with aiofiles.open(self.output, "rb") as file:
+            return await file.read()
+
+    def prune(self, specs: List[TileSpec]) -> None:
+        """删除不再使用的缩略图"""
+        keys = {spec.key for spec in specs}
+        for tile in self.tile_dir.glob("*.png"):
+            if tile.stem not in keys:
+                tile.unlink(missing_ok=True)
+
+
+def build_tile_specs(
+    roles: Mapping[str, Sequence[str]], resolve: Callable[[str], Optional[Path]], width: int
+) -> List[TileSpec]:
+    """
+    根据昵称数据生成缩略图列表，标题为角色的首个昵称，没有昵称时为角色名。
+
+    参数:
+        roles (Mapping[str, Sequence[str]]): 角色与昵称。
+        resolve (Callable[[str], Optional[Path]]): 角色到图片所在目录，找不到时返回 None。
+        width (int): 缩略图宽度。
+
+    返回:
+        List[TileSpec]: 缩略图列表。
+    """
+    specs = []
+    for role, aliases in roles.items():
+        directory = resolve(role)
+        source = directory / f"{role}.jpg" if directory is not None else None
+        if source is not None and not source.exists():
+            source = None
+        caption = aliases[0] if aliases else role
+        specs.append(TileSpec(tile_key(source, caption, width), str(source) if source else None, caption))
+    return specs
+
+
+overview_cache = OverviewCache(get_cache_dir("nonebot_plugin_bh3_elysian_realm") / "overview")
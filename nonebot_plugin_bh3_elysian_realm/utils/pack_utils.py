@@ -0,0 +1,226 @@
+import os
+import json
+import mmap
+import struct
+import asyncio
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Set, Dict, List, Tuple, Optional
+
+from nonebot import logger
+
+# 文件格式: MAGIC | 索引长度 (uint32, 小端) | 索引 JSON | 图片数据
+# 索引为 {"version": 1, "entries": {角色: [偏移, 长度, sha256]}}，偏移相对图片数据起始位置
+PACK_MAGIC = b"ERPK"
+PACK_VERSION = 1
+HEADER = struct.Struct("<4sI")
+CHUNK_SIZE = 1024 * 1024
+
+
+class PackError(ValueError):
+    """打包文件损坏或版本不受支持"""
+
+
+def write_pack(entries: List[Tuple[str, Path]], pack_file: Path) -> Dict[str, List]:
+    """
+    将多张图片写入一个打包文件。
+
+    先读取一遍计算长度与哈希以生成索引，再依次复制图片数据。
+
+    参数:
+        entries (List[Tuple[str, Path]]): 角色与图片路径。
+        pack_file (Path): 输出文件。
+
+    返回:
+        Dict[str, List]: 索引，角色到 [偏移, 长度, sha256]。
+    """
+    index: Dict[str, List] = {}
+    offset = 0
+    for role, path in entries:
+        digest = hashlib.sha256()
+        length = 0
+        with path.open("rb") as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                length += len(chunk)
+        index[role] = [offset, length, digest.hexdigest()]
+        offset += length
+    header = json.dumps({"version": PACK_VERSION, "entries": index}, ensure_ascii=False).encode("utf-8")
+    with pack_file.open("wb") as output:
+        output.write(HEADER.pack(PACK_MAGIC, len(header)))
+        output.write(header)
+        for _, path in entries:
+            with path.open("rb") as file:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                    output.write(chunk)
+        output.flush()
+        os.fsync(output.fileno())
+    return index
+
+
+class PackedImages:
+    """以 mmap 只读打开的打包文件，图片数据为映射内存的切片，不再逐个打开文件"""
+
+    def __init__(self, pack_file: Path):
+        self.pack_file = pack_file
+        with pack_file.open("rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.entries, self._data_start = self._read_index()
+        except BaseException:
+            self._mmap.close()
+            raise
+        self.verified: Set[str] = set()
+        """已校验 sha256 的角色"""
+
+    def _read_index(self) -> Tuple[Dict[str, List], int]:
+        if len(self._mmap) < HEADER.size:
+            raise PackError(f"打包文件 {self.pack_file} 不完整")
+        magic, length = HEADER.unpack_from(self._mmap, 0)
+        if magic != PACK_MAGIC:
+            raise PackError(f"{self.pack_file} 不是图片打包文件")
+        data_start = HEADER.size + length
+        try:
+            header = json.loads(self._mmap[HEADER.size : data_start].decode("utf-8"))
+        except ValueError as e:
+            raise PackError(f"打包文件 {self.pack_file} 索引损坏") from e
+        if header.get("version") != PACK_VERSION:
+            raise PackError(f"打包文件 {self.pack_file} 版本 {header.get('version')} 不受支持")
+        entries = header["entries"]
+        end = max((offset + size for offset, size, _ in entries.values()), default=0)
+        if data_start + end > len(self._mmap):
+            raise PackError(f"打包文件 {self.pack_file} 数据不完整")
+        return entries, data_start
+
+    def __contains__(self, role: str) -> bool:
+        return role in self.entries
+
+    def roles(self) -> List[str]:
+        return list(self.entries)
+
+    def view(self, role: str) -> memoryview:
+        """角色图片数据的零拷贝视图，打包文件关闭前有效"""
+        offset, size, _ = self.entries[role]
+        start = self._data_start + offset
+        return memoryview(self._mmap)[start : start + size]
+
+    def read(self, role: str) -> bytes:
+        """角色图片数据，适配器需要 bytes 时使用"""
+        offset, size, _ = self.entries[role]
+        start = self._data_start + offset
+        return self._mmap[start : start + size]
+
+    def digest(self, role: str) -> str:
+        return self.entries[role][2]
+
+    def close(self) -> None:
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 仍有 view 未释放，映射会在其被回收后关闭
+            logger.debug(f"打包文件 {self.pack_file} 仍在使用中")
+
+
+class PackStore:
+    """按图片目录与图片版本管理打包文件，打包文件在首次读取时打开"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._packs: Dict[Tuple[Path, str], Optional[PackedImages]] = {}
+
+    def pack_file(self, image_path: Path, variant: str) -> Path:
+        digest = hashlib.sha1(str(image_path.resolve()).encode("utf-8")).hexdigest()[:8]
+        return self.directory / f"{image_path.name}-{digest}-{variant}.pack"
+
+    def open(self, image_path: Path, variant: str) -> Optional[PackedImages]:
+        """打开打包文件，不存在或已损坏时返回 None"""
+        key = (image_path, variant)
+        if key in self._packs:
+            return self._packs[key]
+        pack_file = self.pack_file(image_path, variant)
+        pack: Optional[PackedImages] = None
+        if pack_file.exists():
+            try:
+                pack = PackedImages(pack_file)
+            except (OSError, PackError) as e:
+                logger.error(f"读取图片打包文件失败: {e}")
+        self._packs[key] = pack
+        return pack
+
+    def read(self, image_path: Path, variant: str, role: str) -> Optional[bytes]:
+        pack = self.open(image_path, variant)
+        if pack is None or role not in pack:
+            return None
+        return pack.read(role)
+
+    async def load(self, image_path: Path, variant: str, role: str) -> Optional[bytes]:
+        """
+        读取角色图片，每个角色首次读取时在线程池中校验 sha256。
+
+        校验失败说明打包文件已损坏，停用该打包文件直到重新生成，调用方改为读取图片文件。
+
+        参数:
+            image_path (Path): 图片资源目录。
+            variant (str): 图片版本。
+            role (str): 角色文件名（不含扩展名）。
+
+        返回:
+            Optional[bytes]: 图片内容，打包文件不可用或不包含该角色时返回 None。
+        """
+        key = (image_path, variant)
+        pack = self.open(image_path, variant)
+        if pack is None or role not in pack:
+            return None
+        data = pack.read(role)
+        if role not in pack.verified:
+            digest = await asyncio.get_running_loop().run_in_executor(None, lambda: hashlib.sha256(data).hexdigest())
+            if digest != pack.digest(role):
+                logger.error(f"图片打包文件 {pack.pack_file.name} 中 {role} 的数据已损坏，停用该打包文件")
+                if self._packs.get(key) is pack:
+                    self.close(key)
+                    self._packs[key] = None
+                return None
+            pack.verified.add(role)
+        return data
+
+    def roles(self, image_path: Path, variant: str) -> Optional[List[str]]:
+        """打包文件中的角色列表，没有可用的打包文件时返回 None"""
+        pack = self.open(image_path, variant)
+        return pack.roles() if pack is not None else None
+
+    def close(self, key: Optional[Tuple[Path, str]] = None) -> None:
+        """关闭指定 (图片目录, 图片版本) 或全部打包文件"""
+        for pack_key in [key] if key is not None else list(self._packs):
+            pack = self._packs.pop(pack_key, None)
+            if pack is not None:
+                pack.close()
+
+    async def build(self, image_path: Path, variant: str, entries: List[Tuple[str, Path]]) -> Path:
+        """
+        在线程池中重新生成打包文件，完成后替换旧文件。
+
+        参数:
+            image_path (Path): 图片资源目录。
+            variant (str): 图片版本。
+            entries (List[Tuple[str, Path]]): 角色与图片路径。
+
+        返回:
+            Path: 打包文件路径。
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        pack_file = self.pack_file(image_path, variant)
+        # 临时文件名唯一，多个进程共用缓存目录时互不覆盖
+        fd, name = tempfile.mkstemp(prefix=f".{pack_file.name}.", suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        temp = Path(name)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write_pack, entries, temp)
+            # 先关闭旧的映射，Windows 下无法替换仍被映射的文件
+            self.close((image_path, variant))
+            os.replace(temp, pack_file)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        logger.info(f"已生成图片打包文件 {pack_file.name}，共 {len(entries)} 张图片")
+        return pack_file
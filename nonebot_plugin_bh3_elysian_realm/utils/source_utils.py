@@ -0,0 +1,126 @@
+import re
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Callable, Iterable, Optional, Sequence, Awaitable
+
+from nonebot import logger
+
+from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+from nonebot_plugin_bh3_elysian_realm.utils.image_utils import list_role_files
+
+
+def source_slug(repository: str) -> str:
+    """
+    根据仓库地址生成检出目录名：仓库名加地址哈希，地址不同的同名仓库不会冲突。
+
+    参数:
+        repository (str): 仓库地址。
+
+    返回:
+        str: 目录名。
+    """
+    name = repository.rstrip("/").rsplit("/", 1)[-1]
+    if name.endswith(".git"):
+        name = name[:-4]
+    name = re.sub(r"[^\w.-]+", "_", name) or "repository"
+    return f"{name}-{hashlib.sha1(repository.encode('utf-8')).hexdigest()[:8]}"
+
+
+class ImageSource:
+    """图片资源来源：仓库地址、检出目录与各自的更新检查状态"""
+
+    def __init__(self, repository: str, path: Path, poller: UpdatePoller, upstream: bool = False):
+        self.repository = repository
+        self.path = path
+        self.poller = poller
+        self.upstream = upstream
+        """是否为 image_repository 指定的上游仓库，归档模式只作用于上游仓库"""
+
+    def __repr__(self) -> str:
+        return f"ImageSource({self.repository!r}, {str(self.path)!r})"
+
+
+class SourceIndex:
+    """
+    合并各来源的角色图片，角色到图片目录的映射，查找为 O(1)。
+
+    sources 按优先级从高到低排列，多个来源存在同名角色时使用靠前来源的图片。
+    """
+
+    def __init__(self, sources: Sequence[ImageSource]):
+        self.sources = list(sources)
+        self._roles: Optional[Dict[str, Path]] = None
+
+    def rebuild(self) -> Dict[str, Path]:
+        """重新扫描各来源的图片目录"""
+        roles: Dict[str, Path] = {}
+        for source in reversed(self.sources):
+            if not source.path.is_dir():
+                continue
+            for role in list_role_files(source.path):
+                roles[role] = source.path
+        self._roles = roles
+        logger.debug(f"已合并 {len(self.sources)} 个图片来源，共 {len(roles)} 个角色")
+        return roles
+
+    def update(self, roles: Iterable[str]) -> None:
+        """
+        只重新查找指定角色所在的来源，用于少量图片变化时，索引尚未建立时不做任何事。
+
+        参数:
+            roles (Iterable[str]): 图片发生变化的角色。
+        """
+        if self._roles is None:
+            return
+        for role in roles:
+            path = next((source.path for source in self.sources if (source.path / f"{role}.jpg").is_file()), None)
+            if path is None:
+                self._roles.pop(role, None)
+            else:
+                self._roles[role] = path
+
+    @property
+    def roles(self) -> Dict[str, Path]:
+        if self._roles is None:
+            return self.rebuild()
+        return self._roles
+
+    def resolve(self, role: str) -> Optional[Path]:
+        """
+        查找角色图片所在的目录。
+
+        参数:
+            role (str): 角色文件名（不含扩展名）。
+
+        返回:
+            Optional[Path]: 图片目录，所有来源都没有该角色时返回 None。
+        """
+        return self.roles.get(role)
+
+
+async def for_each_source(
+    sources: Sequence[ImageSource], func: Callable[[ImageSource], Awaitable[bool]], concurrency: int
+) -> List[bool]:
+    """
+    以有限的并发数对每个来源执行 func，单个来源的异常不影响其它来源。
+
+    参数:
+        sources (Sequence[ImageSource]): 图片来源。
+        func (Callable[[ImageSource], Awaitable[bool]]): 对单个来源执行的操作。
+        concurrency (int): 最大并发数。
+
+    返回:
+        List[bool]: 各来源的执行结果，异常视为 False。
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(source: ImageSource) -> bool:
+        async with semaphore:
+            try:
+                return await func(source)
+            except Exception as e:
+                logger.opt(exception=e).error(f"更新图片来源 {source.repository} 失败")
+                return False
+
+    return list(await asyncio.gather(*(run(source) for source in sources)))
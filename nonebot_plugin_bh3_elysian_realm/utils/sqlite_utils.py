@@ -0,0 +1,170 @@
+import json
+import sqlite3
+import contextlib
+from pathlib import Path
+from typing import Dict, List, Tuple, Iterable, Iterator, Optional, NamedTuple
+
+from nonebot import logger
+
+SCHEMA_VERSION = 1
+# 数据库文件头中修改计数的偏移，回滚日志模式下每次提交递增
+CHANGE_COUNTER_OFFSET = 24
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS roles (name TEXT PRIMARY KEY, position INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS aliases ("
+    "alias TEXT PRIMARY KEY, role TEXT NOT NULL REFERENCES roles (name) ON DELETE CASCADE, position INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS aliases_role ON aliases (role, position)",
+)
+
+
+class AliasEdit(NamedTuple):
+    added: List[str]
+    """新增的昵称"""
+    conflicts: Dict[str, str]
+    """已被其它角色使用的昵称及其角色，未写入"""
+
+
+class NicknameStore:
+    """
+    SQLite 昵称库，昵称表以昵称为主键，同一昵称只能属于一个角色。
+
+    每次操作使用独立的连接，写操作在 BEGIN IMMEDIATE 事务中执行，多个进程同时修改时依次提交。
+    使用默认的回滚日志模式，每次提交都会更新文件头中的修改计数，据此判断其它进程是否修改过数据。
+    """
+
+    def __init__(self, db_file: Path, timeout: float = 5):
+        self.db_file = db_file
+        self.timeout = timeout
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.db_file, timeout=self.timeout, isolation_level=None)
+        try:
+            connection.execute("PRAGMA foreign_keys = ON")
+            yield connection
+        finally:
+            connection.close()
+
+    def signature(self) -> Optional[Tuple[str, int, int]]:
+        """数据库文件的修改计数与大小，文件不存在时返回 None"""
+        try:
+            with self.db_file.open("rb") as file:
+                file.seek(CHANGE_COUNTER_OFFSET)
+                counter = int.from_bytes(file.read(4), "big")
+                return str(self.db_file), counter, file.seek(0, 2)
+        except FileNotFoundError:
+            return None
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务，开始时即获取写锁，异常时回滚"""
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def migrate(self, json_file: Optional[Path]) -> bool:
+        """
+        创建数据表，数据库为新建时从 nickname.json 一次性导入。
+
+        重复的昵称以先出现的角色为准，与 JSON 存储的查找结果保持一致。
+
+        参数:
+            json_file (Optional[Path]): 要导入的 nickname.json，为 None 或不存在时只创建数据表。
+
+        返回:
+            bool: 是否执行了导入。
+        """
+        with self.transaction() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return False
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            if json_file is None or not json_file.exists() or json_file.stat().st_size == 0:
+                return False
+            data: Dict[str, List[str]] = json.loads(json_file.read_text("utf-8"))
+            duplicates: List[str] = []
+            for role, aliases in data.items():
+                self._insert_role(connection, role)
+                for alias in aliases:
+                    if self._insert_alias(connection, role, alias) not in (None, role):
+                        duplicates.append(alias)
+        if duplicates:
+            logger.warning(f"nickname.json 中以下昵称属于多个角色，已保留先出现的角色: {duplicates}")
+        logger.info(f"已从 {json_file} 导入 {len(data)} 个角色的昵称")
+        return True
+
+    @staticmethod
+    def _insert_role(connection: sqlite3.Connection, role: str) -> None:
+        connection.execute(
+            "INSERT OR IGNORE INTO roles (name, position) "
+            "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM roles))",
+            (role,),
+        )
+
+    @staticmethod
+    def _insert_alias(connection: sqlite3.Connection, role: str, alias: str) -> Optional[str]:
+        """在保存点中写入昵称，违反唯一约束时只回滚该昵称并返回其所属角色"""
+        connection.execute("SAVEPOINT alias")
+        try:
+            connection.execute(
+                "INSERT INTO aliases (alias, role, position) "
+                "VALUES (?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM aliases WHERE role = ?))",
+                (alias, role, role),
+            )
+        except sqlite3.IntegrityError:
+            connection.execute("ROLLBACK TO alias")
+            connection.execute("RELEASE alias")
+            return connection.execute("SELECT role FROM aliases WHERE alias = ?", (alias,)).fetchone()[0]
+        connection.execute("RELEASE alias")
+        return None
+
+    def load(self) -> Dict[str, List[str]]:
+        """按写入顺序读取全部角色与昵称"""
+        with self.connect() as connection:
+            data: Dict[str, List[str]] = {
+                role: [] for (role,) in connection.execute("SELECT name FROM roles ORDER BY position")
+            }
+            for role, alias in connection.execute("SELECT role, alias FROM aliases ORDER BY role, position"):
+                data[role].append(alias)
+        return data
+
+    def add_aliases(self, role: str, aliases: Iterable[str]) -> AliasEdit:
+        """
+        为角色添加昵称，每个昵称在独立的保存点中写入，冲突的昵称只回滚自身，不影响其它昵称。
+
+        参数:
+            role (str): 角色，即图片文件名。
+            aliases (Iterable[str]): 要添加的昵称。
+
+        返回:
+            AliasEdit: 新增与冲突的昵称。
+        """
+        added: List[str] = []
+        conflicts: Dict[str, str] = {}
+        with self.transaction() as connection:
+            if connection.execute("SELECT 1 FROM roles WHERE name = ?", (role,)).fetchone() is None:
+                raise KeyError(role)
+            for alias in dict.fromkeys(aliases):
+                owner = self._insert_alias(connection, role, alias)
+                if owner is None:
+                    added.append(alias)
+                elif owner != role:
+                    conflicts[alias] = owner
+        return AliasEdit(added, conflicts)
+
+    def add_roles(self, roles: Iterable[str]) -> List[str]:
+        """添加没有昵称的角色，返回新增的角色"""
+        added: List[str] = []
+        with self.transaction() as connection:
+            for role in roles:
+                if connection.execute("SELECT 1 FROM roles WHERE name = ?", (role,)).fetchone() is None:
+                    self._insert_role(connection, role)
+                    added.append(role)
+        return added
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import random
+import asyncio
+import inspect
+import functools
+import threading
+import contextlib
+from pathlib import Path
+from contextvars import ContextVar
+from typing import Any, Dict, List, Tuple, Callable, Iterator, Optional
+
+from nonebot import logger
+from nonebot.typing import T_State
+from nonebot.matcher import current_matcher
+from nonebot.exception import MatcherException
+
+from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+
+STATE_KEY = "_elysian_realm_trace"
+SERVICE_NAME = "nonebot_plugin_bh3_elysian_realm"
+
+
+class Span:
+    """一个阶段的耗时，时间为 perf_counter_ns"""
+
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.perf_counter_ns()
+        self.end: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        """耗时（秒），未结束时计算到当前"""
+        return ((self.end or time.perf_counter_ns()) - self.start) / 1e9
+
+
+class Trace:
+    """一次事件处理中记录的全部阶段，第一个阶段为根"""
+
+    def __init__(self, name: str):
+        self.trace_id = os.urandom(16).hex()
+        # perf_counter_ns 到 Unix 时间的偏移，导出时换算
+        self.epoch = time.time_ns() - time.perf_counter_ns()
+        self.root = Span(name, None)
+        self.spans: List[Span] = [self.root]
+
+    def child(self, name: str, parent: Span) -> Span:
+        span = Span(name, parent.span_id)
+        self.spans.append(span)
+        return span
+
+    def stages(self) -> Dict[str, float]:
+        """根以外各阶段的耗时（毫秒），同名阶段累加"""
+        stages: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            stages[span.name] = stages.get(span.name, 0) + round(span.duration * 1000, 3)
+        return stages
+
+
+_current: ContextVar[Optional[Tuple[Trace, Span]]] = ContextVar("elysian_realm_trace", default=None)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    在当前追踪中记录一个阶段，不在追踪中时不做任何事。
+
+    参数:
+        name (str): 阶段名称。
+        attributes (Any): 阶段属性。
+    """
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    child = trace.child(name, parent)
+    child.attributes.update(attributes)
+    token = _current.set((trace, child))
+    try:
+        yield child
+    except MatcherException:
+        raise
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        child.end = time.perf_counter_ns()
+        _current.reset(token)
+
+
+def annotate(**attributes: Any) -> None:
+    """为当前追踪的根阶段添加属性，如查询内容与结果"""
+    current = _current.get()
+    if current is not None:
+        current[0].root.attributes.update(attributes)
+
+
+def traced(name: str) -> Callable:
+    """将函数（包括协程函数）的执行记录为一个阶段"""
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_handler(name: str, stage: str = "handle") -> Callable:
+    """
+    在追踪中记录事件处理函数。
+
+    同一次事件处理中的多个处理函数共享一个追踪，追踪保存在 matcher.state 中，按 trace_sample_rate 采样，
+    由 finish_trace 在事件处理结束后结束。不在事件处理中调用时不记录。
+
+    参数:
+        name (str): 追踪的根阶段名称，通常为 matcher 名称。
+        stage (str): 处理函数的阶段名称。
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                state = current_matcher.get().state
+            except LookupError:
+                return await func(*args, **kwargs)
+            trace = state.get(STATE_KEY)
+            if trace is None and STATE_KEY not in state:
+                trace = Trace(name) if random.random() < plugin_config.trace_sample_rate else None
+                state[STATE_KEY] = trace
+            if trace is None:
+                return await func(*args, **kwargs)
+            token = _current.set((trace, trace.root))
+            try:
+                with span(stage):
+                    return await func(*args, **kwargs)
+            finally:
+                _current.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+class TraceExporter:
+    """以 OTLP JSON 格式将追踪逐行追加到文件，与 OpenTelemetry Collector 的文件接收器格式一致"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+        values = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                typed = {"boolValue": value}
+            elif isinstance(value, int):
+                typed = {"intValue": str(value)}
+            elif isinstance(value, float):
+                typed = {"doubleValue": value}
+            else:
+                typed = {"stringValue": str(value)}
+            values.append({"key": key, "value": typed})
+        return values
+
+    def encode(self, trace: Trace) -> Dict[str, Any]:
+        spans = []
+        for item in trace.spans:
+            encoded: Dict[str, Any] = {
+                "traceId": trace.trace_id,
+                "spanId": item.span_id,
+                "name": item.name,
+                "kind": 1 if item.parent_id else 2,
+                "startTimeUnixNano": str(trace.epoch + item.start),
+                "endTimeUnixNano": str(trace.epoch + (item.end or item.start)),
+                "attributes": self._attributes(item.attributes),
+                "status": {"code": 2, "message": item.error} if item.error else {},
+            }
+            if item.parent_id:
+                encoded["parentSpanId"] = item.parent_id
+            spans.append(encoded)
+        resource = {"attributes": self._attributes({"service.name": SERVICE_NAME})}
+        return {
+            "resourceSpans": [{"resource": resource, "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]}]
+        }
+
+    def write(self, trace: Trace) -> None:
+        line = json.dumps(self.encode(trace), ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as file:
+                file.write(f"{line}\n")
+
+
+exporter: Optional[TraceExporter] = (
+    TraceExporter(plugin_config.trace_export_path) if plugin_config.trace_export_path else None
+)
+
+
+async def finish_trace(state: T_State, exception: Optional[Exception] = None) -> Optional[Trace]:
+    """
+    结束本次事件处理的追踪，耗时超过 slow_query_threshold 时输出各阶段耗时，配置了导出文件时写入文件。
+
+    参数:
+        state (T_State): matcher.state。
+        exception (Optional[Exception]): 事件处理中未捕获的异常。
+
+    返回:
+        Optional[Trace]: 结束的追踪，未采样时返回 None。
+    """
+    trace: Optional[Trace] = state.pop(STATE_KEY, None)
+    if trace is None:
+        return None
+    trace.root.end = time.perf_counter_ns()
+    if exception is not None:
+        trace.root.error = repr(exception)
+    duration = trace.root.duration
+    threshold = plugin_config.slow_query_threshold
+    if threshold and duration >= threshold:
+        record = {
+            "trace_id": trace.trace_id,
+            "name": trace.root.name,
+            "duration_ms": round(duration * 1000, 3),
+            "stages": trace.stages(),
+            **trace.root.attributes,
+        }
+        logger.warning(f"慢查询: {json.dumps(record, ensure_ascii=False)}")
+    if exporter is not None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, exporter.write, trace)
+        except OSError as e:
+            logger.error(f"写入追踪文件失败: {e!r}")
+    return trace
@@ -0,0 +1,91 @@
+import json
+import time
+import random
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+from nonebot import logger
+
+from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json
+
+
+class UpdatePoller:
+    """远程变更轮询状态，检查失败后以带抖动的指数退避重试，状态持久化以便重启后沿用"""
+
+    def __init__(self, state_file: Path, interval: float, retry_interval: float):
+        self.state_file = state_file
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.failures = 0
+        self.last_checked = 0.0
+        self.remote_head: Optional[str] = None
+        """远程版本：git 模式为远程 HEAD，归档模式为归档的 ETag 或 Last-Modified"""
+        self._loaded = False
+
+    def load(self) -> None:
+        """从状态文件恢复上次检查结果"""
+        self._loaded = True
+        try:
+            state = json.loads(self.state_file.read_text("utf-8"))
+        except (OSError, ValueError):
+            return
+        self.last_checked = float(state.get("last_checked", 0))
+        self.remote_head = state.get("remote_head")
+        self.failures = int(state.get("failures", 0))
+
+    def ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def save(self) -> None:
+        try:
+            save_json(
+                self.state_file,
+                {"last_checked": self.last_checked, "remote_head": self.remote_head, "failures": self.failures},
+                create=True,
+            )
+        except OSError as e:
+            logger.warning(f"保存更新检查状态失败：{e}")
+
+    def recently_checked(self, local_head: Optional[str]) -> bool:
+        """
+        判断是否无需再次检查：上次检查成功、未超过检查间隔且本地版本与当时的远程版本一致。
+
+        参数:
+            local_head (Optional[str]): 本地 HEAD。
+
+        返回:
+            bool: 是否可以跳过检查。
+        """
+        self.ensure_loaded()
+        return (
+            self.failures == 0
+            and local_head is not None
+            and local_head == self.remote_head
+            and time.time() - self.last_checked < self.interval
+        )
+
+    async def succeeded(self, remote_head: Optional[str]) -> None:
+        self.ensure_loaded()
+        self.failures = 0
+        self.remote_head = remote_head
+        self.last_checked = time.time()
+        await asyncio.get_running_loop().run_in_executor(None, self.save)
+
+    async def failed(self) -> None:
+        self.ensure_loaded()
+        self.failures += 1
+        await asyncio.get_running_loop().run_in_executor(None, self.save)
+
+    def next_interval(self) -> float:
+        """
+        下次检查的间隔：正常时为检查间隔，失败后从重试间隔开始翻倍，不超过检查间隔，并加入随机抖动。
+
+        返回:
+            float: 间隔秒数。
+        """
+        if self.failures == 0:
+            return self.interval
+        delay = min(self.interval, self.retry_interval * 2 ** min(self.failures - 1, 16))
+        return delay * random.uniform(0.5, 1)
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+from typing import Dict, Tuple, Callable, Optional, Awaitable, NamedTuple
+
+from nonebot import logger
+from nonebot.matcher import Matcher
+from nonebot.exception import ActionFailed
+from nonebot.adapters import Bot, MessageSegment
+
+from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import registry
+from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+
+uploads_total = registry.counter(
+    "elysian_realm_uploads_total", "图片上传引用的使用次数，result 为 hit、upload 或 expired", ["adapter", "result"]
+)
+
+
+class Uploader(NamedTuple):
+    upload: Callable[[Bot, bytes, str], Awaitable[str]]
+    """上传图片并返回适配器侧的引用，如文件 ID 或 URL"""
+    segment: Callable[[str], MessageSegment]
+    """由引用构造图片消息段"""
+
+
+uploaders: Dict[str, Uploader] = {}
+
+
+def register_uploader(adapter: str, uploader: Uploader) -> None:
+    """
+    注册适配器的图片上传方式，未注册的适配器每次发送完整图片。
+
+    参数:
+        adapter (str): 适配器名称，即 Adapter.get_name()。
+        uploader (Uploader): 上传函数与消息段构造函数。
+    """
+    uploaders[adapter] = uploader
+
+
+class UploadCache:
+    """
+    按 Bot 缓存已上传图片的引用，以图片内容的哈希为键，同一图片的并发上传只执行一次。
+
+    引用在 ttl 秒后视为过期并重新上传；使用引用发送失败时认为引用已被实现端清理，丢弃后重新上传一次。
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self._flight: "SingleFlight[Tuple[str, str, str], str]" = SingleFlight(ttl, max_size)
+
+    def supports(self, bot: Bot) -> bool:
+        return bot.adapter.get_name() in uploaders
+
+    @staticmethod
+    async def digest(data: bytes) -> str:
+        """在线程池中计算图片内容的 sha256，调用方已知摘要时无需计算"""
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: hashlib.sha256(data).hexdigest())
+
+    async def reference(self, bot: Bot, data: bytes, name: str, digest: str) -> Tuple[str, bool]:
+        """
+        获取图片的引用，没有有效引用时上传。
+
+        返回:
+            Tuple[str, bool]: 引用与是否为本次上传。
+        """
+        adapter = bot.adapter.get_name()
+        uploader = uploaders[adapter]
+        uploaded = False
+
+        async def upload() -> str:
+            nonlocal uploaded
+            uploaded = True
+            return await uploader.upload(bot, data, name)
+
+        return await self._flight.do((adapter, bot.self_id, digest), upload), uploaded
+
+    async def send(self, bot: Bot, matcher: Matcher, data: bytes, name: str, digest: Optional[str] = None) -> None:
+        """
+        以引用发送图片，引用失效时重新上传后再发送。
+
+        参数:
+            bot (Bot): 当前 Bot，适配器需已注册上传方式。
+            matcher (Matcher): 当前事件响应器。
+            data (bytes): 图片内容。
+            name (str): 上传时使用的文件名。
+            digest (Optional[str]): 图片内容的 sha256，如打包索引或按文件状态缓存的摘要，未提供时计算。
+        """
+        adapter = bot.adapter.get_name()
+        uploader = uploaders[adapter]
+        digest = digest or await self.digest(data)
+        reference, uploaded = await self.reference(bot, data, name, digest)
+        uploads_total.inc(adapter=adapter, result="upload" if uploaded else "hit")
+        try:
+            await matcher.send(uploader.segment(reference))
+        except ActionFailed as e:
+            if uploaded:
+                raise
+            logger.info(f"图片引用 {reference} 发送失败，重新上传: {e!r}")
+            uploads_total.inc(adapter=adapter, result="expired")
+            self.forget(bot, digest)
+            reference, _ = await self.reference(bot, data, name, digest)
+            await matcher.send(uploader.segment(reference))
+
+    def forget(self, bot: Bot, digest: str) -> None:
+        self._flight.forget((bot.adapter.get_name(), bot.self_id, digest))
+
+    def clear(self) -> None:
+        self._flight.forget()
+
+
+upload_cache = UploadCache(plugin_config.upload_cache_ttl)
+
+try:
+    from nonebot.adapters.onebot.v12 import MessageSegment as OB12MessageSegment
+except ImportError:  # pragma: no cover
+    pass
+else:
+
+    async def _upload_onebot_v12(bot: Bot, data: bytes, name: str) -> str:
+        resp = await bot.call_api("upload_file", type="data", name=name, data=data)
+        return resp["file_id"]
+
+    register_uploader("OneBot V12", Uploader(_upload_onebot_v12, OB12MessageSegment.image))
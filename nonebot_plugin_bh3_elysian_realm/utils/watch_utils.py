@@ -0,0 +1,145 @@
+import os
+import asyncio
+import contextlib
+from pathlib import Path
+from typing import Set, Dict, List, Tuple, Callable, Optional, Awaitable, AsyncIterator
+
+from nonebot import logger
+
+try:
+    # uvicorn[standard] 依赖 watchfiles，基于 inotify 等系统通知
+    from watchfiles import awatch
+except ImportError:  # pragma: no cover
+    awatch = None
+
+# 持续变化时最多合并 debounce 的该倍数时间后处理
+MAX_COALESCE_FACTOR = 10
+
+Snapshot = Dict[Path, Tuple[int, int]]
+ChangeHandler = Callable[[Set[Path]], Awaitable[None]]
+
+
+def is_resource_file(path: Path) -> bool:
+    """忽略临时文件与隐藏文件，如原子写入产生的 .tmp 文件与 .git 目录"""
+    return not path.name.startswith(".") and not path.name.endswith(".tmp")
+
+
+def snapshot(directories: List[Path]) -> Snapshot:
+    """
+    记录目录下（不含子目录）所有文件的修改时间与大小。
+
+    参数:
+        directories (List[Path]): 目录列表，不存在的目录被跳过。
+
+    返回:
+        Snapshot: 文件路径到 (修改时间, 大小)。
+    """
+    files: Snapshot = {}
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                continue
+    return files
+
+
+def diff_snapshot(old: Snapshot, new: Snapshot) -> Set[Path]:
+    """两次快照之间新增、删除或修改的文件"""
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+
+class ResourceWatcher:
+    """
+    监视资源目录中的文件变化，连续 debounce 秒没有新的变化后，将此前的变化合并为一批交给处理函数。
+
+    安装了 watchfiles 时使用系统文件通知，否则按 poll_interval 轮询目录快照。
+    只监视目录本身，不递归子目录；处理函数依次执行，执行期间的变化合并到下一批。
+    """
+
+    def __init__(self, directories: List[Path], debounce: float, poll_interval: float, force_polling: bool = False):
+        self.directories = [directory.resolve() for directory in dict.fromkeys(directories)]
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling or awatch is None
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def stop_event(self) -> asyncio.Event:
+        # 在事件循环中首次使用时创建
+        if self._stop is None:
+            self._stop = asyncio.Event()
+        return self._stop
+
+    async def changes(self) -> AsyncIterator[Set[Path]]:
+        """逐批产生发生变化的文件"""
+        if self.force_polling:
+            async for changed in self._poll():
+                yield changed
+            return
+        directories = [directory for directory in self.directories if directory.is_dir()]
+        if not directories:
+            return
+        async for events in awatch(
+            *directories,
+            watch_filter=lambda _, path: is_resource_file(Path(path)),
+            debounce=int(self.debounce * 1000 * MAX_COALESCE_FACTOR),
+            step=int(self.debounce * 1000),
+            recursive=False,
+            stop_event=self.stop_event,
+        ):
+            yield {Path(path) for _, path in events}
+
+    async def _poll(self) -> AsyncIterator[Set[Path]]:
+        loop = asyncio.get_running_loop()
+        previous = await loop.run_in_executor(None, snapshot, self.directories)
+        pending: Set[Path] = set()
+        rounds = 0
+        stop = self.stop_event
+        while not stop.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), self.poll_interval if not pending else self.debounce)
+            if stop.is_set():
+                return
+            current = await loop.run_in_executor(None, snapshot, self.directories)
+            changed = {path for path in diff_snapshot(previous, current) if is_resource_file(path)}
+            previous = current
+            # 本轮仍有变化时继续等待，直到连续 debounce 秒没有变化
+            if changed:
+                pending |= changed
+                rounds += 1
+                if rounds < MAX_COALESCE_FACTOR:
+                    continue
+            if pending:
+                yield pending
+                pending = set()
+                rounds = 0
+
+    def start(self, handler: ChangeHandler) -> None:
+        """在后台开始监视，处理函数的异常只记录日志"""
+
+        async def run() -> None:
+            async for changed in self.changes():
+                logger.debug(f"资源文件变化: {sorted(map(str, changed))}")
+                try:
+                    await handler(changed)
+                except Exception as e:
+                    logger.opt(exception=e).error("处理资源文件变化失败")
+
+        self.stop_event.clear()
+        self._task = asyncio.get_running_loop().create_task(run())
+        logger.info(f"开始监视资源目录{'（轮询）' if self.force_polling else ''}: {[str(d) for d in self.directories]}")
+
+    async def stop(self) -> None:
+        self.stop_event.set()
+        if self._task is not None:
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
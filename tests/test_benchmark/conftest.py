@@ -0,0 +1,60 @@
+import os
+import json
+from pathlib import Path
+
+import pytest
+import nonebot
+from nonebot.adapters.onebot.v11 import Adapter as OnebotV11Adapter
+from nonebot.adapters.onebot.v12 import Adapter as OnebotV12Adapter
+
+from .utils import BenchmarkRecorder, compare
+
+
+def pytest_collection_modifyitems(config, items):
+    # 基准测试耗时较长，仅在设置 ELYSIAN_BENCHMARK 时运行
+    if os.environ.get("ELYSIAN_BENCHMARK"):
+        return
+    skip = pytest.mark.skip(reason="设置 ELYSIAN_BENCHMARK=1 以运行基准测试")
+    for item in items:
+        if "test_benchmark" in item.nodeid:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _load_bot(nonebug_init: None):
+    driver = nonebot.get_driver()
+    driver.register_adapter(OnebotV11Adapter)
+    driver.register_adapter(OnebotV12Adapter)
+
+
+@pytest.fixture(autouse=True)
+def _disable_limits(mocker):
+    # 基准测试反复发送相同的查询，关闭限流与去重以测量实际处理耗时
+    from nonebot_plugin_bh3_elysian_realm.utils import limit_utils
+
+    mocker.patch.object(limit_utils.user_limiter, "rate", 0)
+    mocker.patch.object(limit_utils.group_limiter, "rate", 0)
+    mocker.patch.object(limit_utils.query_deduplicator, "window", 0)
+
+
+@pytest.fixture(scope="session")
+def recorder():
+    """
+    收集所有基准结果，结束时写入 ELYSIAN_BENCHMARK_OUTPUT（默认 benchmark.json）。
+
+    设置 ELYSIAN_BENCHMARK_BASELINE 时与基准文件比较，中位数耗时超过
+    ELYSIAN_BENCHMARK_TOLERANCE 倍（默认 1.5）的用例视为性能回退。
+    """
+    recorder = BenchmarkRecorder(rounds=int(os.environ.get("ELYSIAN_BENCHMARK_ROUNDS", "50")))
+    yield recorder
+    output = Path(os.environ.get("ELYSIAN_BENCHMARK_OUTPUT", "benchmark.json"))
+    recorder.dump(output)
+    baseline = os.environ.get("ELYSIAN_BENCHMARK_BASELINE")
+    if baseline:
+        current = json.loads(output.read_text(encoding="utf-8"))
+        regressions = compare(
+            json.loads(Path(baseline).read_text(encoding="utf-8")),
+            current,
+            float(os.environ.get("ELYSIAN_BENCHMARK_TOLERANCE", "1.5")),
+        )
+        assert not regressions, "性能回退:\n" + "\n".join(regressions)
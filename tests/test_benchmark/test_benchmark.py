@@ -0,0 +1,97 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+from pytest_mock import MockerFixture
+
+from .utils import DATASET_SIZES, BenchmarkRecorder, make_dataset, create_stub_bot
+
+
+@pytest.fixture(scope="module", params=DATASET_SIZES, ids=lambda size: f"{size}roles")
+def dataset(request, tmp_path_factory) -> Tuple[int, Path, Dict[str, List[str]]]:
+    directory = tmp_path_factory.mktemp(f"dataset_{request.param}")
+    return request.param, directory, make_dataset(directory, request.param)
+
+
+@pytest.mark.asyncio
+async def test_load_json(recorder: BenchmarkRecorder, dataset):
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import load_json
+
+    size, directory, _ = dataset
+    await recorder.run_async(f"load_json[{size}]", lambda: load_json(directory / "nickname.json"))
+
+
+@pytest.mark.asyncio
+async def test_find_key_by_value(recorder: BenchmarkRecorder, dataset):
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import find_key_by_value
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+    size, _, data = dataset
+    # 最坏情况：最后一个角色的最后一个昵称
+    alias = next(values[-1] for values in reversed(data.values()) if values)
+    await recorder.run_async(f"find_key_by_value[{size}]", lambda: find_key_by_value(data, alias))
+    index = NicknameIndex(data)
+    recorder.run(f"nickname_index.find[{size}]", lambda: index.find(alias))
+    recorder.run(f"nickname_index.build[{size}]", lambda: NicknameIndex(data), rounds=5)
+    recorder.run(f"nickname_index.match_miss[{size}]", lambda: index._fuzzy_match("别名不存在", 3))
+
+
+@pytest.mark.asyncio
+async def test_identify_empty_value_keys(recorder: BenchmarkRecorder, dataset):
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import identify_empty_value_keys
+
+    size, _, data = dataset
+    await recorder.run_async(f"identify_empty_value_keys[{size}]", lambda: identify_empty_value_keys(data))
+
+
+def test_list_jpg_files(recorder: BenchmarkRecorder, dataset):
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import list_jpg_files
+
+    size, directory, _ = dataset
+    recorder.run(f"list_jpg_files[{size}]", lambda: list_jpg_files(directory))
+
+
+@pytest.mark.asyncio
+async def test_got_introduction(recorder: BenchmarkRecorder, dataset, mocker: MockerFixture):
+    from nonebot.message import handle_event
+    from nonebot.adapters.onebot.v11 import Message
+
+    from nonebot_plugin_bh3_elysian_realm.plugins import plugin_config
+    from nonebot_plugin_bh3_elysian_realm.utils.image_utils import image_flight
+
+    from ..test_plugin_message_resp.utils import fake_group_message_event_v11
+
+    size, directory, data = dataset
+    mocker.patch.object(plugin_config, "image_path", directory)
+    mocker.patch.object(plugin_config, "nickname_path", directory / "nickname.json")
+    bot = create_stub_bot()
+    alias = next(values[-1] for values in reversed(data.values()) if values)
+    hit = fake_group_message_event_v11(message=Message(f"/乐土{alias}"))
+    miss = fake_group_message_event_v11(message=Message("/乐土不存在的角色"))
+
+    await recorder.run_async(f"got_introduction.hit[{size}]", lambda: handle_event(bot, hit))
+    await recorder.run_async(f"got_introduction.miss[{size}]", lambda: handle_event(bot, miss))
+
+    async def cold():
+        image_flight.forget()
+        await handle_event(bot, hit)
+
+    await recorder.run_async(f"got_introduction.no_reply_cache[{size}]", cold)
+
+
+@pytest.mark.asyncio
+async def test_packed_images(recorder: BenchmarkRecorder, dataset, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackStore
+    from nonebot_plugin_bh3_elysian_realm.utils.image_utils import ImageCache
+
+    size, directory, data = dataset
+    role = next(reversed(data))
+    store = PackStore(tmp_path / "packs")
+    entries = [(name, directory / f"{name}.jpg") for name in data]
+    await recorder.run_async(f"pack.build[{size}]", lambda: store.build(directory, "original", entries), rounds=3)
+    recorder.run(f"pack.read[{size}]", lambda: store.read(directory, "original", role))
+    recorder.run(f"pack.roles[{size}]", lambda: store.roles(directory, "original"))
+    # 对比：不经缓存直接读取文件
+    cache = ImageCache(0)
+    await recorder.run_async(f"file.read[{size}]", lambda: cache.get(directory / f"{role}.jpg"))
+    store.close()
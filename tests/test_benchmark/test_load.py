@@ -0,0 +1,166 @@
+import os
+import random
+import asyncio
+import subprocess
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import pytest
+from pytest_mock import MockerFixture
+from nonebot import logger, get_driver
+
+from .utils import Session, BenchmarkRecorder, run_load, make_dataset, create_stub_bot, create_stub_bot_v12
+
+# 负载规模：查询事件数与同时处理的会话数
+LOAD_EVENTS = int(os.environ.get("ELYSIAN_LOAD_EVENTS", "2000"))
+LOAD_CONCURRENCY = int(os.environ.get("ELYSIAN_LOAD_CONCURRENCY", "100"))
+# 模拟实现端的 API 往返耗时
+API_LATENCY = float(os.environ.get("ELYSIAN_LOAD_API_LATENCY", "0.005"))
+GROUPS = 200
+SUPERUSERS = [str(9000 + index) for index in range(10)]
+
+
+def git(*args: str, cwd: Path) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@test", *args],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture(scope="module")
+def repository(tmp_path_factory) -> Tuple[Path, Path, Path, List[str]]:
+    """生成 68 个角色的源仓库并克隆为图片目录，nickname.json 放在仓库之外"""
+    root = tmp_path_factory.mktemp("load")
+    origin = root / "origin"
+    data = make_dataset(origin, 68)
+    nickname_path = root / "nickname.json"
+    (origin / "nickname.json").replace(nickname_path)
+    git("init", "-q", cwd=origin)
+    git("add", "-A", cwd=origin)
+    git("commit", "-q", "-m", "init", cwd=origin)
+    image_path = root / "images"
+    git("clone", "-q", origin.as_uri(), str(image_path), cwd=root)
+    aliases = [alias for values in data.values() for alias in values]
+    return origin, image_path, nickname_path, aliases
+
+
+def make_sessions(aliases: List[str], roles: List[str], seed: int = 0) -> List[Session]:
+    """
+    生成混合负载：分布在多个群与私聊、V11 与 V12 之间的查询（约 10% 未命中），
+    以及超级用户的添加昵称对话与资源更新。
+    """
+    from nonebot.adapters.onebot.v11 import Message as MessageV11
+    from nonebot.adapters.onebot.v12 import Message as MessageV12
+
+    from ..test_plugin_message_resp.utils import (
+        fake_group_message_event_v11,
+        fake_group_message_event_v12,
+        fake_private_message_event_v11,
+        fake_private_message_event_v12,
+    )
+
+    rng = random.Random(seed)
+    bot_v11 = create_stub_bot(latency=API_LATENCY)
+    bot_v12 = create_stub_bot_v12(latency=API_LATENCY)
+
+    def event(kind: int, user: int, text: str) -> Tuple[Any, Any]:
+        group = user % GROUPS
+        if kind == 0:
+            return bot_v11, fake_group_message_event_v11(message=MessageV11(text), user_id=user, group_id=group)
+        if kind == 1:
+            return bot_v11, fake_private_message_event_v11(message=MessageV11(text), user_id=user)
+        if kind == 2:
+            return bot_v12, fake_group_message_event_v12(
+                message=MessageV12(text), original_message=MessageV12(text), user_id=str(user), group_id=str(group)
+            )
+        return bot_v12, fake_private_message_event_v12(
+            message=MessageV12(text), original_message=MessageV12(text), user_id=str(user)
+        )
+
+    sessions: List[Session] = []
+    for index in range(LOAD_EVENTS):
+        alias = rng.choice(aliases) if rng.random() < 0.9 else f"不存在{index}"
+        sessions.append([event(rng.randrange(4), 10000 + index, f"/乐土{alias}")])
+    for superuser in SUPERUSERS:
+        kind = rng.randrange(4)
+        sessions.append(
+            [
+                event(kind, int(superuser), "/添加乐土昵称"),
+                event(kind, int(superuser), rng.choice(roles)),
+                event(kind, int(superuser), f"负载{superuser}"),
+            ]
+        )
+    for superuser in SUPERUSERS[:3]:
+        sessions.append([event(rng.randrange(4), int(superuser), "/乐土更新")])
+    rng.shuffle(sessions)
+    return sessions
+
+
+@pytest.fixture
+def load_env(repository, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+    from nonebot_plugin_bh3_elysian_realm.utils.image_utils import image_flight
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource
+    from nonebot_plugin_bh3_elysian_realm.utils import source_index, update_poller
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import nickname_index
+
+    origin, image_path, nickname_path, aliases = repository
+    mocker.patch.object(plugin_config, "image_path", image_path)
+    # 更新指令作用于测试仓库而不是插件自带的资源目录
+    mocker.patch.object(source_index, "sources", [ImageSource(str(origin), image_path, update_poller, upstream=True)])
+    source_index.rebuild()
+    mocker.patch.object(plugin_config, "nickname_path", nickname_path)
+    mocker.patch.object(get_driver().config, "superusers", set(SUPERUSERS))
+    image_flight.forget()
+    roles = [path.stem for path in image_path.glob("*.jpg")]
+    yield make_sessions(aliases, roles)
+    nickname_index.invalidate()
+    mocker.stopall()
+    source_index.rebuild()
+
+
+@pytest.mark.asyncio
+async def test_load(recorder: BenchmarkRecorder, load_env):
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import nickname_index
+
+    result = recorder.record("load.mixed", await run_load(load_env, LOAD_CONCURRENCY))
+    await nickname_index.flush()
+    logger.info(f"load.mixed: {result}")
+
+
+@pytest.mark.asyncio
+async def test_load_during_git_pull(recorder: BenchmarkRecorder, load_env, repository, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.git_utils import git_pull
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import nickname_index
+
+    origin, *_ = repository
+    background = tmp_path / "background"
+    git("clone", "-q", origin.as_uri(), str(background), cwd=tmp_path)
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    pulls = 0
+
+    async def pull_forever() -> None:
+        # 源仓库不断产生新提交，后台持续拉取
+        nonlocal pulls
+        while not stopped.is_set():
+            blob = origin / f"blob_{pulls}.bin"
+            await loop.run_in_executor(None, blob.write_bytes, os.urandom(2 * 1024 * 1024))
+            await loop.run_in_executor(None, lambda: git("add", "-A", cwd=origin))
+            await loop.run_in_executor(None, lambda: git("commit", "-q", "-m", "blob", cwd=origin))
+            assert await git_pull(background) is True
+            pulls += 1
+
+    task = loop.create_task(pull_forever())
+    try:
+        result = await run_load(load_env, LOAD_CONCURRENCY)
+    finally:
+        stopped.set()
+        await task
+    await nickname_index.flush()
+    result["git_pulls"] = pulls
+    recorder.record("load.mixed_during_git_pull", result)
+    logger.info(f"load.mixed_during_git_pull: {result}")
+    assert pulls > 0
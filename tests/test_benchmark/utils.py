@@ -0,0 +1,231 @@
+import json
+import math
+import time
+import random
+import asyncio
+import platform
+import contextlib
+import statistics
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Callable, Optional, Sequence, Awaitable
+
+from PIL import Image
+
+# 基准数据集规模：当前 68 个角色至数千个角色
+DATASET_SIZES = [68, 1000, 5000]
+
+
+def make_dataset(directory: Path, roles: int, aliases: int = 4, seed: int = 0) -> Dict[str, List[str]]:
+    """
+    生成合成的 nickname.json 与对应的攻略图片。
+
+    参数:
+        directory (Path): 输出目录，nickname.json 与图片均写入此目录。
+        roles (int): 角色数量。
+        aliases (int): 每个角色的昵称数量，约 5% 的角色没有昵称。
+        seed (int): 随机种子。
+
+    返回:
+        Dict[str, List[str]]: nickname 数据。
+    """
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    data = {
+        f"Role_{index}": (
+            [] if rng.random() < 0.05 else [f"角色{index}", *(f"别名{index}_{j}" for j in range(aliases - 1))]
+        )
+        for index in range(roles)
+    }
+    (directory / "nickname.json").write_text(json.dumps(data, ensure_ascii=False, indent=4), encoding="utf-8")
+    Image.new("RGB", (64, 64)).save(directory / "template.jpg", "JPEG")
+    template = (directory / "template.jpg").read_bytes()
+    (directory / "template.jpg").unlink()
+    for role in data:
+        (directory / f"{role}.jpg").write_bytes(template)
+    return data
+
+
+class BenchmarkRecorder:
+    """记录各用例的耗时并输出为 JSON"""
+
+    def __init__(self, rounds: int = 50):
+        self.rounds = rounds
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def _record(self, name: str, samples: List[float]) -> Dict[str, Any]:
+        result = {
+            "rounds": len(samples),
+            "min": min(samples),
+            "median": statistics.median(samples),
+            "mean": statistics.fmean(samples),
+            "max": max(samples),
+        }
+        self.results[name] = result
+        return result
+
+    def run(self, name: str, func: Callable[[], Any], rounds: int = 0) -> Dict[str, Any]:
+        samples = []
+        for _ in range(rounds or self.rounds):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        return self._record(name, samples)
+
+    async def run_async(self, name: str, func: Callable[[], Awaitable[Any]], rounds: int = 0) -> Dict[str, Any]:
+        samples = []
+        for _ in range(rounds or self.rounds):
+            start = time.perf_counter()
+            await func()
+            samples.append(time.perf_counter() - start)
+        return self._record(name, samples)
+
+    def record(self, name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """记录已计算好的结果，如负载测试报告"""
+        self.results[name] = result
+        return result
+
+    def dump(self, output: Path) -> None:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "results": self.results,
+        }
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=4), encoding="utf-8")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    比较两次基准结果的中位数耗时。
+
+    参数:
+        baseline (Dict[str, Any]): 基准结果。
+        current (Dict[str, Any]): 本次结果。
+        tolerance (float): 允许的耗时倍数。
+
+    返回:
+        List[str]: 超出允许倍数的用例说明。
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous and result["median"] > previous["median"] * tolerance:
+            regressions.append(f"{name}: {previous['median']:.6f}s -> {result['median']:.6f}s")
+    return regressions
+
+
+def create_stub_bot(self_id: str = "1", latency: float = 0):
+    """创建不连接任何实现端的 OneBot V11 Bot，所有 API 调用在 latency 秒后返回"""
+    from nonebot import get_adapter
+    from nonebot.adapters.onebot.v11 import Bot, Adapter
+
+    class StubBot(Bot):
+        async def call_api(self, api: str, **data: Any) -> Any:
+            if latency:
+                await asyncio.sleep(latency)
+            return {"message_id": 1}
+
+    return StubBot(get_adapter(Adapter), self_id)
+
+
+def create_stub_bot_v12(self_id: str = "test", latency: float = 0):
+    """创建不连接任何实现端的 OneBot V12 Bot，上传文件与发送消息在 latency 秒后返回"""
+    from nonebot import get_adapter
+    from nonebot.adapters.onebot.v12 import Bot, Adapter
+
+    class StubBot(Bot):
+        async def call_api(self, api: str, **data: Any) -> Any:
+            if latency:
+                await asyncio.sleep(latency)
+            return {"message_id": "1", "file_id": "1", "time": 0}
+
+    return StubBot(get_adapter(Adapter), self_id, impl="stub", platform="qq")
+
+
+def percentile(samples: Sequence[float], percent: float) -> float:
+    """最近秩法计算百分位数，samples 需已排序"""
+    if not samples:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(samples)), 1)
+    return samples[rank - 1]
+
+
+class LoopLagMonitor:
+    """
+    以固定间隔休眠并记录实际唤醒时间超出预期的部分，即事件循环被阻塞的时长。
+
+    用法:
+        async with LoopLagMonitor() as monitor:
+            ...
+        monitor.samples
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - start - self.interval, 0))
+
+    async def __aenter__(self) -> "LoopLagMonitor":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+
+# 一次会话为同一用户依次发送的若干事件
+Session = List[Tuple[Any, Any]]
+
+
+async def run_load(sessions: List[Session], concurrency: int) -> Dict[str, Any]:
+    """
+    并发处理多个会话的事件，会话内按顺序处理，最多同时处理 concurrency 个会话。
+
+    参数:
+        sessions (List[Session]): 会话列表，每个会话为 (bot, event) 列表。
+        concurrency (int): 最大并发会话数。
+
+    返回:
+        Dict[str, Any]: 事件数、吞吐量（事件/秒）、各百分位延迟与事件循环延迟（秒）。
+    """
+    from nonebot.message import handle_event
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def worker(session: Session) -> None:
+        async with semaphore:
+            for bot, event in session:
+                start = time.perf_counter()
+                await handle_event(bot, event)
+                latencies.append(time.perf_counter() - start)
+
+    async with LoopLagMonitor() as monitor:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for session in sessions))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    lags = sorted(monitor.samples)
+    return {
+        "rounds": len(latencies),
+        "min": latencies[0],
+        "median": percentile(latencies, 50),
+        "mean": statistics.fmean(latencies),
+        "max": latencies[-1],
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "throughput": len(latencies) / elapsed,
+        "loop_lag_p99": percentile(lags, 99),
+        "loop_lag_max": lags[-1] if lags else 0.0,
+    }
@@ -10,3 +10,11 @@ def _load_bot(nonebug_init: None):
     driver = nonebot.get_driver()
     driver.register_adapter(OnebotV11Adapter)
     driver.register_adapter(OnebotV12Adapter)
+
+
+@pytest.fixture(autouse=True)
+def _reset_limits():
+    # 各用例使用相同的用户与群，避免互相触发限流与去重
+    from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import reset_limits
+
+    reset_limits()
@@ -1,3 +1,4 @@
+import json
 from pathlib import Path
 
 import pytest
@@ -5,10 +6,15 @@ from nonebug import App
 from pytest_mock import MockerFixture
 from nonebug_saa import should_send_saa
 from nonebot import get_driver, get_adapter
-from nonebot_plugin_saa import Image, MessageFactory
+from nonebot.adapters.onebot.v12 import Bot as BotV12
 from nonebot.adapters.onebot.v11 import Bot, Adapter, Message
+from nonebot.adapters.onebot.v12 import Adapter as AdapterV12
+from nonebot.adapters.onebot.v12 import Message as MessageV12
+from nonebot.adapters.onebot.v12.exception import FileSystemError
+from nonebot.adapters.onebot.v12 import MessageSegment as MessageSegmentV12
+from nonebot_plugin_saa import Text, Image, MessageFactory, AggregatedMessageFactory
 
-from .utils import fake_group_message_event_v11
+from .utils import fake_group_message_event_v11, fake_group_message_event_v12
 
 
 @pytest.mark.asyncio
@@ -16,6 +22,7 @@ async def test_update_elysian_realm(app: App, mocker: MockerFixture):
     from nonebot_plugin_bh3_elysian_realm.plugins import update_elysian_realm
 
     mocker.patch.object(get_driver().config, "superusers", {"10"})
+    mocker.patch("nonebot_plugin_bh3_elysian_realm.plugins.update_resources", return_value=True)
 
     async with app.test_matcher(update_elysian_realm) as ctx:
         adapter = get_adapter(Adapter)
@@ -28,6 +35,24 @@ async def test_update_elysian_realm(app: App, mocker: MockerFixture):
         ctx.should_finished()
 
 
+@pytest.mark.asyncio
+async def test_update_elysian_realm_failed(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.plugins import update_elysian_realm
+
+    mocker.patch.object(get_driver().config, "superusers", {"10"})
+    mocker.patch("nonebot_plugin_bh3_elysian_realm.plugins.update_resources", return_value=False)
+
+    async with app.test_matcher(update_elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        message = Message("/乐土更新")
+        event = fake_group_message_event_v11(message=message, sender={"role": "owner"})
+
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "更新失败", True)
+        ctx.should_finished()
+
+
 @pytest.mark.asyncio
 async def test_none_nickname(app: App, mocker: MockerFixture):
     from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
@@ -37,6 +62,26 @@ async def test_none_nickname(app: App, mocker: MockerFixture):
         plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
     )
 
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        message = Message("/乐土琪亚娜")
+        event = fake_group_message_event_v11(message=message)
+
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "未找到指定角色: 琪亚娜", True)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_nickname_suggestion(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    mocker.patch.object(plugin_config, "image_path", Path(Path(__file__).parent.parent / "test_res"))
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+
     async with app.test_matcher(elysian_realm) as ctx:
         adapter = get_adapter(Adapter)
         bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
@@ -44,7 +89,7 @@ async def test_none_nickname(app: App, mocker: MockerFixture):
         event = fake_group_message_event_v11(message=message)
 
         ctx.receive_event(bot, event)
-        ctx.should_call_send(event, "未找到指定角色: 人人", True)
+        ctx.should_call_send(event, "未找到指定角色: 人人\n你是不是要找: 人律", True)
         ctx.should_finished()
 
 
@@ -66,8 +111,335 @@ async def test_elysian_realm(app: App, mocker: MockerFixture):
         ctx.receive_event(bot, event)
         should_send_saa(
             ctx,
-            MessageFactory(Image(Path(__file__).parent.parent / "test_res" / "Human.jpg")),
+            MessageFactory(Image((Path(__file__).parent.parent / "test_res" / "Human.jpg").read_bytes())),
             bot,
             event=event,
         )
         ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_elysian_realm_trace(app: App, mocker: MockerFixture, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils import trace_utils
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    mocker.patch.object(plugin_config, "image_path", Path(Path(__file__).parent.parent / "test_res"))
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+    mocker.patch.object(plugin_config, "trace_sample_rate", 1)
+    mocker.patch.object(trace_utils, "exporter", trace_utils.TraceExporter(tmp_path / "traces.jsonl"))
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        event = fake_group_message_event_v11(message=Message("/乐土人律"))
+
+        ctx.receive_event(bot, event)
+        should_send_saa(
+            ctx,
+            MessageFactory(Image((Path(__file__).parent.parent / "test_res" / "Human.jpg").read_bytes())),
+            bot,
+            event=event,
+        )
+        ctx.should_finished()
+
+    exported = json.loads((tmp_path / "traces.jsonl").read_text("utf-8"))
+    spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    names = [item["name"] for item in spans if item["name"] != "load_json"]
+    assert names == ["elysian_realm", "parse", "got_introduction", "load_index", "resolve", "read_image", "send"]
+    attributes = {item["key"]: item["value"]["stringValue"] for item in spans[0]["attributes"]}
+    assert attributes == {"adapter": "OneBot V11", "query": "人律", "role": "Human"}
+
+
+@pytest.mark.asyncio
+async def test_elysian_realm_upload_reference(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import reset_limits
+    from nonebot_plugin_bh3_elysian_realm.utils.upload_utils import upload_cache
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    mocker.patch.object(plugin_config, "image_path", Path(Path(__file__).parent.parent / "test_res"))
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+    upload_cache.clear()
+    image = (Path(__file__).parent.parent / "test_res" / "Human.jpg").read_bytes()
+    upload = {"type": "data", "name": "Human.jpg", "data": image}
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(AdapterV12)
+        bot = ctx.create_bot(base=BotV12, adapter=adapter, auto_connect=False, platform="qq", impl="walle")
+        event = fake_group_message_event_v12(message=MessageV12("/乐土人律"))
+        ctx.receive_event(bot, event)
+        ctx.should_call_api("upload_file", upload, {"file_id": "file-1"})
+        ctx.should_call_send(event, MessageSegmentV12.image("file-1"), True)
+        ctx.should_finished()
+
+    # 再次发送使用已上传的文件，文件被清理后重新上传
+    reset_limits()
+    async with app.test_matcher(elysian_realm) as ctx:
+        bot = ctx.create_bot(base=BotV12, adapter=adapter, auto_connect=False, platform="qq", impl="walle")
+        event = fake_group_message_event_v12(message=MessageV12("/乐土人律"))
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, MessageSegmentV12.image("file-1"), True)
+        ctx.should_finished()
+
+    reset_limits()
+    async with app.test_matcher(elysian_realm) as ctx:
+        bot = ctx.create_bot(base=BotV12, adapter=adapter, auto_connect=False, platform="qq", impl="walle")
+        event = fake_group_message_event_v12(message=MessageV12("/乐土人律"))
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(
+            event, MessageSegmentV12.image("file-1"), exception=FileSystemError("failed", 33001, "file not found", None)
+        )
+        ctx.should_call_api("upload_file", upload, {"file_id": "file-2"})
+        ctx.should_call_send(event, MessageSegmentV12.image("file-2"), True)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_resources_loading(app: App, mocker: MockerFixture, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config, resources_state
+
+    mocker.patch.object(plugin_config, "image_path", tmp_path)
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+    mocker.patch.object(resources_state, "loading", True)
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        message = Message("/乐土人律")
+        event = fake_group_message_event_v11(message=message)
+
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "乐土攻略资源加载中，请稍后再试", True)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_rate_limited(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils import limit_utils
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+    mocker.patch.object(plugin_config, "rate_limit_message", "查询过于频繁，请稍后再试")
+    mocker.patch.object(limit_utils, "user_limiter", limit_utils.RateLimiter(0.001, 1))
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        first = fake_group_message_event_v11(message=Message("/乐土琪亚娜"))
+        second = fake_group_message_event_v11(message=Message("/乐土芽衣"))
+
+        ctx.receive_event(bot, first)
+        ctx.should_call_send(first, "未找到指定角色: 琪亚娜", True)
+        ctx.should_finished()
+        ctx.receive_event(bot, second)
+        ctx.should_call_send(second, "查询过于频繁，请稍后再试", True)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_query(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        first = fake_group_message_event_v11(message=Message("/乐土琪亚娜"), user_id=10)
+        second = fake_group_message_event_v11(message=Message("/乐土琪亚娜"), user_id=11)
+
+        ctx.receive_event(bot, first)
+        ctx.should_call_send(first, "未找到指定角色: 琪亚娜", True)
+        ctx.should_finished()
+        ctx.receive_event(bot, second)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_role_overview(app: App, mocker: MockerFixture, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.overview_utils import OverviewCache
+    from nonebot_plugin_bh3_elysian_realm.plugins import plugin_config, role_overview
+    from nonebot_plugin_bh3_elysian_realm.utils import overview_flight, prepare_overview
+
+    mocker.patch.object(plugin_config, "image_path", Path(Path(__file__).parent.parent / "test_res"))
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+    mocker.patch("nonebot_plugin_bh3_elysian_realm.utils.overview_cache", OverviewCache(tmp_path))
+    overview_flight.forget()
+    # 第二次请求直接读取磁盘缓存
+    expected = await prepare_overview()
+    overview_flight.forget()
+
+    async with app.test_matcher(role_overview) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        event = fake_group_message_event_v11(message=Message("/乐土列表"))
+
+        ctx.receive_event(bot, event)
+        should_send_saa(ctx, MessageFactory(Image(expected)), bot, event=event)
+        ctx.should_finished()
+
+    overview_flight.forget()
+
+
+@pytest.mark.asyncio
+async def test_batch_query_forward(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    mocker.patch.object(plugin_config, "image_path", Path(Path(__file__).parent.parent / "test_res"))
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        event = fake_group_message_event_v11(message=Message("/乐土 人律 爱律 大格蕾修混合流"))
+
+        ctx.receive_event(bot, event)
+        # 重复的角色只发送一次，缺少图片的角色合并为一条提示
+        should_send_saa(
+            ctx,
+            AggregatedMessageFactory(
+                [
+                    MessageFactory(Text("未找到角色攻略图片: CosmicExpression_Mixed")),
+                    MessageFactory(Image((Path(__file__).parent.parent / "test_res" / "Human.jpg").read_bytes())),
+                ]
+            ),
+            bot,
+            event=event,
+        )
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_batch_query_single_message(app: App, mocker: MockerFixture, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    image = (Path(__file__).parent.parent / "test_res" / "Human.jpg").read_bytes()
+    (tmp_path / "Human.jpg").write_bytes(image)
+    (tmp_path / "CosmicExpression_Mixed.jpg").write_bytes(image)
+    mocker.patch.object(plugin_config, "image_path", tmp_path)
+    mocker.patch.object(
+        plugin_config, "nickname_path", Path(Path(__file__).parent.parent / "test_res" / "test_nickname.json")
+    )
+    # 不支持合并转发的适配器在同一条消息中发送全部图片
+    mocker.patch.dict(AggregatedMessageFactory.sender, clear=True)
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        event = fake_group_message_event_v11(message=Message("/乐土 人律 大格蕾修混合流"))
+
+        ctx.receive_event(bot, event)
+        should_send_saa(ctx, MessageFactory([Image(image), Image(image)]), bot, event=event)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("query", "role"),
+    [("雷律 平a", "Thunder_Attack"), ("梅比 乌丝", "Lnfinite"), ("格 蕾", "Starry"), ("人律 琪亚娜", None)],
+)
+async def test_multi_word_query_single_role(app: App, mocker: MockerFixture, tmp_path: Path, query: str, role: str):
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    image = (Path(__file__).parent.parent / "test_res" / "Human.jpg").read_bytes()
+    for name in ("Human", "Thunder", "Thunder_Attack", "Lnfinite", "Starry"):
+        (tmp_path / f"{name}.jpg").write_bytes(image)
+    nickname_path = tmp_path / "nickname.json"
+    nickname_path.write_text(
+        json.dumps(
+            {
+                "Human": ["人律"],
+                "Starry": ["繁星", "格蕾修"],
+                "Thunder": ["雷律"],
+                "Thunder_Attack": ["雷律3", "雷律平A流"],
+                "Lnfinite": ["梅比乌斯"],
+            }
+        ),
+        encoding="utf-8",
+    )
+    mocker.patch.object(plugin_config, "image_path", tmp_path)
+    mocker.patch.object(plugin_config, "nickname_path", nickname_path)
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        event = fake_group_message_event_v11(message=Message(f"/乐土 {query}"))
+
+        ctx.receive_event(bot, event)
+        # 整句能匹配时按单个角色回复，不拆分为多个角色
+        if role is None:
+            ctx.should_call_send(event, f"未找到指定角色: {query}\n你是不是要找: 人律", True)
+        else:
+            should_send_saa(ctx, MessageFactory(Image(image)), bot, event=event)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+async def test_batch_query_limit(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.plugins import elysian_realm, plugin_config
+
+    mocker.patch.object(plugin_config, "batch_query_limit", 2)
+
+    async with app.test_matcher(elysian_realm) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+        event = fake_group_message_event_v11(message=Message("/乐土 人律 空律 雷律"))
+
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "一次最多查询 2 个角色", True)
+        ctx.should_finished()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("nickname", "reply"),
+    [
+        ("空律,人律", "添加成功\nVoid: ['空律']\n以下昵称已属于其它角色，未添加: 人律(Human)"),
+        ("人律", "未添加新昵称\nVoid: []\n以下昵称已属于其它角色，未添加: 人律(Human)"),
+    ],
+)
+async def test_add_nickname_conflict(app: App, mocker: MockerFixture, tmp_path: Path, nickname: str, reply: str):
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter
+    from nonebot_plugin_bh3_elysian_realm.plugins import add_nickname, plugin_config
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndexManager
+
+    nickname_path = tmp_path / "nickname.json"
+    nickname_path.write_text('{"Human": ["人律"], "Void": []}', encoding="utf-8")
+    mocker.patch.object(plugin_config, "nickname_path", nickname_path)
+    mocker.patch("nonebot_plugin_bh3_elysian_realm.plugins.nickname_index", NicknameIndexManager(JsonWriter(0)))
+    mocker.patch.object(get_driver().config, "superusers", {"10"})
+
+    async with app.test_matcher(add_nickname) as ctx:
+        adapter = get_adapter(Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter, auto_connect=False)
+
+        event = fake_group_message_event_v11(message=Message("/添加乐土昵称"))
+        ctx.receive_event(bot, event)
+        should_send_saa(
+            ctx, MessageFactory(Text("nickname.json空值列表: ['Void']\n以上为没有昵称的图片文件名")), bot, event=event
+        )
+        ctx.should_call_send(event, "图片文件名", True)
+        ctx.should_rejected()
+
+        event = fake_group_message_event_v11(message=Message("Void"))
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(event, "昵称", True)
+        ctx.should_rejected()
+
+        event = fake_group_message_event_v11(message=Message(nickname))
+        ctx.receive_event(bot, event)
+        should_send_saa(ctx, MessageFactory(Text(reply)), bot, event=event)
+        ctx.should_finished()
@@ -0,0 +1,179 @@
+import io
+import os
+import tarfile
+import threading
+from pathlib import Path
+from typing import Dict, List
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+
+def make_archive(files: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(f"ElysianRealm-Data-master/{name}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+class ArchiveServer:
+    """模拟提供仓库归档的 HTTP 服务器，支持 ETag 与 Range"""
+
+    def __init__(self):
+        self.archive = b""
+        self.etag = '"0"'
+        self.requests: List[Dict[str, str]] = []
+        self.truncate_at = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = server.archive
+                status = 200
+                range_header = self.headers.get("Range")
+                if range_header and self.headers.get("If-Range") == server.etag:
+                    start = int(range_header.split("=")[1].rstrip("-"))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(body)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    body = body[start:]
+                    status = 206
+                self.send_response(status)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if server.truncate_at:
+                    self.wfile.write(body[: server.truncate_at])
+                    self.wfile.flush()
+                    self.connection.close()
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/archive/HEAD.tar.gz"
+
+    def publish(self, files: Dict[str, bytes], etag: str):
+        self.archive = make_archive(files)
+        self.etag = etag
+
+
+@pytest.fixture
+def archive_server():
+    server = ArchiveServer()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.mark.asyncio
+class TestArchiveFetch:
+    async def test_download_and_revalidate(self, tmp_path: Path, archive_server: ArchiveServer):
+        from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import archive_fetch
+
+        image_path = tmp_path / "images"
+        image_path.mkdir()
+        (image_path / ".gitkeep").touch()
+        state_dir = tmp_path / "state"
+        archive_server.publish({"Human.jpg": b"1", "Void.jpg": b"2"}, '"v1"')
+
+        assert await archive_fetch(archive_server.url, image_path, None, state_dir) is True
+        assert (image_path / "Human.jpg").read_bytes() == b"1"
+        assert (image_path / "Void.jpg").read_bytes() == b"2"
+
+        assert await archive_fetch(archive_server.url, image_path, None, state_dir) is False
+        assert archive_server.requests[-1]["If-None-Match"] == '"v1"'
+
+        # 只删除上次解压出的文件，用户放入的文件保留
+        (image_path / "Local.jpg").write_bytes(b"local")
+        archive_server.publish({"Human.jpg": b"3"}, '"v2"')
+        assert await archive_fetch(archive_server.url, image_path, None, state_dir) is True
+        assert (image_path / "Human.jpg").read_bytes() == b"3"
+        assert not (image_path / "Void.jpg").exists()
+        assert (image_path / ".gitkeep").exists()
+        assert (image_path / "Local.jpg").read_bytes() == b"local"
+
+    async def test_resume(self, tmp_path: Path, archive_server: ArchiveServer):
+        from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import archive_fetch
+
+        image_path = tmp_path / "images"
+        state_dir = tmp_path / "state"
+        files = {f"{index}.jpg": os.urandom(64 * 1024) for index in range(16)}
+        archive_server.publish(files, '"v1"')
+        archive_server.truncate_at = len(archive_server.archive) // 2
+
+        assert await archive_fetch(archive_server.url, image_path, None, state_dir) is None
+        partial = (state_dir / "archive.tar.gz.part").stat().st_size
+        assert 0 < partial < len(archive_server.archive)
+
+        archive_server.truncate_at = 0
+        assert await archive_fetch(archive_server.url, image_path, None, state_dir) is True
+        assert archive_server.requests[-1]["Range"] == f"bytes={partial}-"
+        assert (image_path / "15.jpg").read_bytes() == files["15.jpg"]
+        assert not (state_dir / "archive.tar.gz.part").exists()
+
+    async def test_resume_complete_part(self, tmp_path: Path, archive_server: ArchiveServer):
+        from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import save_state, archive_fetch
+
+        image_path = tmp_path / "images"
+        state_dir = tmp_path / "state"
+        state_dir.mkdir()
+        archive_server.publish({"Human.jpg": b"1"}, '"v1"')
+        # 下载完整但解压前中断
+        (state_dir / "archive.tar.gz.part").write_bytes(archive_server.archive)
+        save_state(state_dir / "archive.json", {"url": archive_server.url, "partial_etag": '"v1"'})
+
+        assert await archive_fetch(archive_server.url, image_path, None, state_dir) is True
+        assert archive_server.requests[0]["Range"] == f"bytes={len(archive_server.archive)}-"
+        assert "Range" not in archive_server.requests[1]
+        assert (image_path / "Human.jpg").read_bytes() == b"1"
+        assert not (state_dir / "archive.tar.gz.part").exists()
+
+    async def test_http_error(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import archive_fetch
+
+        assert await archive_fetch("http://127.0.0.1:1/archive.tar.gz", tmp_path / "images", None, tmp_path) is None
+
+
+def test_extract_skips_unsafe_members(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import extract_archive
+
+    archive = tmp_path / "archive.tar.gz"
+    archive.write_bytes(make_archive({"Human.jpg": b"1", "../evil.jpg": b"2", ".github/ci.yml": b"3"}))
+    assert extract_archive(archive, tmp_path / "images") == {"Human.jpg"}
+    assert not (tmp_path / "evil.jpg").exists()
+
+
+def test_forget_validators(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import load_state, save_state, forget_validators
+
+    state_file = tmp_path / "archive.json"
+    save_state(state_file, {"url": "https://example.com", "etag": '"1"', "last_modified": "now"})
+    forget_validators(tmp_path)
+    assert load_state(state_file) == {"url": "https://example.com"}
+
+
+def test_archive_validator(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.archive_utils import save_state, archive_validator
+
+    state_file = tmp_path / "archive.json"
+    assert archive_validator(tmp_path) is None
+    save_state(state_file, {"url": "https://example.com", "etag": "", "last_modified": "now"})
+    assert archive_validator(tmp_path) == "now"
+    save_state(state_file, {"url": "https://example.com", "etag": '"1"', "last_modified": "now"})
+    assert archive_validator(tmp_path) == '"1"'
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    async def test_coalesce_concurrent_calls(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+
+        calls = 0
+
+        async def prepare():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return b"image"
+
+        flight = SingleFlight(ttl=0)
+        results = await asyncio.gather(*(flight.do("Human", prepare) for _ in range(10)))
+        assert results == [b"image"] * 10
+        assert calls == 1
+
+    async def test_ttl_reuse_and_forget(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+
+        calls = 0
+
+        async def prepare():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        flight = SingleFlight(ttl=60)
+        assert await flight.do("Human", prepare) == 1
+        assert await flight.do("Human", prepare) == 1
+        assert await flight.do("Void", prepare) == 2
+        flight.forget("Human")
+        assert await flight.do("Human", prepare) == 3
+        flight.forget()
+        assert await flight.do("Void", prepare) == 4
+
+    async def test_exception_not_cached(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+
+        calls = 0
+
+        async def prepare():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise FileNotFoundError
+
+        flight = SingleFlight(ttl=60)
+        results = await asyncio.gather(*(flight.do("Human", prepare) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, FileNotFoundError) for result in results)
+        assert calls == 1
+        with pytest.raises(FileNotFoundError):
+            await flight.do("Human", prepare)
+        assert calls == 2
+
+    async def test_max_size(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+
+        async def prepare():
+            return 0
+
+        flight = SingleFlight(ttl=60, max_size=2)
+        for key in range(5):
+            await flight.do(key, prepare)
+        assert len(flight._results) == 2
+
+    async def test_expired_results_evicted(self, mocker):
+        from nonebot_plugin_bh3_elysian_realm.utils import cache_utils
+        from nonebot_plugin_bh3_elysian_realm.utils.cache_utils import SingleFlight
+
+        async def prepare():
+            return b"image"
+
+        now = 1000.0
+        clock = mocker.patch.object(cache_utils, "time")
+        clock.monotonic.side_effect = lambda: now
+        flight = SingleFlight(ttl=10)
+        for key in range(3):
+            await flight.do(key, prepare)
+        assert len(flight._results) == 3
+
+        # 过期的结果在下次调用时即被释放，不必等到数量达到上限
+        now += 11
+        await flight.do("Void", prepare)
+        assert list(flight._results) == ["Void"]
+
+        no_cache = SingleFlight(ttl=0)
+        await no_cache.do("Human", prepare)
+        assert not no_cache._results
@@ -1,3 +1,5 @@
+import os
+import asyncio
 from pathlib import Path
 from unittest.mock import patch
 from tempfile import NamedTemporaryFile
@@ -69,6 +71,23 @@ class TestSaveJsonFiles:
         with pytest.raises(expected_exception=FileNotFoundError, match="文件 .* 不存在或不是一个JSON文件。"):
             save_json(file, {})
 
+    @pytest.mark.skipif(os.name == "nt", reason="Windows 不支持 POSIX 权限")
+    async def test_keep_mode(self, temp_json_file):
+        from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json
+
+        temp_json_file.chmod(0o644)
+        save_json(temp_json_file, {"Human": ["人律"]})
+        assert temp_json_file.stat().st_mode & 0o777 == 0o644
+
+    async def test_create(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.file_utils import load_json, save_json
+
+        path = tmp_path / "state" / "state.json"
+        save_json(path, {"failures": 1}, create=True)
+        assert await load_json(path) == {"failures": 1}
+        with pytest.raises(expected_exception=FileNotFoundError, match="文件 .* 不存在或不是一个JSON文件。"):
+            save_json(tmp_path / "state.txt", {}, create=True)
+
     async def test_illegal_dict(self, temp_json_file):
         from nonebot_plugin_bh3_elysian_realm.utils.file_utils import save_json
 
@@ -162,7 +181,7 @@ async def test_merge_dicts_with_update():
 
 @pytest.mark.asyncio
 class TestCheckURL:
-    @patch("httpx.Client.head")
+    @patch("httpx.AsyncClient.head")
     async def test_check_url_success_and_failure(self, mock_head):
         from nonebot_plugin_bh3_elysian_realm.utils import check_url
 
@@ -176,7 +195,7 @@ class TestCheckURL:
         result = await check_url("https://example.com", proxy_url="http://proxyserver:8080")
         assert result is False
 
-    @patch("httpx.Client.head")
+    @patch("httpx.AsyncClient.head")
     async def test_check_url_request_error(self, mock_head):
         from nonebot_plugin_bh3_elysian_realm.utils import check_url
 
@@ -187,7 +206,7 @@ class TestCheckURL:
         result = await check_url("https://example.com", proxy_url="http://proxyserver:8080")
         assert result is False
 
-    @patch("httpx.Client.head")
+    @patch("httpx.AsyncClient.head")
     async def test_check_url_timeout_exception(self, mock_head):
         from nonebot_plugin_bh3_elysian_realm.utils import check_url
 
@@ -197,3 +216,63 @@ class TestCheckURL:
         # 测试处理 TimeoutException 的情况
         result = await check_url("https://example.com", proxy_url="http://proxyserver:8080")
         assert result is False
+
+
+@pytest.mark.asyncio
+class TestJsonWriter:
+    async def test_save_json_atomic(self, temp_json_file, mocker):
+        from nonebot_plugin_bh3_elysian_realm.utils.file_utils import load_json, save_json
+
+        save_json(temp_json_file, {"Human": ["人律"]})
+        mocker.patch("os.replace", side_effect=OSError("disk full"))
+        with pytest.raises(OSError, match="disk full"):
+            save_json(temp_json_file, {"Human": []})
+        assert await load_json(temp_json_file) == {"Human": ["人律"]}
+        assert list(temp_json_file.parent.glob(f".{temp_json_file.name}.*.tmp")) == []
+
+    async def test_batch_writes(self, temp_json_file, mocker):
+        from nonebot_plugin_bh3_elysian_realm.utils import file_utils
+
+        spy = mocker.spy(file_utils, "save_json")
+        written = []
+        writer = file_utils.JsonWriter(0.05)
+        data = {"Human": ["人律"]}
+        writer.schedule(temp_json_file, data)
+        data["Human"].append("爱律")
+        writer.schedule(temp_json_file, data, on_written=lambda: written.append(True))
+        data["Human"].append("老婆")
+        await asyncio.sleep(0.2)
+
+        assert spy.call_count == 1
+        assert written == [True]
+        assert await file_utils.load_json(temp_json_file) == {"Human": ["人律", "爱律"]}
+
+    async def test_flush(self, temp_json_file):
+        from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter, load_json
+
+        writer = JsonWriter(60)
+        writer.schedule(temp_json_file, {"Human": ["人律"]})
+        await writer.flush()
+        assert await load_json(temp_json_file) == {"Human": ["人律"]}
+        await writer.flush()
+
+    async def test_flush_waits_for_running_write(self, temp_json_file, mocker):
+        import time
+
+        from nonebot_plugin_bh3_elysian_realm.utils import file_utils
+
+        save_json = file_utils.save_json
+
+        def slow_save(json_file, data):
+            time.sleep(0.2)
+            save_json(json_file, data)
+
+        mocker.patch.object(file_utils, "save_json", slow_save)
+        writer = file_utils.JsonWriter(0)
+        writer.schedule(temp_json_file, {"Human": ["人律"]})
+        await asyncio.sleep(0.05)
+        assert writer.is_pending(temp_json_file)
+        # 关闭前等待已开始的写入完成
+        await writer.flush()
+        assert not writer.is_pending(temp_json_file)
+        assert await file_utils.load_json(temp_json_file) == {"Human": ["人律"]}
@@ -46,3 +46,113 @@ class TestContrastRepositoryUrl:
         with patch("asyncio.create_subprocess_exec", return_value=mock_process):
             result = await contrast_repository_url("https://example.com/repo.git", Path(os.getcwd()))
             assert result is False
+
+
+@pytest.mark.asyncio
+async def test_git_head_and_changed_files(tmp_path: Path):
+    import subprocess
+
+    from nonebot_plugin_bh3_elysian_realm.utils.git_utils import git_head, git_changed_files
+
+    def git(*args: str):
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@test", *args], cwd=tmp_path, check=True)
+
+    assert await git_head(tmp_path) is None
+    git("init", "-q")
+    (tmp_path / "Human.jpg").write_bytes(b"1")
+    git("add", "-A")
+    git("commit", "-q", "-m", "1")
+    old = await git_head(tmp_path)
+    (tmp_path / "Void.jpg").write_bytes(b"2")
+    git("add", "-A")
+    git("commit", "-q", "-m", "2")
+    new = await git_head(tmp_path)
+
+    assert old is not None
+    assert new is not None
+    assert old != new
+    assert await git_changed_files(tmp_path, old, new) == ["Void.jpg"]
+
+
+@pytest.fixture
+def remote_repository(tmp_path: Path):
+    import subprocess
+
+    def git(*args: str, cwd: Path):
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@test", *args], cwd=cwd, check=True)
+
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    git("init", "-q", cwd=origin)
+    (origin / "Human.jpg").write_bytes(b"1")
+    git("add", "-A", cwd=origin)
+    git("commit", "-q", "-m", "1", cwd=origin)
+    return origin, git
+
+
+@pytest.mark.asyncio
+async def test_git_clone_and_pull(tmp_path: Path, remote_repository):
+    from nonebot_plugin_bh3_elysian_realm.utils.git_utils import git_pull, git_clone
+
+    origin, git = remote_repository
+    image_path = tmp_path / "images"
+    image_path.mkdir()
+    (image_path / ".gitkeep").touch()
+    cwd = os.getcwd()
+
+    assert await git_clone(origin.as_uri(), image_path) is True
+    assert (image_path / "Human.jpg").read_bytes() == b"1"
+
+    (origin / "Void.jpg").write_bytes(b"2")
+    git("add", "-A", cwd=origin)
+    git("commit", "-q", "-m", "2", cwd=origin)
+    assert await git_pull(image_path) is True
+    assert (image_path / "Void.jpg").read_bytes() == b"2"
+    assert os.getcwd() == cwd
+
+
+@pytest.mark.asyncio
+async def test_git_clone_not_empty(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.git_utils import git_clone
+
+    (tmp_path / "Human.jpg").touch()
+    assert await git_clone("https://example.com/repo.git", tmp_path) is False
+
+
+@pytest.mark.asyncio
+async def test_git_pull_failed(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.git_utils import git_pull
+
+    assert await git_pull(tmp_path) is False
+    assert await git_pull(tmp_path / "missing") is False
+
+
+@pytest.mark.asyncio
+async def test_git_stream_lines_and_timeout(mocker):
+    import sys
+
+    from nonebot_plugin_bh3_elysian_realm.utils import git_utils
+
+    script = "import sys, time; sys.stderr.write('a\\rb\\nc'); sys.stderr.flush(); time.sleep(float(sys.argv[1]))"
+    mocker.patch.object(git_utils, "git_command", lambda *args, **kwargs: [sys.executable, "-c", script, *args])
+
+    lines = []
+    result = await git_utils.git_stream("0", on_line=lines.append)
+    assert result.returncode == 0
+    assert lines == ["a", "b", "c"]
+
+    result = await git_utils.git_stream("5", timeout=0.5)
+    assert result.returncode is None
+    assert result.stderr == "a\nb"
+
+
+@pytest.mark.asyncio
+async def test_git_remote_head(tmp_path: Path, remote_repository):
+    from nonebot_plugin_bh3_elysian_realm.utils.git_utils import git_head, git_clone, git_remote_head
+
+    origin, _ = remote_repository
+    image_path = tmp_path / "images"
+    assert await git_clone(origin.as_uri(), image_path) is True
+    assert await git_remote_head(image_path) == await git_head(origin)
+    (tmp_path / "empty").mkdir()
+    assert await git_remote_head(tmp_path / "empty") is None
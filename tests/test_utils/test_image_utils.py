@@ -0,0 +1,201 @@
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+
+class TestImageCache:
+    @pytest.mark.asyncio
+    async def test_hit_and_miss(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import ImageCache
+
+        path = Path(__file__).parent.parent / "test_res" / "Human.jpg"
+        cache = ImageCache(max_size=10 * 1024 * 1024)
+        data = await cache.get(path)
+        assert data == path.read_bytes()
+        assert await cache.get(path) is data
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": len(data), "count": 1}
+
+    @pytest.mark.asyncio
+    async def test_file_not_found(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import ImageCache
+
+        cache = ImageCache(max_size=1024)
+        with pytest.raises(FileNotFoundError):
+            await cache.get(tmp_path / "missing.jpg")
+
+    def test_evict_least_recently_used(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import ImageCache
+
+        cache = ImageCache(max_size=10)
+        cache.put(tmp_path / "a.jpg", b"aaaa")
+        cache.put(tmp_path / "b.jpg", b"bbbb")
+        cache.put(tmp_path / "c.jpg", b"cccc")
+        assert tmp_path / "a.jpg" not in cache
+        assert len(cache) == 2
+        assert cache.size == 8
+
+    def test_skip_oversized(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import ImageCache
+
+        cache = ImageCache(max_size=4)
+        cache.put(tmp_path / "a.jpg", b"aaaaa")
+        assert len(cache) == 0
+        assert cache.size == 0
+
+    def test_invalidate(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import ImageCache
+
+        cache = ImageCache(max_size=100)
+        cache.put(tmp_path / "a.jpg", b"a")
+        cache.put(tmp_path / "sub" / "b.jpg", b"b")
+        cache.put(Path("/elsewhere/c.jpg"), b"c")
+        cache.invalidate([tmp_path / "a.jpg"])
+        assert tmp_path / "a.jpg" not in cache
+        cache.invalidate_directory(tmp_path)
+        assert len(cache) == 1
+        assert cache.size == 1
+
+
+def test_render_pool_reused():
+    from nonebot_plugin_bh3_elysian_realm.utils.image_utils import render_pool, shutdown_render_pool
+
+    pool = render_pool()
+    assert render_pool() is pool
+    shutdown_render_pool()
+    assert render_pool() is not pool
+    shutdown_render_pool()
+
+
+@pytest.mark.asyncio
+async def test_render_pool_falls_back_to_threads(mocker: MockerFixture):
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    from nonebot_plugin_bh3_elysian_realm.utils import image_utils
+
+    class BrokenPool(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("A child process terminated abruptly")
+
+    # 子进程无法导入插件包时进程池损坏，改用线程池完成本次与之后的绘制
+    mocker.patch.object(image_utils, "_process_broken", False)
+    mocker.patch.object(image_utils, "_render_pool", BrokenPool(1))
+    try:
+        assert await image_utils.run_in_render_pool(pow, 2, 3) == 8
+        assert image_utils._process_broken is True
+        assert type(image_utils.render_pool()) is ThreadPoolExecutor
+    finally:
+        image_utils.shutdown_render_pool()
+
+
+@pytest.mark.asyncio
+class TestBuildVariants:
+    async def test_build_incremental(self, tmp_path: Path):
+        import shutil
+
+        from PIL import Image
+
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import build_variants
+
+        source_dir = tmp_path / "images"
+        target_dir = tmp_path / "variants"
+        source_dir.mkdir()
+        shutil.copy(Path(__file__).parent.parent / "test_res" / "Human.jpg", source_dir / "Human.jpg")
+
+        assert await build_variants(source_dir, "webp", 540, 70, target_dir) == ["Human"]
+        with Image.open(target_dir / "Human.webp") as image:
+            assert image.format == "WEBP"
+            assert image.width == 540
+        assert await build_variants(source_dir, "webp", 540, 70, target_dir) == []
+        assert await build_variants(source_dir, "webp", 360, 70, target_dir) == ["Human"]
+
+        (source_dir / "Human.jpg").unlink()
+        assert await build_variants(source_dir, "webp", 360, 70, target_dir) == ["Human"]
+        assert not (target_dir / "Human.webp").exists()
+
+    async def test_skip_unchanged(self, tmp_path: Path, mocker: MockerFixture):
+        import os
+        import shutil
+        from concurrent.futures import ThreadPoolExecutor
+
+        from nonebot_plugin_bh3_elysian_realm.utils import image_utils
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import build_variants
+
+        source_dir = tmp_path / "images"
+        target_dir = tmp_path / "variants"
+        source_dir.mkdir()
+        shutil.copy(Path(__file__).parent.parent / "test_res" / "Human.jpg", source_dir / "Human.jpg")
+
+        with ThreadPoolExecutor(1) as pool:
+            mocker.patch.object(image_utils, "render_pool", return_value=pool)
+            submit = mocker.spy(pool, "submit")
+            assert await build_variants(source_dir, "webp", 540, 70, target_dir) == ["Human"]
+            # 文件状态未变化时不提交任务
+            assert await build_variants(source_dir, "webp", 540, 70, target_dir) == []
+            assert submit.call_count == 1
+            # 只修改时间变化时重新计算哈希，内容相同不重新生成
+            stat = (source_dir / "Human.jpg").stat()
+            os.utime(source_dir / "Human.jpg", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            assert await build_variants(source_dir, "webp", 540, 70, target_dir) == []
+            assert submit.call_count == 2
+
+    async def test_build_concurrent(self, tmp_path: Path):
+        import shutil
+        import asyncio
+
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import build_variants
+
+        source_dir = tmp_path / "images"
+        target_dir = tmp_path / "variants"
+        source_dir.mkdir()
+        shutil.copy(Path(__file__).parent.parent / "test_res" / "Human.jpg", source_dir / "Human.jpg")
+
+        # 多个进程共用缓存目录时同时生成，临时文件互不覆盖
+        results = await asyncio.gather(*(build_variants(source_dir, "webp", 540, 70, target_dir) for _ in range(2)))
+        assert results == [["Human"], ["Human"]]
+        assert sorted(path.name for path in target_dir.iterdir()) == ["Human.webp", "manifest.json"]
+
+    async def test_original_is_noop(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import build_variants
+
+        assert await build_variants(tmp_path, "original", 540, 70, tmp_path / "variants") == []
+        assert not (tmp_path / "variants").exists()
+
+    async def test_jpeg_progressive(self, tmp_path: Path):
+        import shutil
+
+        from PIL import Image
+
+        from nonebot_plugin_bh3_elysian_realm.utils.image_utils import build_variants
+
+        source_dir = tmp_path / "images"
+        source_dir.mkdir()
+        shutil.copy(Path(__file__).parent.parent / "test_res" / "Human.jpg", source_dir / "Human.jpg")
+
+        await build_variants(source_dir, "jpeg", 720, 75, tmp_path / "variants")
+        with Image.open(tmp_path / "variants" / "Human.jpg") as image:
+            assert image.info.get("progressive")
+            assert "exif" not in image.info
+            assert image.width == 720
+
+
+@pytest.mark.asyncio
+async def test_role_image_digest_cached(tmp_path: Path, mocker: MockerFixture):
+    import hashlib
+
+    from nonebot_plugin_bh3_elysian_realm.utils import image_utils
+
+    mocker.patch.object(image_utils.plugin_config, "image_store", "files")
+    mocker.patch.object(image_utils.plugin_config, "image_variant", "original")
+    mocker.patch.object(image_utils, "_digests", {})
+    file_hash = mocker.spy(image_utils, "file_hash")
+    (tmp_path / "Human.jpg").write_bytes(b"human")
+
+    # 文件未变化时不再计算摘要
+    for _ in range(2):
+        assert await image_utils.role_image_digest(tmp_path, "Human") == hashlib.sha256(b"human").hexdigest()
+    assert file_hash.call_count == 1
+    (tmp_path / "Human.jpg").write_bytes(b"human2")
+    assert await image_utils.role_image_digest(tmp_path, "Human") == hashlib.sha256(b"human2").hexdigest()
+    assert await image_utils.role_image_digest(tmp_path, "Void") is None
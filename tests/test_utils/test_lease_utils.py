@@ -0,0 +1,179 @@
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import List, Tuple, Optional
+
+import pytest
+
+WORKER = """
+import sys, asyncio, importlib.util
+from pathlib import Path
+
+# 直接加载模块文件，不初始化 NoneBot 与插件
+spec = importlib.util.spec_from_file_location("lease_utils", sys.argv[2])
+lease_utils = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(lease_utils)
+UpdateCoordinator = lease_utils.UpdateCoordinator
+
+directory = Path(sys.argv[1])
+
+async def main():
+    # 所有进程就绪后同时开始
+    print("ready", flush=True)
+    while not (directory.parent / "go").exists():
+        await asyncio.sleep(0.01)
+    coordinator = UpdateCoordinator(directory, ttl=5)
+
+    async def update():
+        with (directory.parent / "updates.log").open("a") as file:
+            file.write("update\\n")
+        await asyncio.sleep(1)
+        return True
+
+    async def head():
+        return "head"
+
+    async def refresh(old, new):
+        print("refresh", old, new)
+
+    print("ok" if await coordinator.run(update, head, refresh, timeout=30) else "failed")
+
+asyncio.run(main())
+"""
+
+
+@pytest.mark.asyncio
+async def test_lease_exclusive(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.lease_utils import FileLease
+
+    first = FileLease(tmp_path / "images.lock", ttl=30)
+    second = FileLease(tmp_path / "images.lock", ttl=30)
+    assert await first.try_acquire() is True
+    assert await second.try_acquire() is False
+    assert second.is_held() is True
+
+    await first.release()
+    assert (tmp_path / "images.lock").exists() is False
+    assert await second.try_acquire() is True
+    # 只删除自己持有的租约
+    await first.release()
+    assert (tmp_path / "images.lock").exists() is True
+    await second.release()
+
+
+@pytest.mark.asyncio
+async def test_lease_expired_and_heartbeat(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.lease_utils import FileLease
+
+    lock_file = tmp_path / "images.lock"
+    lock_file.write_text(json.dumps({"owner": "crashed", "expires": time.time() - 1}), "utf-8")
+    lease = FileLease(lock_file, ttl=0.3)
+    assert await lease.try_acquire() is True
+
+    # 持有期间续期，不会过期
+    await asyncio.sleep(0.5)
+    assert json.loads(lock_file.read_text("utf-8"))["expires"] > time.time()
+    assert await FileLease(lock_file, ttl=0.3).try_acquire() is False
+
+    # 续期时发现被抢占
+    lock_file.write_text(json.dumps({"owner": "other", "expires": time.time() + 30}), "utf-8")
+    await asyncio.sleep(0.2)
+    assert lease.lost is True
+    await lease.release()
+    assert json.loads(lock_file.read_text("utf-8"))["owner"] == "other"
+
+
+@pytest.mark.asyncio
+async def test_coordinator_follower_adopts_result(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.lease_utils import UpdateCoordinator
+
+    directory = tmp_path / "images"
+    leader = UpdateCoordinator(directory, ttl=5)
+    follower = UpdateCoordinator(directory, ttl=5)
+    started = asyncio.Event()
+    release = asyncio.Event()
+    refreshed: List[Tuple[Optional[str], Optional[str]]] = []
+
+    async def slow_update() -> bool:
+        started.set()
+        await release.wait()
+        return True
+
+    async def unexpected_update() -> bool:
+        raise AssertionError("follower should not update")
+
+    async def head() -> str:
+        return "b"
+
+    async def refresh(old: Optional[str], new: Optional[str]) -> None:
+        refreshed.append((old, new))
+
+    leading = asyncio.ensure_future(leader.run(slow_update, head, refresh, timeout=5))
+    await started.wait()
+    following = asyncio.ensure_future(follower.run(unexpected_update, head, refresh, timeout=5))
+    await asyncio.sleep(0.1)
+    assert not following.done()
+
+    release.set()
+    assert await leading is True
+    assert await following is True
+    # 只有等待的一方按发布的修订刷新
+    assert refreshed == [(None, "b")]
+    assert follower.published() == leader.seen == follower.seen
+    assert not (tmp_path / ".images.lock").exists()
+
+
+@pytest.mark.asyncio
+async def test_coordinator_across_processes(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils import lease_utils
+
+    directory = tmp_path / "images"
+    processes = [
+        await asyncio.create_subprocess_exec(
+            sys.executable, "-c", WORKER, str(directory), lease_utils.__file__, stdout=asyncio.subprocess.PIPE
+        )
+        for _ in range(4)
+    ]
+    for process in processes:
+        assert process.stdout is not None
+        assert (await process.stdout.readline()).strip() == b"ready"
+    (tmp_path / "go").touch()
+    outputs = [(await process.communicate())[0].decode() for process in processes]
+
+    assert (tmp_path / "updates.log").read_text().count("update") == 1
+    assert all(output.strip().endswith("ok") for output in outputs)
+    assert sum("refresh None head" in output for output in outputs) == 3
+
+
+@pytest.mark.asyncio
+async def test_update_source_waits_for_other_process(tmp_path: Path, mocker):
+    from nonebot_plugin_bh3_elysian_realm import utils
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource
+    from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+    from nonebot_plugin_bh3_elysian_realm.utils.lease_utils import FileLease, UpdateCoordinator
+
+    source = ImageSource("https://example.com/repo", tmp_path / "images", UpdatePoller(tmp_path / "s.json", 3600, 60))
+    other = UpdateCoordinator(source.path, ttl=5)
+    other.publish("a", True)
+    mocker.patch.dict(utils.coordinators, clear=True)
+    pull_resources = mocker.patch.object(utils, "pull_resources")
+    after_update = mocker.patch.object(utils, "after_update")
+    mocker.patch.object(utils, "git_changed_files", return_value=["Human.jpg"])
+    utils.source_coordinator(source)
+
+    # 其它进程持有租约并在完成后发布新的修订
+    lease = FileLease(other.lock_file, ttl=5)
+    assert await lease.try_acquire()
+
+    async def finish():
+        await asyncio.sleep(0.2)
+        other.publish("b", True)
+        await lease.release()
+
+    finishing = asyncio.ensure_future(finish())
+    assert await utils.update_source(source) is True
+    await finishing
+    pull_resources.assert_not_called()
+    after_update.assert_called_once_with(source.path, ["Human.jpg"])
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+
+def test_rate_limiter():
+    from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import RateLimiter
+
+    limiter = RateLimiter(rate=1, burst=2)
+    assert limiter.allow("a", now=0) is True
+    assert limiter.allow("a", now=0) is True
+    assert limiter.allow("a", now=0.5) is False
+    assert limiter.allow("b", now=0.5) is True
+    assert limiter.allow("a", now=1.5) is True
+    assert limiter.allow("a", now=1.5) is False
+
+    assert all(RateLimiter(rate=0, burst=1).allow("a", now=0) for _ in range(10))
+
+
+def test_rate_limiter_bounded_keys():
+    from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import RateLimiter
+
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    for key in "abc":
+        limiter.allow(key, now=0)
+    assert list(limiter._buckets) == ["b", "c"]
+
+
+def test_query_deduplicator():
+    from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import QueryDeduplicator
+
+    deduplicator = QueryDeduplicator(window=3, max_keys=2)
+    assert deduplicator.is_duplicate(("group", "人律"), now=0) is False
+    assert deduplicator.is_duplicate(("group", "人律"), now=1) is True
+    assert deduplicator.is_duplicate(("other", "人律"), now=1) is False
+    assert deduplicator.is_duplicate(("group", "人律"), now=3.5) is False
+    # 超出容量时先清理过期的记录
+    assert deduplicator.is_duplicate(("group", "空律"), now=10) is False
+    assert len(deduplicator._seen) == 1
+
+
+def test_admit_query(mocker):
+    from nonebot_plugin_bh3_elysian_realm.utils import limit_utils
+
+    mocker.patch.object(limit_utils, "user_limiter", limit_utils.RateLimiter(rate=0.001, burst=2))
+    mocker.patch.object(limit_utils, "group_limiter", limit_utils.RateLimiter(rate=0.001, burst=3))
+    mocker.patch.object(limit_utils, "query_deduplicator", limit_utils.QueryDeduplicator(window=60))
+
+    assert limit_utils.admit_query("OneBot V11", "1", "100", "人律") is None
+    assert limit_utils.admit_query("OneBot V11", "2", "100", "人律") == "duplicate"
+    assert limit_utils.admit_query("OneBot V12", "1", "100", "人律") is None
+    assert limit_utils.admit_query("OneBot V11", "1", "100", "空律") is None
+    assert limit_utils.admit_query("OneBot V11", "1", "100", "雷律") == "rate_limited"
+    assert limit_utils.admit_query("OneBot V11", "3", "100", "月下") == "rate_limited"
+    assert limit_utils.admit_query("OneBot V11", "3", None, "雷律") is None
+
+
+def test_admit_query_records_only_admitted(mocker):
+    from nonebot_plugin_bh3_elysian_realm.utils import limit_utils
+
+    mocker.patch.object(limit_utils, "user_limiter", limit_utils.RateLimiter(rate=0.001, burst=1))
+    mocker.patch.object(limit_utils, "group_limiter", limit_utils.RateLimiter(rate=0, burst=1))
+    mocker.patch.object(limit_utils, "query_deduplicator", limit_utils.QueryDeduplicator(window=60))
+
+    assert limit_utils.admit_query("OneBot V11", "1", "100", "空律") is None
+    # 被限流的查询不记录，其他成员的相同查询照常回复
+    assert limit_utils.admit_query("OneBot V11", "1", "100", "人律") == "rate_limited"
+    assert limit_utils.admit_query("OneBot V11", "2", "100", "人律") is None
+    assert limit_utils.admit_query("OneBot V11", "3", "100", "人律") == "duplicate"
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit():
+    from nonebot_plugin_bh3_elysian_realm.utils.limit_utils import ConcurrencyLimit
+
+    limit = ConcurrencyLimit(2)
+    running = 0
+    peak = 0
+
+    async def send():
+        nonlocal running, peak
+        async with limit:
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(send() for _ in range(6)))
+    assert peak == 2
@@ -0,0 +1,79 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+from PIL import Image
+from pytest_mock import MockerFixture
+
+
+def make_jpeg(path: Path, color: str = "red") -> None:
+    Image.new("RGB", (64, 64), color).save(path, "JPEG")
+
+
+def truncate(path: Path) -> None:
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) // 2])
+
+
+def test_scan_incremental(tmp_path: Path, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils import manifest_utils
+    from nonebot_plugin_bh3_elysian_realm.utils.manifest_utils import ImageManifest
+
+    image_path = tmp_path / "images"
+    image_path.mkdir()
+    make_jpeg(image_path / "Human.jpg")
+    make_jpeg(image_path / "Void.jpg", "blue")
+    manifest = ImageManifest(tmp_path / "manifest.json")
+
+    result = manifest.scan(image_path)
+    assert result.checked == ["Human.jpg", "Void.jpg"]
+    assert result.corrupt == []
+
+    # 未变化的文件不会重新计算哈希
+    inspect_image = mocker.spy(manifest_utils, "inspect_image")
+    assert ImageManifest(tmp_path / "manifest.json").scan(image_path).checked == []
+    inspect_image.assert_not_called()
+
+    truncate(image_path / "Void.jpg")
+    (image_path / "Human.jpg").unlink()
+    result = manifest.scan(image_path)
+    assert result.checked == ["Void.jpg"]
+    assert result.corrupt == ["Void.jpg"]
+    assert result.removed == ["Human.jpg"]
+    # 损坏的文件未变化时仍然报告
+    assert manifest.scan(image_path).corrupt == ["Void.jpg"]
+
+
+@pytest.mark.asyncio
+async def test_check_integrity_restores_from_git(tmp_path: Path, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm import utils
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource
+    from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+    from nonebot_plugin_bh3_elysian_realm.utils.manifest_utils import ImageManifest
+
+    def git(*args: str):
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@test", *args], cwd=image_path, check=True)
+
+    image_path = tmp_path / "images"
+    image_path.mkdir()
+    make_jpeg(image_path / "Human.jpg")
+    git("init", "-q")
+    git("add", "-A")
+    git("commit", "-q", "-m", "1")
+    original = (image_path / "Human.jpg").read_bytes()
+
+    manifest = ImageManifest(tmp_path / "manifest.json")
+    mocker.patch.object(utils, "image_manifest", return_value=manifest)
+    after_update = mocker.patch.object(utils, "after_update")
+    source = ImageSource("https://example.com/repo", image_path, UpdatePoller(tmp_path / "state.json", 3600, 60))
+
+    assert await utils.check_integrity(source) == []
+    after_update.assert_not_called()
+
+    truncate(image_path / "Human.jpg")
+    # 模拟中断的拉取：修改时间与原文件不同
+    os.utime(image_path / "Human.jpg", ns=(0, 0))
+    assert await utils.check_integrity(source) == []
+    assert (image_path / "Human.jpg").read_bytes() == original
+    after_update.assert_called_once_with(image_path, ["Human.jpg"])
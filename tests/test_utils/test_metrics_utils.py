@@ -0,0 +1,100 @@
+import pytest
+from nonebug import App
+from pytest_mock import MockerFixture
+
+
+def test_histogram_render():
+    from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import MetricsRegistry
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "测试耗时", ["command"], buckets=(0.1, 1))
+    histogram.observe(0.05, command="pull")
+    histogram.observe(0.5, command="pull")
+    histogram.observe(5, command="pull")
+
+    assert histogram.count(command="pull") == 3
+    assert registry.render().splitlines() == [
+        "# HELP test_seconds 测试耗时",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{command="pull",le="0.1"} 1',
+        'test_seconds_bucket{command="pull",le="1"} 2',
+        'test_seconds_bucket{command="pull",le="+Inf"} 3',
+        'test_seconds_sum{command="pull"} 5.55',
+        'test_seconds_count{command="pull"} 3',
+    ]
+
+
+def test_counter_render():
+    from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import MetricsRegistry
+
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "测试次数", ["result"])
+    counter.inc(result="hit")
+    counter.inc(2, result='a"b')
+    registry.gauge("test_bytes", "测试字节数", function=lambda: 42)
+
+    assert counter.value(result="hit") == 1
+    assert 'test_total{result="a\\"b"} 2' in registry.render()
+    assert "test_bytes 42" in registry.render()
+    with pytest.raises(ValueError, match="标签"):
+        counter.inc(other="1")
+    with pytest.raises(ValueError, match="已存在"):
+        registry.counter("test_total", "重复")
+
+
+@pytest.mark.asyncio
+async def test_instrument_job():
+    from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import job_seconds, instrument_job, job_failures_total
+
+    @instrument_job("test_job")
+    async def job(result):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert await job(True) is True
+    assert await job(False) is False
+    with pytest.raises(RuntimeError):
+        await job(RuntimeError())
+    assert job_seconds.count(job="test_job") == 3
+    assert job_failures_total.value(job="test_job") == 2
+
+
+@pytest.mark.asyncio
+async def test_instrument_handler():
+    from nonebot.exception import FinishedException
+
+    from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import (
+        handler_seconds,
+        instrument_handler,
+        handler_errors_total,
+    )
+
+    @instrument_handler("test_handler")
+    async def handler(error: Exception):
+        raise error
+
+    with pytest.raises(FinishedException):
+        await handler(FinishedException())
+    with pytest.raises(KeyError):
+        await handler(KeyError())
+    assert handler_seconds.count(handler="test_handler") == 2
+    assert handler_errors_total.value(handler="test_handler") == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(app: App, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+    from nonebot_plugin_bh3_elysian_realm.utils.metrics_utils import CONTENT_TYPE, queries_total
+
+    # 测试服务器启动时不执行资源检查
+    mocker.patch("nonebot_plugin_bh3_elysian_realm.on_startup")
+    queries_total.inc(result="hit")
+    async with app.test_server() as ctx:
+        client = ctx.get_client()
+        response = await client.get(plugin_config.metrics_path)
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == CONTENT_TYPE
+    assert 'elysian_realm_queries_total{result="hit"}' in response.text
+    assert "elysian_realm_image_cache_hits_total" in response.text
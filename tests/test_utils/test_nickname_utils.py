@@ -0,0 +1,206 @@
+import os
+import json
+from pathlib import Path
+
+import pytest
+
+NICKNAME_DATA = {
+    "Human": ["人律", "爱律"],
+    "Starry": ["繁星", "格蕾修"],
+    "Thunder": ["雷律"],
+    "Thunder_Attack": ["雷律3", "雷律平A流"],
+    "Lnfinite": ["梅比乌斯"],
+}
+
+
+class TestNicknameIndex:
+    def test_find(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex({"Human": ["人律", "爱律"], "Void": ["空律"], "Vicissitude_Attack": []})
+        assert index.find("人律") == "Human"
+        assert index.find("空律") == "Void"
+        assert index.find("人人") is None
+
+    def test_duplicate_alias_keeps_first_role(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex({"Human": ["律者"], "Void": ["律者"]})
+        assert index.find("律者") == "Human"
+
+    def test_immutable(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        data = {"Human": ["人律"]}
+        index = NicknameIndex(data)
+        data["Human"].append("爱律")
+        assert index.find("爱律") is None
+        with pytest.raises(TypeError):
+            index.aliases["爱律"] = "Human"  # type: ignore
+
+    def test_to_dict(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex({"Human": ["人律"]})
+        data = index.to_dict()
+        data["Human"].append("爱律")
+        assert index.roles["Human"] == ("人律",)
+
+
+@pytest.mark.asyncio
+class TestNicknameIndexManager:
+    async def test_get_reuses_index(self, temp_json_file: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndexManager
+
+        temp_json_file.write_text(json.dumps({"Human": ["人律"]}), encoding="utf-8")
+        manager = NicknameIndexManager(JsonWriter(0))
+        index = await manager.get(temp_json_file)
+        assert await manager.get(temp_json_file) is index
+
+    async def test_get_reloads_external_edit(self, temp_json_file: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndexManager
+
+        temp_json_file.write_text(json.dumps({"Human": ["人律"]}), encoding="utf-8")
+        manager = NicknameIndexManager(JsonWriter(0))
+        assert (await manager.get(temp_json_file)).find("人律") == "Human"
+
+        temp_json_file.write_text(json.dumps({"Human": ["人律", "爱律"]}), encoding="utf-8")
+        stat = temp_json_file.stat()
+        os.utime(temp_json_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert (await manager.get(temp_json_file)).find("爱律") == "Human"
+
+    async def test_update(self, temp_json_file: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter, save_json
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndexManager
+
+        manager = NicknameIndexManager(JsonWriter(0))
+        data = {"Human": ["人律", "爱律"]}
+        save_json(temp_json_file, data)
+        index = manager.update(temp_json_file, data)
+        assert await manager.get(temp_json_file) is index
+        assert index.find("爱律") == "Human"
+
+
+class TestNicknameMatch:
+
+    def test_normalize_alias(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import normalize_alias
+
+        assert normalize_alias(" 雷律 ３ ") == "雷律3"
+        assert normalize_alias("雷律平A流") == "雷律平a流"
+
+    def test_normalized_exact_match(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex(NICKNAME_DATA)
+        assert index.match("雷律 3").role == "Thunder_Attack"
+        assert index.match("人 律").role == "Human"
+        assert index.match("雷律平a流").role == "Thunder_Attack"
+
+    def test_prefix_match(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex(NICKNAME_DATA)
+        assert index.match("格蕾").role == "Starry"
+        assert index.match("雷律平").role == "Thunder_Attack"
+
+    def test_typo_auto_resolve(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex(NICKNAME_DATA)
+        assert index.match("梅比乌丝").role == "Lnfinite"
+
+    def test_suggestions(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex(NICKNAME_DATA)
+        result = index.match("雷人", limit=2)
+        assert result.role is None
+        assert set(result.suggestions) == {"人律", "雷律"}
+
+    def test_no_match(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex(NICKNAME_DATA)
+        assert index.match("琪亚娜") == (None, ())
+        assert index.match("   ") == (None, ())
+
+    def test_miss_cache(self, mocker):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex(NICKNAME_DATA)
+        spy = mocker.spy(index, "_fuzzy_match")
+        assert index.match("琪亚娜").role is None
+        assert index.match(" 琪亚娜").role is None
+        assert spy.call_count == 1
+
+    def test_match_many(self):
+        from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+        index = NicknameIndex(NICKNAME_DATA)
+        results = index.match_many(["雷律", "人律", "琪亚娜", "雷律"])
+        assert list(results) == ["雷律", "人律", "琪亚娜"]
+        assert [result.role for result in results.values()] == ["Thunder", "Human", None]
+
+
+@pytest.mark.asyncio
+async def test_save_write_behind(temp_json_file: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter, load_json
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndexManager
+
+    manager = NicknameIndexManager(JsonWriter(60))
+    temp_json_file.write_text(json.dumps({"Human": ["人律"]}), encoding="utf-8")
+    index = manager.save(temp_json_file, {"Human": ["人律", "爱律"]})
+    assert await manager.get(temp_json_file) is index
+    assert await load_json(temp_json_file) == {"Human": ["人律"]}
+
+    await manager.flush()
+    assert await load_json(temp_json_file) == {"Human": ["人律", "爱律"]}
+    assert await manager.get(temp_json_file) is index
+
+
+@pytest.mark.asyncio
+async def test_add_aliases_uses_latest_data(temp_json_file: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.sqlite_utils import AliasEdit
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter, load_json
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndexManager
+
+    manager = NicknameIndexManager(JsonWriter(60))
+    temp_json_file.write_text(json.dumps({"Human": [], "Void": []}), encoding="utf-8")
+
+    # 两次编辑基于各自开始时的数据也不会相互覆盖
+    assert await manager.add_aliases(temp_json_file, "Human", ["人律"]) == AliasEdit(["人律"], {})
+    assert await manager.add_aliases(temp_json_file, "Void", ["空律", "人律"]) == AliasEdit(["空律"], {"人律": "Human"})
+    with pytest.raises(KeyError):
+        await manager.add_aliases(temp_json_file, "Thunder", ["雷律"])
+    assert await manager.add_roles(temp_json_file, ["Void", "Thunder"]) == ["Thunder"]
+
+    await manager.flush()
+    assert await load_json(temp_json_file) == {"Human": ["人律"], "Void": ["空律"], "Thunder": []}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store(temp_json_file: Path, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.sqlite_utils import NicknameStore
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter, load_json
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndexManager
+
+    temp_json_file.write_text(json.dumps({"Human": ["人律"], "Void": []}), encoding="utf-8")
+    manager = NicknameIndexManager(JsonWriter(60), NicknameStore(tmp_path / "nickname.db"))
+
+    index = await manager.get(temp_json_file)
+    assert index.find("人律") == "Human"
+    assert await manager.get(temp_json_file) is index
+
+    await manager.add_aliases(temp_json_file, "Void", ["空律"])
+    assert (await manager.get(temp_json_file)).find("空律") == "Void"
+
+    # 其它进程的修改在下次查询时生效
+    NicknameStore(tmp_path / "nickname.db").add_aliases("Void", ["虚数"])
+    assert (await manager.get(temp_json_file)).find("虚数") == "Void"
+
+    # 修改导出回 nickname.json
+    await manager.flush()
+    assert await load_json(temp_json_file) == {"Human": ["人律"], "Void": ["空律"]}
@@ -0,0 +1,114 @@
+import asyncio
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+from pytest_mock import MockerFixture
+from nonebot_plugin_saa import Text, MessageFactory, TargetQQPrivate, TargetOB12Unknow, TargetTelegramCommon
+
+
+class StubAdapter:
+    def __init__(self, name: str):
+        self.name = name
+
+    def get_name(self) -> str:
+        return self.name
+
+
+class StubBot:
+    def __init__(self, adapter: str, self_id: str, platform: str = ""):
+        self.adapter = StubAdapter(adapter)
+        self.self_id = self_id
+        self.platform = platform
+
+
+def test_superuser_targets():
+    from nonebot_plugin_bh3_elysian_realm.utils.notify_utils import superuser_targets
+
+    bots = [
+        StubBot("OneBot V11", "1"),
+        StubBot("OneBot V11", "2"),
+        StubBot("OneBot V12", "3", "kook"),
+        StubBot("Telegram", "4"),
+        StubBot("Unknown", "5"),
+    ]
+    targets = superuser_targets(bots, ["10", "telegram:20", "onebot:abc"])
+    assert [(bot.self_id, target) for bot, target in targets] == [
+        ("1", TargetQQPrivate(user_id=10)),
+        ("3", TargetOB12Unknow(platform="kook", detail_type="private", user_id="10")),
+        ("3", TargetOB12Unknow(platform="kook", detail_type="private", user_id="abc")),
+        ("4", TargetTelegramCommon(chat_id="10")),
+        ("4", TargetTelegramCommon(chat_id="20")),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_notify_concurrent_and_isolated(mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils.notify_utils import notify_superusers
+
+    running = 0
+    peak = 0
+    sent: List[Tuple[str, int]] = []
+
+    async def send_to(self, target: TargetQQPrivate, bot: StubBot):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if target.user_id == 13:
+            raise RuntimeError("blocked")
+        sent.append((bot.self_id, target.user_id))
+
+    mocker.patch.object(MessageFactory, "send_to", send_to)
+    superusers = [str(user_id) for user_id in range(10, 16)]
+    delivered, failed = await notify_superusers(
+        MessageFactory(Text("test")), [StubBot("OneBot V11", "1")], superusers, concurrency=2
+    )
+    assert (delivered, failed) == (5, 1)
+    assert peak == 2
+    assert sorted(sent) == [("1", user_id) for user_id in (10, 11, 12, 14, 15)]
+
+
+@pytest.mark.asyncio
+async def test_null_nickname_warning_notifies_changes(mocker: MockerFixture, tmp_path: Path):
+    from nonebot import get_driver
+
+    from nonebot_plugin_bh3_elysian_realm import utils
+    from nonebot_plugin_bh3_elysian_realm.utils.notify_utils import NotifyState
+    from nonebot_plugin_bh3_elysian_realm.utils.nickname_utils import NicknameIndex
+
+    roles = {"Human": ["人律"], "Void": [], "Thunder": []}
+
+    async def get_index(_):
+        return NicknameIndex(roles)
+
+    mocker.patch.object(utils.nickname_index, "get", get_index)
+    mocker.patch.object(utils, "notify_state", NotifyState(tmp_path / "notify_state.json"))
+    mocker.patch.object(utils, "get_bots", return_value={"1": StubBot("OneBot V11", "1")})
+    mocker.patch.object(get_driver().config, "superusers", {"10"})
+    notify = mocker.patch.object(utils, "notify_superusers", return_value=(1, 0))
+
+    await utils.null_nickname_warning()
+    assert notify.call_count == 1
+    assert notify.call_args[0][0] == MessageFactory(Text("['Thunder', 'Void']缺失昵称，请及时更新"))
+
+    # 未变化时不再通知，重启后同样
+    await utils.null_nickname_warning()
+    mocker.patch.object(utils, "notify_state", NotifyState(tmp_path / "notify_state.json"))
+    await utils.null_nickname_warning()
+    assert notify.call_count == 1
+
+    roles["Starry"] = []
+    await utils.null_nickname_warning()
+    assert notify.call_args[0][0] == MessageFactory(
+        Text("['Starry', 'Thunder', 'Void']缺失昵称，请及时更新\n新增: ['Starry']")
+    )
+
+    # 全部发送失败时下次重试
+    roles["Lnfinite"] = []
+    notify.return_value = (0, 1)
+    await utils.null_nickname_warning()
+    await utils.null_nickname_warning()
+    assert notify.call_count == 4
+    assert utils.notify_state.missing == ["Starry", "Thunder", "Void"]
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+from pytest_mock import MockerFixture
+
+
+def make_jpeg(path: Path, color: str = "red") -> None:
+    Image.new("RGB", (64, 128), color).save(path, "JPEG")
+
+
+def test_build_tile_specs(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.overview_utils import build_tile_specs
+
+    make_jpeg(tmp_path / "Human.jpg")
+    specs = build_tile_specs({"Human": ["人律", "爱莉"], "Void": []}, lambda role: tmp_path, 32)
+
+    assert [(spec.source, spec.caption) for spec in specs] == [(str(tmp_path / "Human.jpg"), "人律"), (None, "Void")]
+    # 昵称或源图片变化时缓存键变化
+    assert build_tile_specs({"Human": ["爱莉"]}, lambda role: tmp_path, 32)[0].key != specs[0].key
+    make_jpeg(tmp_path / "Human.jpg", "blue")
+    assert build_tile_specs({"Human": ["人律"]}, lambda role: tmp_path, 32)[0].key != specs[0].key
+    assert build_tile_specs({"Human": ["人律"]}, lambda role: None, 32)[0].source is None
+
+
+@pytest.mark.asyncio
+async def test_overview_cache_incremental(tmp_path: Path, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils import overview_utils
+    from nonebot_plugin_bh3_elysian_realm.utils.overview_utils import OverviewCache, build_tile_specs
+
+    image_path = tmp_path / "images"
+    image_path.mkdir()
+    make_jpeg(image_path / "Human.jpg")
+    make_jpeg(image_path / "Void.jpg", "blue")
+    roles = {"Human": ["人律"], "Void": ["空律"], "Star": []}
+    cache = OverviewCache(tmp_path / "overview")
+    render_tile = mocker.spy(overview_utils, "render_tile")
+
+    data = await cache.get(build_tile_specs(roles, lambda role: image_path, 32), 2, 32, None)
+    assert render_tile.call_count == 3
+    with Image.open(cache.output) as image:
+        assert image.size == (8 + 2 * 40, 8 + 2 * (32 + 36 + 8))
+    assert cache.output.read_bytes() == data
+
+    # 未变化时直接读取缓存，不重新拼合
+    render_overview = mocker.spy(overview_utils, "render_overview")
+    assert await cache.get(build_tile_specs(roles, lambda role: image_path, 32), 2, 32, None) == data
+    render_overview.assert_not_called()
+
+    # 只重新绘制昵称变化的角色，并删除旧的缩略图
+    roles["Void"] = ["虚数之树"]
+    await cache.get(build_tile_specs(roles, lambda role: image_path, 32), 2, 32, None)
+    assert render_tile.call_count == 4
+    assert render_tile.call_args.args[0].caption == "虚数之树"
+    assert len(list(cache.tile_dir.glob("*.png"))) == 3
+
+
+@pytest.mark.asyncio
+async def test_overview_cache_process(tmp_path: Path, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils import overview_utils
+    from nonebot_plugin_bh3_elysian_realm.utils.overview_utils import OverviewCache, build_tile_specs
+
+    make_jpeg(tmp_path / "Human.jpg")
+    mocker.patch.object(overview_utils, "PROCESS_THRESHOLD", 0)
+    cache = OverviewCache(tmp_path / "overview")
+
+    run = mocker.spy(overview_utils, "run_in_render_pool")
+    data = await cache.get(build_tile_specs({"Human": ["人律"]}, lambda role: tmp_path, 32), 4, 32, None)
+    assert data[:2] == b"\xff\xd8"
+    run.assert_called_once()
+    assert len(list(cache.tile_dir.glob("*.png"))) == 1
+    # 不留下临时文件
+    assert [path.name for path in cache.directory.rglob("*.tmp")] == []
@@ -0,0 +1,123 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def images(tmp_path: Path) -> Path:
+    image_path = tmp_path / "images"
+    image_path.mkdir()
+    (image_path / "Human.jpg").write_bytes(b"human" * 100)
+    (image_path / "Void.jpg").write_bytes(b"void")
+    (image_path / "Empty.jpg").write_bytes(b"")
+    return image_path
+
+
+def test_write_and_read_pack(images: Path, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackedImages, write_pack
+
+    entries = [(path.stem, path) for path in sorted(images.glob("*.jpg"))]
+    write_pack(entries, tmp_path / "images.pack")
+
+    pack = PackedImages(tmp_path / "images.pack")
+    assert sorted(pack.roles()) == ["Empty", "Human", "Void"]
+    assert pack.read("Human") == b"human" * 100
+    assert pack.read("Empty") == b""
+    assert pack.digest("Void") == hashlib.sha256(b"void").hexdigest()
+    view = pack.view("Void")
+    assert view.tobytes() == b"void"
+    view.release()
+    assert "Sakura" not in pack
+    pack.close()
+
+
+def test_corrupted_pack(images: Path, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackError, PackedImages, write_pack
+
+    pack_file = tmp_path / "images.pack"
+    write_pack([("Human", images / "Human.jpg")], pack_file)
+    pack_file.write_bytes(pack_file.read_bytes()[:-10])
+    with pytest.raises(PackError, match="数据不完整"):
+        PackedImages(pack_file)
+
+    pack_file.write_bytes(b"JUNK" + bytes(16))
+    with pytest.raises(PackError, match="不是图片打包文件"):
+        PackedImages(pack_file)
+
+
+@pytest.mark.asyncio
+async def test_pack_store_rebuild(images: Path, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackStore
+
+    store = PackStore(tmp_path / "packs")
+    assert store.read(images, "original", "Human") is None
+    assert store.roles(images, "original") is None
+
+    await store.build(images, "original", [("Human", images / "Human.jpg")])
+    assert store.read(images, "original", "Human") == b"human" * 100
+    assert store.read(images, "original", "Void") is None
+
+    (images / "Human.jpg").write_bytes(b"new")
+    await store.build(images, "original", [("Human", images / "Human.jpg"), ("Void", images / "Void.jpg")])
+    assert store.read(images, "original", "Human") == b"new"
+    assert store.roles(images, "original") == ["Human", "Void"]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_pack_store_concurrent_build(images: Path, tmp_path: Path):
+    import asyncio
+
+    from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackStore
+
+    # 共用缓存目录的两个实例同时生成，临时文件互不覆盖
+    stores = [PackStore(tmp_path / "packs"), PackStore(tmp_path / "packs")]
+    entries = [("Human", images / "Human.jpg"), ("Void", images / "Void.jpg")]
+    await asyncio.gather(*(store.build(images, "original", entries) for store in stores))
+    assert stores[0].read(images, "original", "Human") == b"human" * 100
+    assert [path.name for path in (tmp_path / "packs").iterdir() if path.suffix == ".tmp"] == []
+    for store in stores:
+        store.close()
+
+
+@pytest.mark.asyncio
+async def test_load_role_image_from_pack(images: Path, tmp_path: Path, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils import image_utils
+    from nonebot_plugin_bh3_elysian_realm.config import plugin_config
+    from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackStore
+
+    mocker.patch.object(plugin_config, "image_store", "packed")
+    mocker.patch.object(plugin_config, "image_variant", "original")
+    mocker.patch.object(image_utils, "image_packs", PackStore(tmp_path / "packs"))
+    image_cache = mocker.patch.object(image_utils, "image_cache", image_utils.ImageCache(1024 * 1024))
+
+    await image_utils.ensure_image_pack(images)
+    (images / "Human.jpg").unlink()
+    assert sorted(image_utils.list_role_files(images)) == ["Empty", "Human", "Void"]
+    assert await image_utils.load_role_image(images, "Human") == b"human" * 100
+    # 打包数据同样进入缓存，再次读取不访问打包文件
+    load = mocker.spy(image_utils.image_packs, "load")
+    assert await image_utils.load_role_image(images, "Human") == b"human" * 100
+    load.assert_not_called()
+    assert image_cache.hits == 1
+    image_utils.image_packs.close()
+
+
+@pytest.mark.asyncio
+async def test_corrupt_pack_entry_disabled(images: Path, tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.pack_utils import PackStore
+
+    store = PackStore(tmp_path / "packs")
+    pack_file = await store.build(images, "original", [("Human", images / "Human.jpg"), ("Void", images / "Void.jpg")])
+    store.close()
+    data = bytearray(pack_file.read_bytes())
+    data[-1] ^= 0xFF
+    pack_file.write_bytes(bytes(data))
+
+    # 校验失败时停用打包文件，由调用方读取图片文件
+    assert await store.load(images, "original", "Human") == b"human" * 100
+    assert await store.load(images, "original", "Void") is None
+    assert await store.load(images, "original", "Human") is None
+    store.close()
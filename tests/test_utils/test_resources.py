@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_on_startup_runs_in_background(mocker):
+    from nonebot_plugin_bh3_elysian_realm import utils
+
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def verify_resources():
+        started.set()
+        await release.wait()
+
+    check_url = mocker.patch.object(utils, "check_url", return_value=True)
+    mocker.patch.object(utils, "verify_resources", verify_resources)
+    start_watch = mocker.patch.object(utils.resource_watch, "start")
+
+    await utils.on_startup()
+    assert utils.resources_state.task is not None
+    await asyncio.wait_for(started.wait(), 1)
+    assert utils.resources_state.loading is True
+    check_url.assert_called_once()
+
+    release.set()
+    await asyncio.wait_for(utils.resources_state.task, 1)
+    assert utils.resources_state.loading is False
+    # 启动检查完成后才开始监视资源文件
+    await asyncio.sleep(0)
+    start_watch.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_startup_verify_isolates_errors(mocker):
+    from nonebot_plugin_bh3_elysian_realm import utils
+
+    mocker.patch.object(utils, "check_url", side_effect=RuntimeError("network"))
+    verify_resources = mocker.patch.object(utils, "verify_resources", return_value=None)
+
+    await utils.startup_verify()
+    verify_resources.assert_called_once()
+    assert utils.resources_state.loading is False
+
+
+@pytest.mark.asyncio
+class TestPollResources:
+    @pytest.fixture
+    def poller(self, tmp_path, mocker):
+        from nonebot_plugin_bh3_elysian_realm import utils
+        from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+
+        poller = UpdatePoller(tmp_path / "update_state.json", interval=3600, retry_interval=60)
+        mocker.patch.object(utils, "update_poller", poller)
+        return poller
+
+    async def test_skip_pull_when_unchanged(self, tmp_path, mocker, poller):
+        from nonebot_plugin_bh3_elysian_realm import utils
+
+        mocker.patch.object(utils, "git_head", return_value="abc")
+        remote_head = mocker.patch.object(utils, "git_remote_head", return_value="abc")
+        pull_resources = mocker.patch.object(utils, "pull_resources", return_value=True)
+
+        assert await utils.poll_resources(tmp_path) is True
+        pull_resources.assert_not_called()
+        assert poller.remote_head == "abc"
+
+        assert await utils.poll_resources(tmp_path) is True
+        remote_head.assert_called_once()
+
+    async def test_pull_when_changed(self, tmp_path, mocker, poller):
+        from nonebot_plugin_bh3_elysian_realm import utils
+
+        mocker.patch.object(utils, "git_head", return_value="abc")
+        mocker.patch.object(utils, "git_remote_head", return_value="def")
+        pull_resources = mocker.patch.object(utils, "pull_resources", return_value=True)
+
+        assert await utils.poll_resources(tmp_path, force=True) is True
+        pull_resources.assert_called_once_with(tmp_path)
+        assert poller.remote_head == "def"
+
+    async def test_remote_failure_backoff(self, tmp_path, mocker, poller):
+        from nonebot_plugin_bh3_elysian_realm import utils
+
+        mocker.patch.object(utils, "git_head", return_value="abc")
+        mocker.patch.object(utils, "git_remote_head", return_value=None)
+
+        assert await utils.poll_resources(tmp_path, force=True) is False
+        assert poller.failures == 1
+        assert poller.next_interval() <= 60
+
+
+@pytest.mark.asyncio
+async def test_scheduled_job_backs_off_for_any_source(tmp_path, mocker):
+    from nonebot_plugin_bh3_elysian_realm import utils
+    from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource, SourceIndex
+
+    upstream = UpdatePoller(tmp_path / "upstream.json", interval=3600, retry_interval=60)
+    extra = UpdatePoller(tmp_path / "extra.json", interval=3600, retry_interval=60)
+    await extra.failed()
+    sources = [
+        ImageSource("https://example.com/upstream", tmp_path / "upstream", upstream, upstream=True),
+        ImageSource("https://example.com/extra", tmp_path / "extra", extra),
+    ]
+    mocker.patch.object(utils, "source_index", SourceIndex(sources))
+    verify = mocker.AsyncMock()
+    mocker.patch.object(utils.ResourcesVerify, "create", return_value=mocker.Mock(verify_images=verify))
+    reschedule = mocker.patch.object(utils.scheduler, "reschedule_job")
+
+    await utils.resource_scheduled_job()
+    verify.assert_called_once_with(force=True)
+    assert 30 <= reschedule.call_args.kwargs["seconds"] <= 60
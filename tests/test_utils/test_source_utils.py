@@ -0,0 +1,88 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+
+def make_source(path: Path, repository: str = "https://example.com/repo"):
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource
+    from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+
+    return ImageSource(repository, path, UpdatePoller(path / "state.json", 3600, 60))
+
+
+def test_source_slug():
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import source_slug
+
+    slug = source_slug("https://github.com/MskTmi/ElysianRealm-Data.git")
+    assert slug.startswith("ElysianRealm-Data-")
+    assert slug != source_slug("https://example.com/mirror/ElysianRealm-Data")
+    assert slug == source_slug("https://github.com/MskTmi/ElysianRealm-Data.git")
+
+
+def test_source_index_priority(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import SourceIndex
+
+    overrides, upstream = tmp_path / "overrides", tmp_path / "upstream"
+    overrides.mkdir()
+    upstream.mkdir()
+    (upstream / "Human.jpg").write_bytes(b"1")
+    (upstream / "Void.jpg").write_bytes(b"1")
+    (overrides / "Human.jpg").write_bytes(b"2")
+
+    index = SourceIndex([make_source(overrides), make_source(tmp_path / "missing"), make_source(upstream)])
+    assert index.resolve("Human") == overrides
+    assert index.resolve("Void") == upstream
+    assert index.resolve("Sakura") is None
+
+    (overrides / "Sakura.jpg").write_bytes(b"2")
+    assert index.resolve("Sakura") is None
+    index.rebuild()
+    assert index.resolve("Sakura") == overrides
+
+    # 只重新查找变化的角色
+    (overrides / "Human.jpg").unlink()
+    (upstream / "Void.jpg").unlink()
+    (upstream / "Kiana.jpg").write_bytes(b"1")
+    index.update(["Human", "Void"])
+    assert index.resolve("Human") == upstream
+    assert index.resolve("Void") is None
+    assert index.resolve("Kiana") is None
+
+
+@pytest.mark.asyncio
+async def test_for_each_source(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import for_each_source
+
+    sources = [make_source(tmp_path / str(index)) for index in range(5)]
+    running = 0
+    peak = 0
+
+    async def update(source) -> bool:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if source is sources[1]:
+            raise RuntimeError("network")
+        return source is not sources[2]
+
+    assert await for_each_source(sources, update, 2) == [True, False, False, True, True]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_update_resources(tmp_path: Path, mocker):
+    from nonebot_plugin_bh3_elysian_realm import utils
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import SourceIndex
+
+    sources = [make_source(tmp_path / "overrides"), make_source(tmp_path / "upstream")]
+    mocker.patch.object(utils, "source_index", SourceIndex(sources))
+    update_source = mocker.patch.object(utils, "update_source", return_value=True)
+
+    assert await utils.update_resources() is True
+    assert [call.args[0] for call in update_source.call_args_list] == sources
+
+    update_source.side_effect = [True, False]
+    assert await utils.update_resources() is False
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def write_nickname(path: Path, data) -> Path:
+    path.write_text(json.dumps(data, ensure_ascii=False), "utf-8")
+    return path
+
+
+def test_migrate_once(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.sqlite_utils import NicknameStore
+
+    json_file = write_nickname(
+        tmp_path / "nickname.json", {"Human": ["人律", "爱律"], "Void": ["空律", "人律"], "Star": []}
+    )
+    store = NicknameStore(tmp_path / "nickname.db")
+
+    assert store.migrate(json_file) is True
+    # 重复的昵称保留先出现的角色，角色与昵称保持原有顺序
+    assert store.load() == {"Human": ["人律", "爱律"], "Void": ["空律"], "Star": []}
+
+    write_nickname(json_file, {"Other": []})
+    assert store.migrate(json_file) is False
+    assert list(store.load()) == ["Human", "Void", "Star"]
+
+
+def test_add_aliases(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.sqlite_utils import AliasEdit, NicknameStore
+
+    store = NicknameStore(tmp_path / "nickname.db")
+    store.migrate(write_nickname(tmp_path / "nickname.json", {"Human": ["人律"], "Void": []}))
+
+    # 冲突的昵称只回滚自身
+    assert store.add_aliases("Void", ["空律", "人律", "空律", "虚数"]) == AliasEdit(["空律", "虚数"], {"人律": "Human"})
+    assert store.add_aliases("Void", ["空律"]) == AliasEdit([], {})
+    assert store.load() == {"Human": ["人律"], "Void": ["空律", "虚数"]}
+    with pytest.raises(KeyError):
+        store.add_aliases("Thunder", ["雷律"])
+
+    assert store.add_roles(["Void", "Thunder"]) == ["Thunder"]
+    assert list(store.load()) == ["Human", "Void", "Thunder"]
+
+
+def test_concurrent_edits(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.sqlite_utils import NicknameStore
+
+    NicknameStore(tmp_path / "nickname.db").migrate(
+        write_nickname(tmp_path / "nickname.json", {"Human": [], "Void": []})
+    )
+
+    def edit(args):
+        role, alias = args
+        return NicknameStore(tmp_path / "nickname.db").add_aliases(role, [alias, "律者"])
+
+    jobs = [("Human" if i % 2 else "Void", f"昵称{i}") for i in range(20)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        edits = list(pool.map(edit, jobs))
+
+    data = NicknameStore(tmp_path / "nickname.db").load()
+    assert sum(len(aliases) for aliases in data.values()) == 21
+    # 同一昵称只被一个角色写入
+    assert sum("律者" in edit.added for edit in edits) == 1
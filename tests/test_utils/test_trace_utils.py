@@ -0,0 +1,109 @@
+import json
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pytest_mock import MockerFixture
+
+
+def test_span_outside_trace():
+    from nonebot_plugin_bh3_elysian_realm.utils.trace_utils import span, traced
+
+    @traced("double")
+    def double(value: int) -> int:
+        return value * 2
+
+    with span("noop") as current:
+        assert current is None
+        assert double(2) == 4
+
+
+@pytest.mark.asyncio
+async def test_trace_handler_records_stages(mocker: MockerFixture, tmp_path: Path):
+    from nonebot.matcher import current_matcher
+
+    from nonebot_plugin_bh3_elysian_realm.utils import trace_utils
+    from nonebot_plugin_bh3_elysian_realm.utils.trace_utils import (
+        STATE_KEY,
+        span,
+        traced,
+        annotate,
+        finish_trace,
+        trace_handler,
+    )
+
+    mocker.patch.object(trace_utils.plugin_config, "trace_sample_rate", 1)
+    mocker.patch.object(trace_utils.plugin_config, "slow_query_threshold", 1e-9)
+    mocker.patch.object(trace_utils, "exporter", trace_utils.TraceExporter(tmp_path / "traces.jsonl"))
+    warning = mocker.patch.object(trace_utils.logger, "warning")
+
+    @traced("load")
+    async def load() -> str:
+        await asyncio.sleep(0)
+        return "data"
+
+    @trace_handler("query", "parse")
+    async def parse():
+        annotate(query="人律")
+
+    @trace_handler("query", "answer")
+    async def answer():
+        with span("lookup", hit=True):
+            assert await load() == "data"
+        with pytest.raises(ValueError, match="failed"), span("send"):
+            raise ValueError("failed")
+
+    matcher = SimpleNamespace(state={})
+    token = current_matcher.set(matcher)  # type: ignore
+    try:
+        await parse()
+        await answer()
+    finally:
+        current_matcher.reset(token)
+
+    trace = await finish_trace(matcher.state)
+    assert trace is not None
+    assert STATE_KEY not in matcher.state
+    assert list(trace.stages()) == ["parse", "answer", "lookup", "load", "send"]
+
+    record = json.loads(warning.call_args[0][0].split(": ", 1)[1])
+    assert record["name"] == "query"
+    assert record["query"] == "人律"
+    assert list(record["stages"]) == ["parse", "answer", "lookup", "load", "send"]
+
+    exported = json.loads((tmp_path / "traces.jsonl").read_text("utf-8"))
+    spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [item["name"] for item in spans] == ["query", "parse", "answer", "lookup", "load", "send"]
+    assert {item["traceId"] for item in spans} == {trace.trace_id}
+    by_name = {item["name"]: item for item in spans}
+    assert "parentSpanId" not in by_name["query"]
+    assert by_name["load"]["parentSpanId"] == by_name["lookup"]["spanId"]
+    assert by_name["lookup"]["attributes"] == [{"key": "hit", "value": {"boolValue": True}}]
+    assert by_name["send"]["status"]["code"] == 2
+    assert int(by_name["query"]["endTimeUnixNano"]) >= int(by_name["query"]["startTimeUnixNano"])
+
+
+@pytest.mark.asyncio
+async def test_trace_sampling(mocker: MockerFixture):
+    from nonebot.matcher import current_matcher
+
+    from nonebot_plugin_bh3_elysian_realm.utils import trace_utils
+    from nonebot_plugin_bh3_elysian_realm.utils.trace_utils import STATE_KEY, finish_trace, trace_handler
+
+    mocker.patch.object(trace_utils.plugin_config, "trace_sample_rate", 0)
+
+    @trace_handler("query")
+    async def handle():
+        return "done"
+
+    matcher = SimpleNamespace(state={})
+    token = current_matcher.set(matcher)  # type: ignore
+    try:
+        assert await handle() == "done"
+    finally:
+        current_matcher.reset(token)
+    assert matcher.state == {STATE_KEY: None}
+    assert await finish_trace(matcher.state) is None
+    # 不在事件处理中时直接执行
+    assert await handle() == "done"
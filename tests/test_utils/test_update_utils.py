@@ -0,0 +1,50 @@
+import time
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.asyncio
+class TestUpdatePoller:
+    async def test_persist_state(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+
+        state_file = tmp_path / "state" / "update_state.json"
+        poller = UpdatePoller(state_file, interval=3600, retry_interval=60)
+        assert poller.recently_checked("abc") is False
+        await poller.succeeded("abc")
+
+        restarted = UpdatePoller(state_file, interval=3600, retry_interval=60)
+        assert restarted.recently_checked("abc") is True
+        assert restarted.recently_checked("def") is False
+        assert restarted.recently_checked(None) is False
+
+    async def test_expired(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+
+        poller = UpdatePoller(tmp_path / "update_state.json", interval=3600, retry_interval=60)
+        await poller.succeeded("abc")
+        poller.last_checked = time.time() - 3601
+        assert poller.recently_checked("abc") is False
+
+    async def test_backoff(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+
+        poller = UpdatePoller(tmp_path / "update_state.json", interval=3600, retry_interval=60)
+        assert poller.next_interval() == 3600
+        for failures, ceiling in [(1, 60), (2, 120), (3, 240), (10, 3600)]:
+            while poller.failures < failures:
+                await poller.failed()
+            assert ceiling / 2 <= poller.next_interval() <= ceiling
+        assert poller.recently_checked("abc") is False
+        await poller.succeeded("abc")
+        assert poller.failures == 0
+        assert poller.next_interval() == 3600
+
+    async def test_corrupt_state(self, tmp_path: Path):
+        from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+
+        state_file = tmp_path / "update_state.json"
+        state_file.write_text("{", encoding="utf-8")
+        poller = UpdatePoller(state_file, interval=3600, retry_interval=60)
+        assert poller.recently_checked("abc") is False
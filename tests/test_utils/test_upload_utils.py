@@ -0,0 +1,98 @@
+import asyncio
+from typing import List
+
+import pytest
+from pytest_mock import MockerFixture
+from nonebot.exception import ActionFailed
+
+
+class StubAdapter:
+    @staticmethod
+    def get_name() -> str:
+        return "Stub"
+
+
+class StubBot:
+    def __init__(self, self_id: str):
+        self.adapter = StubAdapter()
+        self.self_id = self_id
+
+
+class StubMatcher:
+    def __init__(self, expired: List[str]):
+        self.sent: List[str] = []
+        self.expired = expired
+
+    async def send(self, message: str) -> None:
+        if message in self.expired:
+            raise ActionFailed("Stub", "file not found")
+        self.sent.append(message)
+
+
+@pytest.fixture
+def stub_uploader(mocker: MockerFixture) -> List[bytes]:
+    from nonebot_plugin_bh3_elysian_realm.utils import upload_utils
+
+    uploaded: List[bytes] = []
+
+    async def upload(bot: StubBot, data: bytes, name: str) -> str:
+        await asyncio.sleep(0)
+        uploaded.append(data)
+        return f"{bot.self_id}-{name}-{len(uploaded)}"
+
+    mocker.patch.dict(upload_utils.uploaders, {"Stub": upload_utils.Uploader(upload, lambda ref: f"ref:{ref}")})
+    return uploaded
+
+
+@pytest.mark.asyncio
+async def test_reference_reused_per_bot(stub_uploader: List[bytes]):
+    from nonebot_plugin_bh3_elysian_realm.utils.upload_utils import UploadCache
+
+    cache = UploadCache(60)
+    bot, other = StubBot("1"), StubBot("2")
+    matcher = StubMatcher([])
+
+    # 并发发送同一图片只上传一次
+    await asyncio.gather(*(cache.send(bot, matcher, b"image", "Human.jpg") for _ in range(3)))
+    await cache.send(other, matcher, b"image", "Human.jpg")
+    await cache.send(bot, matcher, b"changed", "Human.jpg")
+    assert stub_uploader == [b"image", b"image", b"changed"]
+    assert matcher.sent == ["ref:1-Human.jpg-1"] * 3 + ["ref:2-Human.jpg-2", "ref:1-Human.jpg-3"]
+
+
+@pytest.mark.asyncio
+async def test_known_digest_not_rehashed(stub_uploader: List[bytes], mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm.utils.upload_utils import UploadCache
+
+    cache = UploadCache(60)
+    digest = mocker.spy(UploadCache, "digest")
+    matcher = StubMatcher([])
+    await cache.send(StubBot("1"), matcher, b"image", "Human.jpg", "abc")
+    await cache.send(StubBot("1"), matcher, b"image", "Human.jpg", "abc")
+    digest.assert_not_called()
+    assert stub_uploader == [b"image"]
+
+
+@pytest.mark.asyncio
+async def test_expired_reference_reuploaded(stub_uploader: List[bytes]):
+    from nonebot_plugin_bh3_elysian_realm.utils.upload_utils import UploadCache
+
+    cache = UploadCache(60)
+    bot = StubBot("1")
+    await cache.send(bot, StubMatcher([]), b"image", "Human.jpg")
+
+    matcher = StubMatcher(["ref:1-Human.jpg-1"])
+    await cache.send(bot, matcher, b"image", "Human.jpg")
+    await cache.send(bot, matcher, b"image", "Human.jpg")
+    assert stub_uploader == [b"image", b"image"]
+    assert matcher.sent == ["ref:1-Human.jpg-2", "ref:1-Human.jpg-2"]
+
+
+@pytest.mark.asyncio
+async def test_fresh_upload_failure_raised(stub_uploader: List[bytes]):
+    from nonebot_plugin_bh3_elysian_realm.utils.upload_utils import UploadCache
+
+    cache = UploadCache(0)
+    with pytest.raises(ActionFailed):
+        await cache.send(StubBot("1"), StubMatcher(["ref:1-Human.jpg-1"]), b"image", "Human.jpg")
+    assert stub_uploader == [b"image"]
@@ -0,0 +1,137 @@
+import asyncio
+from pathlib import Path
+from typing import Set, List
+
+import pytest
+from pytest_mock import MockerFixture
+
+
+async def collect(watcher, batches: List[Set[Path]], count: int) -> None:
+    async def handler(changed: Set[Path]) -> None:
+        batches.append(changed)
+
+    watcher.start(handler)
+    for _ in range(200):
+        if len(batches) >= count:
+            break
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("force_polling", [True, False])
+async def test_watcher_coalesces_changes(tmp_path: Path, force_polling: bool):
+    from nonebot_plugin_bh3_elysian_realm.utils.watch_utils import ResourceWatcher
+
+    (tmp_path / "Void.jpg").write_bytes(b"void")
+    watcher = ResourceWatcher([tmp_path], debounce=0.3, poll_interval=0.05, force_polling=force_polling)
+    batches: List[Set[Path]] = []
+    task = asyncio.ensure_future(collect(watcher, batches, 1))
+    await asyncio.sleep(0.2)
+
+    # 连续的变化合并为一批，忽略临时文件
+    for i in range(3):
+        (tmp_path / "Human.jpg").write_bytes(b"human" * (i + 1))
+        (tmp_path / ".Human.jpg.tmp").write_bytes(b"tmp")
+        await asyncio.sleep(0.05)
+    (tmp_path / "Void.jpg").unlink()
+    await task
+    await watcher.stop()
+
+    assert batches == [{(tmp_path / "Human.jpg").resolve(), (tmp_path / "Void.jpg").resolve()}]
+
+
+def test_snapshot_diff(tmp_path: Path):
+    from nonebot_plugin_bh3_elysian_realm.utils.watch_utils import snapshot, diff_snapshot
+
+    (tmp_path / "Human.jpg").write_bytes(b"human")
+    (tmp_path / "sub").mkdir()
+    old = snapshot([tmp_path, tmp_path / "missing"])
+    assert list(old) == [tmp_path / "Human.jpg"]
+
+    (tmp_path / "Human.jpg").write_bytes(b"human2")
+    (tmp_path / "Void.jpg").write_bytes(b"void")
+    assert diff_snapshot(old, snapshot([tmp_path])) == {tmp_path / "Human.jpg", tmp_path / "Void.jpg"}
+
+
+@pytest.mark.asyncio
+async def test_handle_resource_changes(tmp_path: Path, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm import utils
+    from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource, SourceIndex
+
+    nickname_path = tmp_path / "nickname.json"
+    nickname_path.write_text('{"Human": ["人律"]}', encoding="utf-8")
+    image_path = tmp_path / "images"
+    image_path.mkdir()
+    mocker.patch.object(utils.plugin_config, "nickname_path", nickname_path)
+    source = ImageSource("https://example.com/repo", image_path, UpdatePoller(tmp_path / "state.json", 3600, 60))
+    mocker.patch.object(utils, "source_index", SourceIndex([source]))
+    after_update = mocker.patch.object(utils, "after_update")
+    mocker.patch.object(utils.nickname_index, "store", None)
+    mocker.patch.object(utils.nickname_index, "watched", True)
+    utils.nickname_index.invalidate()
+
+    assert (await utils.nickname_index.get(nickname_path)).find("人律") == "Human"
+    nickname_path.write_text('{"Human": ["人律", "爱律"]}', encoding="utf-8")
+    # 监视期间查询不再检查文件，由变化通知重新加载
+    assert (await utils.nickname_index.get(nickname_path)).find("爱律") is None
+
+    await utils.handle_resource_changes(
+        {nickname_path.resolve(), (image_path / "Human.jpg").resolve(), (image_path / "notes.txt").resolve()}
+    )
+    assert (await utils.nickname_index.get(nickname_path)).find("爱律") == "Human"
+    after_update.assert_called_once_with(image_path, ["Human.jpg"])
+    utils.nickname_index.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_handle_resource_changes_ignores_own_writes(tmp_path: Path, mocker: MockerFixture):
+    from nonebot_plugin_bh3_elysian_realm import utils
+    from nonebot_plugin_bh3_elysian_realm.utils.file_utils import JsonWriter
+    from nonebot_plugin_bh3_elysian_realm.utils.update_utils import UpdatePoller
+    from nonebot_plugin_bh3_elysian_realm.utils.source_utils import ImageSource, SourceIndex
+
+    nickname_path = tmp_path / "nickname.json"
+    nickname_path.write_text('{"Human": ["人律"]}', encoding="utf-8")
+    image_path = tmp_path / "images"
+    image_path.mkdir()
+    (image_path / "Human.jpg").write_bytes(b"human")
+    mocker.patch.object(utils.plugin_config, "nickname_path", nickname_path)
+    source = ImageSource("https://example.com/repo", image_path, UpdatePoller(tmp_path / "state.json", 3600, 60))
+    mocker.patch.object(utils, "source_index", SourceIndex([source]))
+    mocker.patch.object(utils, "handled_images", {})
+    mocker.patch.object(utils.nickname_index, "store", None)
+    mocker.patch.object(utils.nickname_index, "watched", True)
+    mocker.patch.object(utils.nickname_index, "writer", JsonWriter(60))
+    utils.nickname_index.invalidate()
+    await utils.nickname_index.get(nickname_path)
+
+    # 待写入的修改不被磁盘上的旧数据覆盖
+    utils.nickname_index.save(nickname_path, {"Human": ["人律", "爱律"]})
+    nickname_path.write_text('{"Human": []}', encoding="utf-8")
+    await utils.handle_resource_changes({nickname_path.resolve()})
+    assert (await utils.nickname_index.get(nickname_path)).find("爱律") == "Human"
+
+    # 写入完成后自己的写入不触发重新加载
+    await utils.nickname_index.flush()
+    index = await utils.nickname_index.get(nickname_path)
+    assert not await utils.nickname_index.reload(nickname_path)
+    await utils.handle_resource_changes({nickname_path.resolve()})
+    assert await utils.nickname_index.get(nickname_path) is index
+
+    # 拉取时已处理的图片不再重复处理，之后的修改照常处理
+    build = mocker.patch.object(utils, "build_variants")
+    build_pack = mocker.patch.object(utils, "build_image_pack")
+    rebuild = mocker.spy(utils.source_index, "rebuild")
+    await utils.after_update(image_path, ["README.md"])
+    build_pack.assert_not_called()
+    build.reset_mock()
+    await utils.after_update(image_path, ["Human.jpg"])
+    build_pack.assert_called_once_with(image_path)
+    rebuild.assert_not_called()
+    await utils.handle_resource_changes({(image_path / "Human.jpg").resolve()})
+    assert build.call_count == 1
+    (image_path / "Human.jpg").write_bytes(b"human2")
+    await utils.handle_resource_changes({(image_path / "Human.jpg").resolve()})
+    assert build.call_count == 2
+    utils.nickname_index.invalidate()